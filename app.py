@@ -3,10 +3,8 @@ import time
 import json
 import threading
 import queue
-import base64
 import logging
 import traceback
-import requests
 import asyncio
 import nest_asyncio
 import subprocess
@@ -14,11 +12,34 @@ import hashlib
 import re
 import random
 import math
+import zlib
+import heapq
+import contextvars
+import atexit
+import base64
+import weakref
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque, OrderedDict
 from datetime import datetime, timedelta
 from flask import Flask, render_template_string, jsonify, request
 from flask_socketio import SocketIO
+from PIL import Image
 from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeout
 import supabase_utils
+import supabase_utils_async
+from storage_cache import storage_cache
+import kv_state
+import text_normalize
+import products
+import message_extraction
+from message_extraction import (
+    selector_registry, smart_delay, wait_for_messages_to_load, extract_new_messages,
+    build_message_data_from_payload, content_hash_source
+)
+from ingest_spool import IngestSpool
+from channel_cursors import ChannelCursorStore
+from channel_leases import ChannelLeaseManager, SQLiteLeaseBackend, SupabaseLeaseBackend
 import stripe
 from dotenv import load_dotenv
 load_dotenv()
@@ -40,15 +61,69 @@ TELEGRAM_ADMIN_ID = os.getenv("TELEGRAM_ADMIN_ID")
 SUPABASE_BUCKET = "monitor-data"
 UPLOAD_FOLDER = "discord_josh"
 STORAGE_STATE_FILE = "storage_state.json"
-LAST_MESSAGE_ID_FILE = "last_message_ids.json"
+LAST_MESSAGE_ID_FILE = "last_message_ids.json"  # Legacy, imported once into the cursor store
+CHANNEL_CURSORS_DB = "channel_cursors.db"
+CHANNEL_CURSORS_FILE = "channel_cursors.json"
 CHANNEL_METRICS_FILE = "channel_metrics.json"
+INGEST_SPOOL_FILE = "ingest_spool.db"
 DATA_DIR = "data"
 
+# --- SCALE-OUT: set a worker id to shard channels across archivers via leases ---
+ARCHIVER_WORKER_ID = os.getenv("ARCHIVER_WORKER_ID", "").strip()
+LEASE_BACKEND = os.getenv("LEASE_BACKEND", "supabase").lower()  # supabase | sqlite (one host)
+CHANNEL_LEASES_DB = os.getenv("CHANNEL_LEASES_DB", os.path.join(DATA_DIR, "channel_leases.db"))
+LEASE_TTL = float(os.getenv("LEASE_TTL", "600"))
+# Each worker keeps its own session/cursors/metrics in Storage; a worker without its own
+# copy yet starts from the shared (pre-sharding) one and saves to its folder from then on
+WORKER_UPLOAD_FOLDER = f"{UPLOAD_FOLDER}/{ARCHIVER_WORKER_ID}" if ARCHIVER_WORKER_ID else UPLOAD_FOLDER
+
+def worker_remote_paths(name):
+    """Storage paths to restore a worker file from, in order: the worker's own, then the shared one"""
+    paths = [f"{WORKER_UPLOAD_FOLDER}/{name}"]
+    if WORKER_UPLOAD_FOLDER != UPLOAD_FOLDER:
+        paths.append(f"{UPLOAD_FOLDER}/{name}")
+    return paths
+
+def download_worker_file(local_path, name):
+    for remote_path in worker_remote_paths(name):
+        data = supabase_utils.download_file(local_path, remote_path, SUPABASE_BUCKET)
+        if data:
+            if remote_path != f"{WORKER_UPLOAD_FOLDER}/{name}":
+                log(f"ℹ️ No {name} for worker '{ARCHIVER_WORKER_ID}' yet, starting from the shared copy")
+            return data
+    return None
+
 HEADLESS_MODE = os.getenv("HEADLESS", "True").lower() == "true"
 DEBUG_ENV = os.getenv("DEBUG", "").lower()
 DEBUG_MODE = DEBUG_ENV in ("true", "1", "yes", "on")
+# Opt-in: build rows from Discord's own REST/gateway JSON instead of scraping the DOM
+NETWORK_CAPTURE_MODE = os.getenv("NETWORK_CAPTURE", "").lower() in ("true", "1", "yes", "on")
+# Opt-in: resource types the archiver browser never downloads (only the src URLs are archived)
+BLOCKED_RESOURCE_TYPES = {
+    t.strip() for t in os.getenv("BLOCK_RESOURCES", "").lower().split(",")
+    if t.strip() and t.strip() not in ("none", "off", "false")
+}
+# Opt-in: keep a content-addressed copy (+ dimensions) of each message's main embed image
+MEDIA_CAPTURE_MODE = os.getenv("MEDIA_CAPTURE", "").lower() in ("true", "1", "yes", "on")
 os.makedirs(DATA_DIR, exist_ok=True)
 
+def derive_product_rows(rows):
+    """Ingest stage: products table rows for a spooled message batch (region/store from cm)"""
+    return products.derive_rows(rows, products.build_channel_map(cm.channels))
+
+# Scraped rows are spooled to disk and flushed to Supabase in the background,
+# followed by the product records derived from them
+message_spool = IngestSpool(os.path.join(DATA_DIR, INGEST_SPOOL_FILE), derive_fn=derive_product_rows)
+# Final drain when the process exits (shutdown or a worker recycle by the process manager)
+atexit.register(message_spool.stop)
+
+lease_manager = None
+if ARCHIVER_WORKER_ID:
+    lease_manager = ChannelLeaseManager(
+        SQLiteLeaseBackend(CHANNEL_LEASES_DB) if LEASE_BACKEND == "sqlite" else SupabaseLeaseBackend(),
+        ARCHIVER_WORKER_ID, LEASE_TTL
+    )
+
 # --- EXTREME RANDOMIZATION SETTINGS ---
 BASE_POLL_INTERVAL = 60       # Base seconds between checks
 POLL_JITTER_MIN = 30          # Min random addition
@@ -74,8 +149,49 @@ LONG_SLEEP_MIN = 180          # 3 min sleep
 LONG_SLEEP_MAX = 1200         # 20 min sleep
 LONG_SLEEP_CHANCE = 0.05      # 5% chance after batch
 
+# --- MULTI-TAB SCANNING ---
+TAB_POOL_SIZE = max(1, int(os.getenv("ARCHIVER_TABS", "1")))                          # Pages in the shared context
+SCAN_CONCURRENCY = max(1, int(os.getenv("ARCHIVER_MAX_CONCURRENCY", str(TAB_POOL_SIZE))))  # Global cap on parallel scans
+
+# --- PREDICTIVE SCHEDULER ---
+SCHEDULER_MODE = os.getenv("SCHEDULER_MODE", "weighted").lower()  # "weighted" (sampling) or "predictive"
+RATE_EWMA_ALPHA = 0.3                 # Weight of the newest observed arrival rate
+PREDICT_THRESHOLD = float(os.getenv("PREDICT_THRESHOLD", "1.0"))  # Expected unseen msgs that triggers a revisit
+VISIT_BUDGET_PER_HOUR = int(os.getenv("VISIT_BUDGET_PER_HOUR", "120"))  # Global cap on channel visits
+MAX_CHANNEL_STALENESS = 6 * 3600      # Revisit after 6h even if the channel looks dead
+
+# --- GAP FILL ---
+GAP_FILL_MAX_STEPS = int(os.getenv("GAP_FILL_MAX_STEPS", "8"))  # Max scroll-back steps per channel visit
+GAP_FILL_MAX_RETRIES = int(os.getenv("GAP_FILL_MAX_RETRIES", "3"))  # Visits an unclosed gap holds the HWM back
+MESSAGE_SCROLLER_SELECTOR = 'main[class*="chatContent"] [class*="scrollerBase"], [aria-label*="Messages"] [class*="scrollerBase"]'
+
+# --- LIVE PORTAL SCREENCAST ---
+SCREENCAST_MAX_FPS = 4                    # Upper bound on frames pushed to viewers
+SCREENCAST_TARGET_BYTES_PER_SEC = 250000  # Adapt quality/frame skipping around this egress
+SCREENCAST_QUALITY_MIN = 30
+SCREENCAST_QUALITY_MAX = 80
+SCREENCAST_ADAPT_WINDOW = 5               # Seconds between quality adjustments
+
+# --- MEMORY-AWARE RECYCLING (checked between channel batches) ---
+MAX_JS_HEAP_MB = float(os.getenv("MAX_JS_HEAP_MB", "350"))         # Per tab: recycle the page above this
+MAX_DOM_NODES = int(os.getenv("MAX_DOM_NODES", "150000"))          # Per tab: recycle the page above this
+MAX_BROWSER_USS_MB = float(os.getenv("MAX_BROWSER_USS_MB", "1200")) # Whole process tree (private memory): recycle the context
+
+# --- LOG RING ---
+LOG_RING_SIZE = 500          # Structured log entries kept in memory
+LOG_EMIT_INTERVAL = 0.5      # Seconds between batched Socket.IO log emits
+LOG_EMIT_BUFFER = 1000       # Lines waiting for the next emit before the oldest are dropped
+LOG_EMIT_MAX_BATCH = 200
+
+# --- PERSISTENT PROFILE (warm restarts) ---
+PERSISTENT_PROFILE_MODE = os.getenv("PERSISTENT_PROFILE", "").lower() in ("true", "1", "yes", "on")
+BROWSER_PROFILE_DIR = os.path.join(DATA_DIR, "browser_profile")
+PROFILE_FINGERPRINT_FILE = "archiver_fingerprint.json"
+
 ERROR_THRESHOLD = 5
 ALERT_COOLDOWN = 1800
+ALERT_QUEUE_SIZE = 200             # Pending alerts before new ones are dropped
+ALERT_DIGEST_CHECK_INTERVAL = 30   # Seconds between checks for expired digest cooldowns
 
 # --- Flask Setup ---
 app = Flask(__name__)
@@ -87,7 +203,7 @@ socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
 # --- Global State ---
 archiver_state = {
     "status": "STOPPED",
-    "logs": [],
+    "logs": deque(maxlen=LOG_RING_SIZE),  # Structured entries: {seq, ts, level, channel, message}
     "error_counts": {},
     "last_alert_time": {},
     "last_success_time": {},
@@ -101,8 +217,15 @@ archiver_state = {
     "scrolls_performed": 0,
     "checks_since_idle": 0,  # Explicit counter for forced breaks
     "long_sleeps_taken": 0,
-    "channel_metrics": {}  # {url: {'msg_count': 0, 'last_check': 0}}
+    "channel_metrics": {},  # {url: {'msg_count': 0, 'last_check': 0, 'rate': msgs/h, 'hourly_rates': [24]}}
+    "visit_times": deque(),  # Visit timestamps within the last hour (visit budget)
+    "yield_log": deque(maxlen=200),  # Predicted vs. actual new messages per visit
+    "gap_fill": {"gaps_detected": 0, "gaps_closed": 0, "gaps_unclosed": 0, "messages_recovered": 0, "total_depth": 0, "max_depth": 0},
+    "memory": {"last_sample": None, "page_recycles": 0, "context_recycles": 0},
+    "startup": {"pending_since": None, "recent": deque(maxlen=10)},  # Launch -> first channel timings
+    "edits_detected": 0
 }
+open_gap_retries = {}  # {channel_url: visits an unclosed gap has held the HWM back}
 stop_event = threading.Event()
 input_queue = queue.Queue()
 archiver_thread = None
@@ -159,12 +282,19 @@ HTML_TEMPLATE = """
         var isDragging = false;
         
         socket.on('screenshot', data => img.src = 'data:image/jpeg;base64,' + data);
-        socket.on('log', data => {
-            var div = document.createElement('div');
-            div.innerHTML = `<span style="color:#666">[${new Date().toLocaleTimeString()}]</span> ${data.message}`;
-            logs.appendChild(div);
+        var levelColors = {debug: '#555', warning: '#ffaa00', error: '#ff3333'};
+        socket.on('log_batch', data => {
+            var frag = document.createDocumentFragment();
+            data.lines.forEach(line => {
+                var div = document.createElement('div');
+                var tag = line.channel ? `<span style="color:#0088ff">#${line.channel}</span> ` : '';
+                div.style.color = levelColors[line.level] || '';
+                div.innerHTML = `<span style="color:#666">[${new Date(line.ts * 1000).toLocaleTimeString()}]</span> ${tag}${line.message}`;
+                frag.appendChild(div);
+            });
+            logs.appendChild(frag);
+            while (logs.children.length > 200) logs.removeChild(logs.firstChild);
             logs.scrollTop = logs.scrollHeight;
-            if (logs.children.length > 100) logs.removeChild(logs.firstChild);
         });
         socket.on('status_update', data => {
             var el = document.getElementById('status-display');
@@ -245,26 +375,100 @@ HTML_TEMPLATE = """
 </html>
 """
 
-def log(message):
-    timestamp = datetime.now().strftime("%H:%M:%S")
-    print(f"[{timestamp}] {message}")
-    archiver_state["logs"].append(message)
-    if len(archiver_state["logs"]) > 100: archiver_state["logs"].pop(0)
-    socketio.emit('log', {'message': message})
+# Channel the current asyncio task is scanning (each tab worker runs in its own task)
+current_log_channel = contextvars.ContextVar("current_log_channel", default=None)
 
-def should_send_alert(alert_type):
-    last_alert = archiver_state["last_alert_time"].get(alert_type, 0)
-    return time.time() - last_alert > ALERT_COOLDOWN
+class LogRing:
+    """
+    Bounded structured log (archiver_state["logs"]) with batched Socket.IO delivery.
+    log() only appends to two deques; a background task emits coalesced 'log_batch'
+    events every LOG_EMIT_INTERVAL. If clients fall behind, the oldest pending lines
+    are dropped and counted instead of growing the buffer.
+    """
 
-def send_telegram_alert(subject, body, alert_type=None, image_bytes=None):
-    if not TELEGRAM_TOKEN or not TELEGRAM_ADMIN_ID:
-        log(f"📧 Alert: {subject} (Telegram not configured)")
-        return
-    if alert_type and not should_send_alert(alert_type):
-        return
-    
-    text = f"🎭 <b>STEALTH ALERT: {subject}</b>\n\n{body}"
+    def __init__(self, entries):
+        self.entries = entries
+        self.pending = deque(maxlen=LOG_EMIT_BUFFER)
+        self.seq = 0
+        self.dropped = 0
+        self.batches_sent = 0
+        self.lock = threading.Lock()
+        self.flusher_started = False
+
+    def append(self, message, level, channel):
+        with self.lock:
+            self.seq += 1
+            entry = {"seq": self.seq, "ts": time.time(), "level": level, "channel": channel, "message": message}
+            self.entries.append(entry)
+            if len(self.pending) == self.pending.maxlen:
+                self.dropped += 1
+            self.pending.append(entry)
+            if not self.flusher_started:
+                self.flusher_started = True
+                socketio.start_background_task(self._flush_loop)
+        return entry
+
+    def _flush_loop(self):
+        while True:
+            socketio.sleep(LOG_EMIT_INTERVAL)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[LOG] Emit failed: {e}")
+
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return
+            if not live_stream.viewers:
+                # Nobody watching - history is sent from the ring on connect
+                self.pending.clear()
+                return
+            batch = [self.pending.popleft() for _ in range(min(len(self.pending), LOG_EMIT_MAX_BATCH))]
+        socketio.emit('log_batch', {'lines': batch, 'dropped': self.dropped})
+        self.batches_sent += 1
+
+    def recent(self, limit=100, level=None, channel=None):
+        with self.lock:
+            entries = list(self.entries)
+        if level:
+            entries = [e for e in entries if e["level"] == level]
+        if channel:
+            entries = [e for e in entries if e["channel"] == channel]
+        return entries[-limit:]
+
+    def get_stats(self):
+        return {"entries": len(self.entries), "pending": len(self.pending), "dropped": self.dropped, "batches_sent": self.batches_sent}
+
+log_ring = LogRing(archiver_state["logs"])
+
+def infer_log_level(message):
+    if message.lstrip().startswith(("❌", "💥")):
+        return "error"
+    if message.lstrip().startswith("⚠️"):
+        return "warning"
+    return "info"
+
+def log(message, level=None, channel=None):
+    """
+    Structured log line. level: debug/info/warning/error (inferred from the emoji prefix if
+    omitted); channel defaults to the channel the calling task is scanning.
+    Debug lines reach the ring and the portal but are only printed in DEBUG mode.
+    """
+    level = level or infer_log_level(message)
+    channel = channel or current_log_channel.get()
+    log_ring.append(message, level, channel)
+    if level != "debug" or DEBUG_MODE:
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        print(f"[{timestamp}] {message}")
+
+# Extraction warnings land in the ring and the portal like everything else
+message_extraction.log = log
+
+def deliver_telegram_alert(subject, text, image_bytes=None):
+    """Blocking Telegram delivery - only ever called from the alert dispatcher thread"""
     admin_ids = [id.strip() for id in TELEGRAM_ADMIN_ID.split(',') if id.strip()]
+    delivered = False
     
     for admin_id in admin_ids:
         try:
@@ -273,45 +477,291 @@ def send_telegram_alert(subject, body, alert_type=None, image_bytes=None):
                 url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendPhoto"
                 files = {'photo': ('screenshot.jpg', image_bytes, 'image/jpeg')}
                 data = {'chat_id': admin_id, 'caption': text[:1024], 'parse_mode': 'HTML'}
-                response = requests.post(url, data=data, files=files, timeout=20)
+                response = supabase_utils.get_http_session().post(url, data=data, files=files, timeout=20)
             else:
                 # Send as text
                 url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-                response = requests.post(
+                response = supabase_utils.get_http_session().post(
                     url,
-                    json={"chat_id": admin_id, "text": text, "parse_mode": "HTML"},
+                    json={"chat_id": admin_id, "text": text[:4096], "parse_mode": "HTML"},
                     timeout=10
                 )
             
             if response.status_code == 200:
+                delivered = True
                 log(f"✅ Alert sent to {admin_id}: {subject}")
             else:
                 log(f"❌ Alert failed for {admin_id}: {response.status_code} {response.text}")
         except Exception as e:
             log(f"❌ Alert error for {admin_id}: {str(e)}")
+    return delivered
 
-    if alert_type:
-        archiver_state["last_alert_time"][alert_type] = time.time()
+class AlertDispatcher:
+    """
+    Background Telegram alerting so the scraper never waits on the Bot API:
+    - send_telegram_alert() only enqueues (bounded queue, overflow is counted and dropped)
+    - the first alert for a key is sent right away; repeats within ALERT_COOLDOWN are
+      coalesced and go out as one digest with counts once the cooldown expires
+    - due digests are combined into a single message per flush
+    - HTTP calls and screenshot uploads run on the dispatcher thread
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=ALERT_QUEUE_SIZE)
+        self.digests = {}  # {key: {subject, count, first_at, last_body}}
+        self.thread = None
+        self.lock = threading.Lock()
+        self.stats = {"queued": 0, "sent": 0, "failed": 0, "coalesced": 0, "digests_sent": 0, "dropped": 0}
+
+    def submit(self, key, subject, body, image_bytes=None):
+        self.ensure_started()
+        try:
+            self.queue.put_nowait((key, subject, body, image_bytes))
+            self.stats["queued"] += 1
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    def ensure_started(self):
+        with self.lock:
+            if self.thread and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self._run, daemon=True, name="AlertDispatcher")
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=ALERT_DIGEST_CHECK_INTERVAL)
+            except queue.Empty:
+                item = None
+            try:
+                if item:
+                    self._handle(*item)
+                self._flush_due_digests()
+            except Exception as e:
+                print(f"[ALERT] Dispatcher error: {e}")
+
+    def _handle(self, key, subject, body, image_bytes):
+        last_sent = archiver_state["last_alert_time"].get(key, 0)
+        if time.time() - last_sent > ALERT_COOLDOWN and key not in self.digests:
+            archiver_state["last_alert_time"][key] = time.time()
+            self._send(subject, f"🎭 <b>STEALTH ALERT: {subject}</b>\n\n{body}", image_bytes)
+            return
+        # Within cooldown: fold into this key's digest (screenshots are not repeated)
+        digest = self.digests.setdefault(key, {"subject": subject, "count": 0, "first_at": time.time(), "last_body": body})
+        digest["count"] += 1
+        digest["last_body"] = body
+        self.stats["coalesced"] += 1
+
+    def _flush_due_digests(self):
+        now = time.time()
+        due = [
+            key for key in self.digests
+            if now - archiver_state["last_alert_time"].get(key, 0) > ALERT_COOLDOWN
+        ]
+        if not due:
+            return
+        sections = []
+        for key in due:
+            digest = self.digests.pop(key)
+            archiver_state["last_alert_time"][key] = now
+            since = datetime.fromtimestamp(digest["first_at"]).strftime("%H:%M")
+            sections.append(f"<b>{digest['subject']}</b> ×{digest['count']} since {since}\nLast: {digest['last_body'][:500]}")
+        self.stats["digests_sent"] += 1
+        self._send(
+            f"Digest ({len(sections)} key(s))",
+            "🎭 <b>STEALTH ALERT DIGEST</b>\n\n" + "\n\n".join(sections)
+        )
+
+    def _send(self, subject, text, image_bytes=None):
+        if not TELEGRAM_TOKEN or not TELEGRAM_ADMIN_ID:
+            log(f"📧 Alert: {subject} (Telegram not configured)")
+            return
+        if deliver_telegram_alert(subject, text, image_bytes):
+            self.stats["sent"] += 1
+        else:
+            self.stats["failed"] += 1
+
+    def in_cooldown(self, key):
+        """True if an alert for key would only be coalesced (callers can skip screenshots)"""
+        return time.time() - archiver_state["last_alert_time"].get(key, 0) <= ALERT_COOLDOWN
+
+    def get_stats(self):
+        return {**self.stats, "pending": self.queue.qsize(), "open_digests": {k: d["count"] for k, d in list(self.digests.items())}}
+
+alert_dispatcher = AlertDispatcher()
+
+def send_telegram_alert(subject, body, alert_type=None, image_bytes=None):
+    """Queue an admin alert (never blocks). alert_type is the cooldown/digest key; defaults to the subject."""
+    alert_dispatcher.submit(alert_type or subject, subject, body, image_bytes)
 
 
 def set_status(status):
     archiver_state["status"] = status
     socketio.emit('status_update', {'status': status})
 
-def clean_text(text):
-    if not text: return ""
-    text = str(text).replace('\x00', '')
-    return ' '.join(text.split()).encode('ascii', 'ignore').decode('ascii')
+class LivePortalStreamer:
+    """
+    Streams the archiver page to the live portal via a CDP screencast, but only while
+    at least one Socket.IO client is connected. Unchanged frames are dropped, the frame
+    rate is capped and JPEG quality / frame skipping adapt to the measured egress.
+    """
 
-# --- ADVANCED RANDOMIZATION FUNCTIONS ---
-async def smart_delay(base_min, base_max, variance=0.3):
-    """Intelligent delay with Gaussian distribution for more natural randomness"""
-    mid = (base_min + base_max) / 2
-    sigma = (base_max - base_min) * variance
-    delay = random.gauss(mid, sigma)
-    delay = max(base_min, min(base_max, delay))
-    await asyncio.sleep(delay)
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.viewers = 0
+        self.page = None
+        self.loop = None
+        self.cdp = None
+        self.quality = 60
+        self.every_nth_frame = 1
+        self.last_frame_digest = None
+        self.last_frame = None
+        self.last_emit = 0
+        self.pending_frame = None
+        self.flush_scheduled = False
+        self.window_start = time.time()
+        self.window_bytes = 0
+        self.stats = {"frames_received": 0, "frames_sent": 0, "frames_unchanged": 0, "frames_throttled": 0, "bytes_sent": 0}
+
+    # --- Called from Socket.IO handler threads ---
+    def viewer_joined(self):
+        with self.lock:
+            self.viewers += 1
+        self.request_sync()
+        return self.last_frame
+
+    def viewer_left(self):
+        with self.lock:
+            self.viewers = max(0, self.viewers - 1)
+        self.request_sync()
+
+    def request_sync(self):
+        if self.loop and self.loop.is_running():
+            asyncio.run_coroutine_threadsafe(self.sync(), self.loop)
+
+    # --- Called from the archiver event loop ---
+    async def attach(self, page):
+        if self.cdp and page is not self.page:
+            await self._stop()
+        self.page = page
+        self.loop = asyncio.get_running_loop()
+        await self.sync()
+
+    async def sync(self):
+        """Start or stop the screencast to match whether anyone is watching"""
+        want = self.viewers > 0 and self.page is not None and not self.page.is_closed()
+        try:
+            if want and not self.cdp:
+                self.cdp = await self.page.context.new_cdp_session(self.page)
+                self.cdp.on("Page.screencastFrame", self._on_frame)
+                await self._start_screencast()
+                log(f"📺 Live view started ({self.viewers} viewer(s))")
+            elif not want and self.cdp:
+                await self._stop()
+                log("📺 Live view stopped (no viewers)")
+        except Exception as e:
+            log(f"⚠️ Screencast error: {str(e)[:80]}")
+            self.cdp = None
+
+    async def _start_screencast(self):
+        viewport = self.page.viewport_size or {'width': 1366, 'height': 768}
+        await self.cdp.send("Page.startScreencast", {
+            "format": "jpeg",
+            "quality": self.quality,
+            "maxWidth": viewport['width'],
+            "maxHeight": viewport['height'],
+            "everyNthFrame": self.every_nth_frame
+        })
+
+    async def _stop(self):
+        cdp, self.cdp = self.cdp, None
+        self.last_frame_digest = None
+        try:
+            await cdp.send("Page.stopScreencast")
+            await cdp.detach()
+        except: pass
+
+    async def _on_frame(self, params):
+        cdp = self.cdp
+        if cdp:
+            try:
+                await cdp.send("Page.screencastFrameAck", {"sessionId": params["sessionId"]})
+            except: pass
+        self.stats["frames_received"] += 1
 
+        data = params.get("data")
+        if not data:
+            return
+        delay = self.last_emit + 1 / SCREENCAST_MAX_FPS - time.time()
+        if delay > 0:
+            # Keep only the newest frame and send it when the interval allows
+            self.stats["frames_throttled"] += 1
+            self.pending_frame = data
+            if not self.flush_scheduled:
+                self.flush_scheduled = True
+                asyncio.get_running_loop().call_later(delay, self._flush_pending)
+            return
+        self._emit(data)
+
+    def _flush_pending(self):
+        self.flush_scheduled = False
+        data, self.pending_frame = self.pending_frame, None
+        if data and self.cdp:
+            self._emit(data)
+
+    def _emit(self, data):
+        digest = hashlib.md5(data.encode()).digest()
+        if digest == self.last_frame_digest:
+            self.stats["frames_unchanged"] += 1
+            return
+        self.last_frame_digest = digest
+        self.last_frame = data
+        self.last_emit = time.time()
+        socketio.emit('screenshot', data)
+        self.stats["frames_sent"] += 1
+        self.stats["bytes_sent"] += len(data)
+        self.window_bytes += len(data)
+        self._adapt()
+
+    def _adapt(self):
+        now = time.time()
+        elapsed = now - self.window_start
+        if elapsed < SCREENCAST_ADAPT_WINDOW:
+            return
+        rate = self.window_bytes / elapsed
+        self.window_start, self.window_bytes = now, 0
+
+        settings = (self.quality, self.every_nth_frame)
+        if rate > SCREENCAST_TARGET_BYTES_PER_SEC:
+            if self.quality > SCREENCAST_QUALITY_MIN:
+                self.quality = max(SCREENCAST_QUALITY_MIN, self.quality - 10)
+            else:
+                self.every_nth_frame = min(4, self.every_nth_frame + 1)
+        elif rate < SCREENCAST_TARGET_BYTES_PER_SEC / 3:
+            if self.every_nth_frame > 1:
+                self.every_nth_frame -= 1
+            else:
+                self.quality = min(SCREENCAST_QUALITY_MAX, self.quality + 10)
+
+        if settings != (self.quality, self.every_nth_frame) and self.cdp:
+            asyncio.ensure_future(self._restart_screencast())
+
+    async def _restart_screencast(self):
+        try:
+            await self.cdp.send("Page.stopScreencast")
+            await self._start_screencast()
+        except: pass
+
+    def get_stats(self):
+        return {**self.stats, "viewers": self.viewers, "streaming": self.cdp is not None,
+                "quality": self.quality, "every_nth_frame": self.every_nth_frame}
+
+live_stream = LivePortalStreamer()
+
+clean_text = text_normalize.ascii_text
+
+# --- ADVANCED RANDOMIZATION FUNCTIONS ---
 async def random_typing_delay():
     """Simulate realistic typing delays (between keypresses)"""
     delay = random.gauss(0.15, 0.05)
@@ -426,17 +876,33 @@ async def simulate_reading_pattern(page):
     except:
         await smart_delay(READING_TIME_MIN, READING_TIME_MAX)
 
+# Set while the tabs may work; cleared for the length of an idle break (one per tab batch)
+idle_gate = contextvars.ContextVar("idle_gate", default=None)
+
+async def wait_out_idle_break():
+    """Checkpoint inside a scan: park this tab while another tab is on an idle break"""
+    gate = idle_gate.get()
+    if gate is not None and not gate.is_set():
+        await gate.wait()
+
 async def take_idle_break():
-    """Simulate user going AFK (away from keyboard)"""
+    """Simulate user going AFK (away from keyboard) - every tab parks at its next checkpoint"""
     archiver_state["idle_breaks_taken"] += 1
     idle_duration = random.randint(IDLE_BREAK_MIN, IDLE_BREAK_MAX)
     log(f"💤 Taking idle break ({idle_duration//60}m {idle_duration%60}s) - simulating AFK...")
+    gate = idle_gate.get()
+    if gate is not None:
+        gate.clear()
     
-    # Break it into chunks so we can still stop if needed
-    for _ in range(idle_duration):
-        if stop_event.is_set():
-            break
-        await asyncio.sleep(1)
+    try:
+        # Break it into chunks so we can still stop if needed
+        for _ in range(idle_duration):
+            if stop_event.is_set():
+                break
+            await asyncio.sleep(1)
+    finally:
+        if gate is not None:
+            gate.set()
     
     log(f"🔄 Returning from idle break")
 
@@ -456,6 +922,19 @@ async def take_long_sleep():
     set_status("RUNNING")
     log(f"⏰ Waking up from long sleep")
 
+SERVER_ICON_SELECTORS = [
+    '[data-list-item-id="guildsnav___{server_id}"]',
+    'a[href*="/channels/{server_id}"]',
+    'div[data-dnd-name] a[href*="/{server_id}"]',
+]
+CHANNEL_LINK_SELECTORS = [
+    'a[href$="/{channel_id}"]',
+    'a[href*="/{server_id}/{channel_id}"]',
+    '[data-list-item-id="channels___{channel_id}"]',
+    'li[id*="{channel_id}"] a',
+    'div[class*="containerDefault"] a[href*="/{channel_id}"]',
+]
+
 async def navigate_to_channel(page, channel_url):
     """
     Navigate to a channel by clicking (human-like) or fallback to direct URL.
@@ -481,20 +960,16 @@ async def navigate_to_channel(page, channel_url):
         if current_server != server_id:
             log(f"   🖱️ Server switch detected: {current_server} -> {server_id}")
             log(f"   🖱️ Switching to server...")
-            server_selectors = [
-                f'[data-list-item-id="guildsnav___{server_id}"]',
-                f'a[href*="/channels/{server_id}"]',
-                f'div[data-dnd-name] a[href*="/{server_id}"]',
-            ]
+            server_selectors = selector_registry.ordered("server_icon", SERVER_ICON_SELECTORS)
             server_clicked = False
             
             # FAR LEFT SCROLLER (Servers)
             server_scroller = page.locator('nav[aria-label*="Servers"], [class*="guilds"], [class*="listItem"]').first
             
             for attempt in range(4):  # Try finding and scrolling server list
-                for sel in server_selectors:
+                for template in server_selectors:
                     try:
-                        server_icon = page.locator(sel).first
+                        server_icon = page.locator(template.format(server_id=server_id)).first
                         if await server_icon.count() > 0:
                             # Ensure it's in view
                             await server_icon.scroll_into_view_if_needed(timeout=2000)
@@ -505,6 +980,7 @@ async def navigate_to_channel(page, channel_url):
                                 await asyncio.sleep(random.uniform(0.2, 0.5))
                                 await server_icon.click()
                                 log(f"   ✅ Server icon clicked")
+                                selector_registry.record("server_icon", template)
                                 await asyncio.sleep(random.uniform(2.0, 4.0)) # Wait longer for server switch
                                 server_clicked = True
                                 break
@@ -521,6 +997,7 @@ async def navigate_to_channel(page, channel_url):
                 except: break
             
             if not server_clicked:
+                selector_registry.record("server_icon", None)
                 log(f"   ⚠️ Server icon not found after scrolling, forcing URL")
                 await save_sidebar_html(page, f"server_sidebar_{server_id}")
                 await page.goto(f"https://discord.com/channels/{server_id}", timeout=20000)
@@ -562,13 +1039,8 @@ async def navigate_to_channel(page, channel_url):
         
         # --- STEP 3: Click Channel in Sidebar ---
         log(f"   🖱️ Looking for channel in sidebar...")
-        channel_selectors = [
-            f'a[href$="/{channel_id}"]',
-            f'a[href*="/{server_id}/{channel_id}"]',
-            f'[data-list-item-id="channels___{channel_id}"]',
-            f'li[id*="{channel_id}"] a',
-            f'div[class*="containerDefault"] a[href*="/{channel_id}"]',
-        ]
+        channel_templates = selector_registry.ordered("channel_link", CHANNEL_LINK_SELECTORS)
+        channel_selectors = [t.format(server_id=server_id, channel_id=channel_id) for t in channel_templates]
         
         clicked = False
         # Target the scroller specifically inside the Channels area (middle panel)
@@ -611,6 +1083,7 @@ async def navigate_to_channel(page, channel_url):
                             await asyncio.sleep(random.uniform(0.2, 0.4))
                             await channel_elem.click()
                             clicked = True
+                            selector_registry.record("channel_link", channel_templates[channel_selectors.index(selector)])
                             log(f"   ✅ Channel clicked via sidebar")
                             await asyncio.sleep(random.uniform(1.0, 2.0))
                             break
@@ -640,6 +1113,7 @@ async def navigate_to_channel(page, channel_url):
                         if await channel_elem.count() > 0:
                             await channel_elem.click()
                             clicked = True
+                            selector_registry.record("channel_link", channel_templates[channel_selectors.index(selector)])
                             log(f"   ✅ Channel clicked after scroll reset")
                             break
             except: pass
@@ -657,12 +1131,14 @@ async def navigate_to_channel(page, channel_url):
                     if await channel_elem.count() > 0:
                         await channel_elem.click()
                         clicked = True
+                        selector_registry.record("channel_link", channel_templates[channel_selectors.index(selector)])
                         log(f"   ✅ Channel clicked after hard refresh")
                         break
             except: pass
 
         # --- FINAL FALLBACK: Direct URL ---
         if not clicked:
+            selector_registry.record("channel_link", None)
             log(f"   ⚠️ Channel not clickable, saving sidebar for inspection...")
             await save_sidebar_html(page, f"channel_sidebar_{channel_id}")
             await page.goto(channel_url, timeout=30000)
@@ -672,7 +1148,7 @@ async def navigate_to_channel(page, channel_url):
         try:
             log(f"   👀 Focusing message area...")
             # Target the chat message area scroller
-            msg_scroller = page.locator('main[class*="chatContent"] [class*="scrollerBase"], [aria-label*="Messages"] [class*="scrollerBase"]').first
+            msg_scroller = page.locator(MESSAGE_SCROLLER_SELECTOR).first
             if await msg_scroller.count() > 0:
                 await msg_scroller.hover()
                 await asyncio.sleep(random.uniform(0.5, 1.0))
@@ -810,13 +1286,13 @@ def save_channel_metrics():
     """Save metrics to local JSON and upload to Supabase"""
     try:
         local_path = os.path.join(DATA_DIR, CHANNEL_METRICS_FILE)
-        remote_path = f"{UPLOAD_FOLDER}/{CHANNEL_METRICS_FILE}"
+        remote_path = f"{WORKER_UPLOAD_FOLDER}/{CHANNEL_METRICS_FILE}"
         
         with open(local_path, 'w') as f:
             json.dump(archiver_state["channel_metrics"], f)
             
         # Upload in background to not block
-        threading.Thread(target=supabase_utils.upload_file, args=(local_path, SUPABASE_BUCKET, remote_path)).start()
+        supabase_utils_async.spawn(supabase_utils_async.upload_file(local_path, SUPABASE_BUCKET, remote_path))
         log("💾 Saved channel metrics to Supabase")
     except Exception as e:
         log(f"⚠️ Failed to save metrics: {e}")
@@ -825,10 +1301,8 @@ def load_channel_metrics():
     """Load metrics from Supabase on startup"""
     try:
         local_path = os.path.join(DATA_DIR, CHANNEL_METRICS_FILE)
-        remote_path = f"{UPLOAD_FOLDER}/{CHANNEL_METRICS_FILE}"
-        
         log("🔄 Downloading channel metrics from Supabase...")
-        data = supabase_utils.download_file(local_path, remote_path, SUPABASE_BUCKET)
+        data = download_worker_file(local_path, CHANNEL_METRICS_FILE)
         
         if data and os.path.exists(local_path):
             with open(local_path, 'r') as f:
@@ -839,6 +1313,44 @@ def load_channel_metrics():
     except Exception as e:
         log(f"⚠️ Failed to load metrics: {e}")
 
+def load_channel_cursors():
+    """
+    Open the local cursor store. A fresh container restores it from the Supabase
+    mirror, falling back to a one-time import of the legacy last_message_ids.json.
+    """
+    cursors = ChannelCursorStore(os.path.join(DATA_DIR, CHANNEL_CURSORS_DB))
+    if not cursors.is_empty():
+        log(f"✅ Loaded cursors for {cursors.get_stats()['channels']} channels")
+        return cursors
+
+    try:
+        local_path = os.path.join(DATA_DIR, CHANNEL_CURSORS_FILE)
+        data = download_worker_file(local_path, CHANNEL_CURSORS_FILE)
+        if data:
+            log(f"✅ Restored cursors for {cursors.load_snapshot(json.loads(data))} channels from Supabase")
+            return cursors
+    except Exception as e:
+        log(f"⚠️ Failed to restore cursors: {e}")
+
+    legacy_path = os.path.join(DATA_DIR, LAST_MESSAGE_ID_FILE)
+    if os.path.exists(legacy_path):
+        try:
+            with open(legacy_path, 'r') as f:
+                log(f"✅ Imported {cursors.load_snapshot(json.load(f))} channels from {LAST_MESSAGE_ID_FILE}")
+        except Exception as e:
+            log(f"⚠️ Failed to import {LAST_MESSAGE_ID_FILE}: {e}")
+    return cursors
+
+def save_channel_cursors(cursors):
+    """Mirror the cursor snapshot to Supabase Storage (background upload)"""
+    try:
+        local_path = cursors.write_snapshot(os.path.join(DATA_DIR, CHANNEL_CURSORS_FILE))
+        remote_path = f"{WORKER_UPLOAD_FOLDER}/{CHANNEL_CURSORS_FILE}"
+        supabase_utils_async.spawn(supabase_utils_async.upload_file(local_path, SUPABASE_BUCKET, remote_path))
+        log("💾 Mirrored channel cursors to Supabase")
+    except Exception as e:
+        log(f"⚠️ Failed to mirror cursors: {e}")
+
 def get_small_batch_channels(available_channels, batch_size=None):
     """
     Select channels using Weighted Reservoir Sampling + 1 Exploration Slot.
@@ -921,6 +1433,124 @@ def get_small_batch_channels(available_channels, batch_size=None):
         
     return selected_channels
 
+def get_channel_rate(metrics, hour=None):
+    """Estimated arrival rate (msgs/hour) for a channel, preferring the time-of-day bucket"""
+    if hour is None:
+        hour = datetime.utcnow().hour
+    hourly = metrics.get('hourly_rates') or []
+    if len(hourly) == 24 and hourly[hour] is not None:
+        return hourly[hour]
+    return metrics.get('rate')
+
+def predict_unseen_messages(metrics, now=None):
+    """Expected number of messages posted since the last visit (inf = never visited/no estimate)"""
+    now = now or time.time()
+    last_check = metrics.get('last_check', 0)
+    rate = get_channel_rate(metrics, datetime.utcfromtimestamp(now).hour)
+    if not last_check or rate is None:
+        return float('inf')
+    return rate * max(0.0, now - last_check) / 3600
+
+def record_channel_visit(channel_url, new_messages):
+    """Update msg_count/last_check and the decaying arrival-rate estimate after a visit"""
+    now = time.time()
+    metrics = archiver_state["channel_metrics"].setdefault(channel_url, {'msg_count': 0})
+    predicted = predict_unseen_messages(metrics, now)
+    last_check = metrics.get('last_check', 0)
+
+    if last_check and now > last_check:
+        observed = new_messages / ((now - last_check) / 3600)
+        # Attribute the interval to the hour bucket at its midpoint
+        hour = datetime.utcfromtimestamp((now + last_check) / 2).hour
+        hourly = metrics.get('hourly_rates')
+        if not hourly or len(hourly) != 24:
+            hourly = [None] * 24
+        hourly[hour] = observed if hourly[hour] is None else (1 - RATE_EWMA_ALPHA) * hourly[hour] + RATE_EWMA_ALPHA * observed
+        metrics['hourly_rates'] = hourly
+        metrics['rate'] = observed if metrics.get('rate') is None else (1 - RATE_EWMA_ALPHA) * metrics['rate'] + RATE_EWMA_ALPHA * observed
+
+    metrics['msg_count'] = metrics.get('msg_count', 0) + new_messages
+    metrics['last_check'] = now
+    metrics['visits'] = metrics.get('visits', 0) + 1
+
+    if predicted != float('inf'):
+        metrics['predicted_yield'] = metrics.get('predicted_yield', 0) + predicted
+        metrics['actual_yield'] = metrics.get('actual_yield', 0) + new_messages
+        archiver_state["yield_log"].append({
+            "channel": channel_url.split('/')[-1],
+            "predicted": round(predicted, 2),
+            "actual": new_messages,
+            "at": datetime.utcnow().isoformat()
+        })
+
+def get_visit_budget_remaining():
+    visit_times = archiver_state["visit_times"]
+    cutoff = time.time() - 3600
+    while visit_times and visit_times[0] < cutoff:
+        visit_times.popleft()
+    return max(0, VISIT_BUDGET_PER_HOUR - len(visit_times))
+
+def get_predictive_batch_channels(available_channels, batch_size=None):
+    """
+    Pick the channels most likely to have unseen messages.
+    A channel is due once its expected unseen count crosses PREDICT_THRESHOLD (or it has
+    not been visited for MAX_CHANNEL_STALENESS); due channels are served from a max-heap
+    on expected yield, limited by the hourly visit budget.
+    """
+    if batch_size is None:
+        batch_size = random.randint(3, 5)
+    batch_size = min(batch_size, get_visit_budget_remaining())
+    if batch_size <= 0:
+        log(f"⏸️ Visit budget exhausted ({VISIT_BUDGET_PER_HOUR}/h), skipping batch")
+        return []
+
+    now = time.time()
+    heap = []
+    for url in available_channels:
+        metrics = archiver_state["channel_metrics"].setdefault(url, {'msg_count': 0, 'last_check': 0})
+        expected = predict_unseen_messages(metrics, now)
+        stale = now - metrics.get('last_check', 0) > MAX_CHANNEL_STALENESS
+        if expected >= PREDICT_THRESHOLD or stale:
+            # Stale channels rank by age so they are not starved by hot ones forever
+            priority = expected if expected >= PREDICT_THRESHOLD else PREDICT_THRESHOLD
+            heapq.heappush(heap, (-priority, -(now - metrics.get('last_check', 0)), url))
+
+    selected_channels = []
+    while heap and len(selected_channels) < batch_size:
+        _, _, url = heapq.heappop(heap)
+        selected_channels.append(url)
+
+    for url in selected_channels:
+        archiver_state["visit_times"].append(now)
+
+    log(f"🔮 Predicted Batch ({len(selected_channels)}/{len(available_channels)} due):")
+    for url in selected_channels:
+        expected = predict_unseen_messages(archiver_state["channel_metrics"][url], now)
+        shown = "new" if expected == float('inf') else f"{expected:.1f}"
+        log(f"   - {url.split('/')[-1]} (Expected: {shown})")
+    return selected_channels
+
+def get_scheduler_stats():
+    """Predicted vs. actual yield per visit, for the dashboard"""
+    log_entries = list(archiver_state["yield_log"])
+    predicted = sum(e["predicted"] for e in log_entries)
+    actual = sum(e["actual"] for e in log_entries)
+    return {
+        "mode": SCHEDULER_MODE,
+        "visit_budget_per_hour": VISIT_BUDGET_PER_HOUR,
+        "visit_budget_remaining": get_visit_budget_remaining(),
+        "recent_visits": len(log_entries),
+        "predicted_total": round(predicted, 2),
+        "actual_total": actual,
+        "mean_abs_error": round(sum(abs(e["predicted"] - e["actual"]) for e in log_entries) / len(log_entries), 2) if log_entries else None,
+        "recent": log_entries[-20:]
+    }
+
+def pick_channel_batch(available_channels, batch_size=None):
+    if SCHEDULER_MODE == "predictive":
+        return get_predictive_batch_channels(available_channels, batch_size)
+    return get_small_batch_channels(available_channels, batch_size)
+
 def get_weighted_channel_order(available_channels):
     # Legacy wrapper if needed, but we use get_small_batch_channels now
     return get_small_batch_channels(available_channels)
@@ -934,9 +1564,10 @@ def get_next_check_interval():
                min(BASE_POLL_INTERVAL + POLL_JITTER_MAX, interval))
 
 async def save_message_html_for_inspection(message_element, message_id):
-    """Save raw HTML for debugging"""
+    """Save raw HTML for debugging (also a fixture for bench_extraction.py)"""
     try:
-        html = await message_element.inner_html()
+        # outer HTML keeps the <li id="chat-messages-..."> wrapper the selectors rely on
+        html = await message_element.evaluate("el => el.outerHTML")
         filename = f"data/message_inspection_{message_id}.html"
         os.makedirs("data", exist_ok=True)
         with open(filename, 'w', encoding='utf-8') as f:
@@ -949,14 +1580,36 @@ async def save_message_html_for_inspection(message_element, message_id):
         log(f"   ⚠️ HTML save error: {e}")
         return None
 
+async def save_channel_html_for_inspection(page, channel_url):
+    """Save the rendered channel DOM without scripts (channel fixture for bench_extraction.py)"""
+    try:
+        html = await page.evaluate("""() => {
+            const doc = document.documentElement.cloneNode(true);
+            doc.querySelectorAll('script, link[rel="preload"], link[rel="prefetch"]').forEach(el => el.remove());
+            return doc.outerHTML;
+        }""")
+        channel_id = channel_url.split('/')[-1]
+        filename = f"data/channel_inspection_{channel_id}_{int(time.time())}.html"
+        os.makedirs("data", exist_ok=True)
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(f"<!-- Channel URL: {channel_url} -->\n")
+            f.write(f"<!-- Timestamp: {datetime.utcnow().isoformat()} -->\n")
+            f.write(html)
+        log(f"   💾 Channel HTML saved: {filename}")
+        return filename
+    except Exception as e:
+        log(f"   ⚠️ Channel HTML save error: {e}")
+        return None
+
 def track_channel_error(channel_url, error_msg, image_bytes=None):
     archiver_state["error_counts"][channel_url] = archiver_state["error_counts"].get(channel_url, 0) + 1
     
-    # Always notify admin of errors as requested, but keep the alert_type to allow internal cooldown if needed
+    # First failure alerts immediately; repeats are folded into a per-channel digest
     alert_type = f"channel_error_{channel_url}"
     send_telegram_alert(
         f"Channel Error: {channel_url.split('/')[-1]}", 
         f"Channel: {channel_url}\nError: {error_msg}\nTotal Failures: {archiver_state['error_counts'][channel_url]}", 
+        alert_type=alert_type,
         image_bytes=image_bytes
     )
 
@@ -965,22 +1618,6 @@ def track_channel_success(channel_url):
         del archiver_state["error_counts"][channel_url]
     archiver_state["last_success_time"][channel_url] = datetime.utcnow().isoformat()
 
-def generate_content_hash(content_dict):
-    content_str = json.dumps(content_dict, sort_keys=True)
-    return hashlib.md5(content_str.encode()).hexdigest()
-
-def extract_markdown_links(text):
-    if not text:
-        return []
-    pattern = r'\[([^\]]+)\]\(([^\)]+)\)'
-    links = []
-    for match in re.finditer(pattern, text):
-        link_text = match.group(1).strip()
-        link_url = match.group(2).strip()
-        if link_url.startswith('http'):
-            links.append({'text': link_text, 'url': link_url})
-    return links
-
 def ensure_browsers_installed():
     log("🔧 Checking Playwright browsers...")
     try:
@@ -989,219 +1626,968 @@ def ensure_browsers_installed():
     except Exception as e:
         log(f"⚠️ Browser install warning: {e}")
 
-async def extract_embed_data(message_element):
-    """Extract embed data from Discord message"""
-    embed_data = {
-        "title": None,
-        "description": None,
-        "fields": [],
-        "images": [],
-        "thumbnail": None,
-        "color": None,
-        "author": None,
-        "footer": None,
-        "timestamp": None,
-        "links": []
-    }
-    
-    try:
-        embed = message_element.locator('article[class*="embedFull"]').first
-        if await embed.count() == 0:
-            embed = message_element.locator('article[class*="embed"]').first
-        if await embed.count() == 0:
-            return None
-        
-        try:
-            color_style = await embed.get_attribute('style')
-            if color_style and 'border-left-color' in color_style:
-                embed_data["color"] = color_style
-        except: pass
-        
-        try:
-            author_elem = embed.locator('[class*="embedAuthor"] a, [class*="embedAuthor"] span, [class*="embedAuthorName"]').first
-            if await author_elem.count() > 0:
-                author_name = await author_elem.inner_text()
-                author_url = await author_elem.get_attribute('href')
-                embed_data["author"] = {"name": clean_text(author_name), "url": author_url}
-                if author_url and author_url not in [l.get("url") for l in embed_data["links"]]:
-                    embed_data["links"].append({"type": "author", "text": clean_text(author_name), "url": author_url})
-        except: pass
-        
+# --- NETWORK CAPTURE MODE ---
+DISCORD_MESSAGES_API_RE = re.compile(r'discord\.com/api/v\d+/channels/(\d+)/messages(?:\?|$)')
+ZLIB_SUFFIX = b'\x00\x00\xff\xff'
+CAPTURE_BUFFER_PER_CHANNEL = 200
+CAPTURE_MAX_CHANNELS = 100  # Buffers kept when no channel filter is set (oldest dropped first)
+
+class NetworkMessageCapture:
+    """
+    Collects message payloads the Discord web client already receives:
+    - REST: GET /api/v9/channels/{id}/messages (fired when a channel is opened)
+    - Gateway: MESSAGE_CREATE / MESSAGE_UPDATE dispatches (zlib-stream or plain JSON)
+    Payloads are buffered per channel until the archiver drains them. Only channels in
+    channel_ids (the ones being archived, set by the main loop) are buffered.
+    """
+
+    def __init__(self):
+        self.buffers = {}  # {channel_id: {msg_id: payload}}
+        self.channel_ids = None  # set of channel IDs to buffer; None = any (capped)
+        self.stats = {"rest_responses": 0, "gateway_messages": 0, "undecodable_frames": 0,
+                      "ignored_channels": 0, "stream_resets": 0}
+
+    def watch(self, channel_urls):
+        """Buffer only these channels from now on and drop buffers of any others"""
+        self.channel_ids = {url.rstrip('/').split('/')[-1] for url in channel_urls}
+        for channel_id in [c for c in self.buffers if c not in self.channel_ids]:
+            del self.buffers[channel_id]
+
+    def attach(self, page):
+        page.on("response", self._on_response)
+        page.on("websocket", self._on_websocket)
+
+    def _store(self, payload):
         try:
-            title_elem = embed.locator('[class*="embedTitle"] a, [class*="embedTitle"]').first
-            if await title_elem.count() > 0:
-                title_text = await title_elem.inner_text()
-                title_url = await title_elem.get_attribute('href')
-                embed_data["title"] = clean_text(title_text)
-                if title_url and title_url not in [l.get("url") for l in embed_data["links"]]:
-                    embed_data["links"].append({"type": "title", "text": embed_data["title"], "url": title_url})
-        except: pass
-        
+            channel_id = str(payload["channel_id"])
+            msg_id = str(payload["id"])
+        except (KeyError, TypeError):
+            return
+        if self.channel_ids is not None and channel_id not in self.channel_ids:
+            self.stats["ignored_channels"] += 1
+            return
+        buf = self.buffers.get(channel_id)
+        if buf is None:
+            if len(self.buffers) >= CAPTURE_MAX_CHANNELS:
+                del self.buffers[next(iter(self.buffers))]
+            buf = self.buffers[channel_id] = {}
+        if msg_id in buf:
+            # MESSAGE_UPDATE payloads can be partial; keep what we already know
+            buf[msg_id] = {**buf[msg_id], **payload}
+        else:
+            buf[msg_id] = payload
+        if len(buf) > CAPTURE_BUFFER_PER_CHANNEL:
+            for old_id in sorted(buf, key=int)[:len(buf) - CAPTURE_BUFFER_PER_CHANNEL]:
+                del buf[old_id]
+
+    async def _on_response(self, response):
         try:
-            field_containers = embed.locator('[class*="embedField"]')
-            field_count = await field_containers.count()
-            
-            for i in range(field_count):
-                field = field_containers.nth(i)
-                field_name_elem = field.locator('[class*="embedFieldName"]').first
-                field_name = ""
-                if await field_name_elem.count() > 0:
-                    field_name = clean_text(await field_name_elem.inner_text())
-                
-                field_value = ""
-                field_value_elem = field.locator('[class*="embedFieldValue"]').first
-                if await field_value_elem.count() > 0:
-                    # Try to preserve links as Markdown [Text](URL)
-                    # We execute JS to replace <a> tags with markdown text
-                    try:
-                        field_value = await field_value_elem.evaluate("""element => {
-                            let clone = element.cloneNode(true);
-                            
-                            // Replace <s> and <strike> with ~~text~~
-                            clone.querySelectorAll('s, strike').forEach(s => {
-                                s.textContent = `~~${s.textContent}~~`;
-                            });
-                            
-                            // Check for elements with line-through style
-                            clone.querySelectorAll('*').forEach(el => {
-                                let style = window.getComputedStyle(el);
-                                if (style.textDecoration && style.textDecoration.includes('line-through') && !el.textContent.includes('~~')) {
-                                    el.textContent = `~~${el.textContent}~~`;
-                                }
-                            });
-
-                            // Replace <a> tags with markdown [Text](URL)
-                            clone.querySelectorAll('a').forEach(a => {
-                                if (a.href) {
-                                    a.textContent = `[${a.textContent}](${a.href})`;
-                                }
-                            });
-                            return clone.innerText;
-                        }""")
-                    except:
-                        field_value = await field_value_elem.inner_text()
-                    
-                    field_value = clean_text(field_value)
-                
-                if field_name or field_value:
-                    embed_data["fields"].append({"name": field_name, "value": field_value})
-                    
-                    # (Optional: we still keep the separate links list for fallback/buttons if needed)
+            if response.request.method != "GET" or response.status != 200:
+                return
+            if not DISCORD_MESSAGES_API_RE.search(response.url):
+                return
+            payloads = await response.json()
+            if isinstance(payloads, list):
+                self.stats["rest_responses"] += 1
+                for payload in payloads:
+                    self._store(payload)
+        except Exception:
+            pass
+
+    def _on_websocket(self, ws):
+        if "gateway" not in ws.url:
+            return
+        inflator = zlib.decompressobj()
+        pending = bytearray()
+
+        def on_frame(frame):
+            nonlocal pending, inflator
+            try:
+                if isinstance(frame, (bytes, bytearray)):
+                    pending.extend(frame)
+                    if not pending.endswith(ZLIB_SUFFIX):
+                        return
                     try:
-                        value_links = field_value_elem.locator('a[href]')
-                        link_count = await value_links.count()
-                        for j in range(link_count):
-                            link_elem = value_links.nth(j)
-                            href = await link_elem.get_attribute('href')
-                            text = await link_elem.inner_text()
-                            if href and href not in [l.get("url") for l in embed_data["links"]]:
-                                embed_data["links"].append({
-                                    "field": field_name,
-                                    "text": clean_text(text),
-                                    "url": href
-                                })
-                    except: pass
-        except: pass
-        
+                        text = inflator.decompress(bytes(pending)).decode("utf-8")
+                    finally:
+                        pending = bytearray()
+                else:
+                    text = frame
+                event = json.loads(text)
+            except zlib.error as e:
+                # The shared zlib context is corrupt now; start over so later frames decode
+                # (a fresh stream needs the gateway's next reconnect, the DOM covers the gap)
+                inflator = zlib.decompressobj()
+                self.stats["undecodable_frames"] += 1
+                self.stats["stream_resets"] += 1
+                log(f"⚠️ Gateway zlib stream error, resetting decompressor: {e}")
+                return
+            except Exception:
+                self.stats["undecodable_frames"] += 1
+                return
+            if event.get("op") == 0 and event.get("t") in ("MESSAGE_CREATE", "MESSAGE_UPDATE"):
+                self.stats["gateway_messages"] += 1
+                self._store(event.get("d") or {})
+
+        ws.on("framereceived", on_frame)
+
+    def drain(self, channel_id):
+        """Return buffered payloads for a channel (oldest first) and clear the buffer"""
+        buf = self.buffers.pop(str(channel_id), {})
+        return [buf[k] for k in sorted(buf, key=int)]
+
+async def detect_account_picker(page):
+    selectors = [
+        'button[class*="userButton"]',
+        '[class*="accountPicker"]',
+        '[class*="SelectAccount"]',
+        'div:has-text("Select Account")',
+        'div:has-text("Which account?")',
+    ]
+    for selector in selectors:
         try:
-            thumb_elem = embed.locator('img[class*="embedThumbnail"]').first
-            if await thumb_elem.count() == 0:
-                thumb_elem = embed.locator('[class*="embedThumbnail"] img').first
-            
-            if await thumb_elem.count() > 0:
-                thumb_src = await thumb_elem.get_attribute('src')
-                if thumb_src:
-                    embed_data["images"].append(thumb_src)
+            if await page.locator(selector).count() > 0:
+                return True
         except: pass
-        
+    return False
+
+async def scan_channel(page, channel_url, cursors, network_capture=None):
+    """Visit one channel on the given page, extract new messages and upload them.
+    All per-channel failures are handled here so one tab can never take down the others."""
+    # Tag every log line of this visit with the channel
+    token = current_log_channel.set(channel_url.split('/')[-1])
+    try:
+        await visit_channel(page, channel_url, cursors, network_capture)
+    finally:
+        current_log_channel.reset(token)
+
+async def visit_channel(page, channel_url, cursors, network_capture=None):
+    if lease_manager and not lease_manager.holds(channel_url):
+        log(f"   🔒 Lease on {channel_url.split('/')[-1]} moved to another worker, skipping")
+        return
+
+    # Persistent failure check
+    if archiver_state["error_counts"].get(channel_url, 0) > 2:
+        log(f"   🔄 Channel {channel_url.split('/')[-1]} has high error count. Hard refreshing...")
         try:
-            footer_elem = embed.locator('[class*="embedFooter"]').first
-            if await footer_elem.count() > 0:
-                embed_data["footer"] = clean_text(await footer_elem.inner_text())
+            await page.reload(timeout=30000)
+            await smart_delay(5, 10)
         except: pass
-        
-        return embed_data if any([embed_data["title"], embed_data["fields"], embed_data["links"]]) else None
+
+    archiver_state["total_checks"] += 1
+    log(f"📂 [{archiver_state['total_checks']}] {channel_url.split('/')[-1]}")
+
+    try:
+        await wait_out_idle_break()
+        # Always use click navigation (fallback to URL only if click fails)
+        await navigate_to_channel(page, channel_url)
+        await smart_delay(2, 5)
+
+        # Human behavior simulation
+        if random.random() < MOUSE_MOVEMENT_CHANCE:
+            await advanced_mouse_movement(page)
+
+        if random.random() < SCROLL_CHANCE:
+            await realistic_scroll_behavior(page)
+
+        # Random pause (thinking/reading)
+        await simulate_human_pause()
+        await wait_out_idle_break()
+
+        selector, messages = await wait_for_messages_to_load(page)
+        if messages:
+            record_first_channel_timing()
+        if not messages:
+            log("   ⚠️ No messages")
+            # Diagnostic info
+            page_title = await page.title()
+            page_url = page.url
+            err_screenshot = None
+            if not alert_dispatcher.in_cooldown(f"channel_error_{channel_url}"):
+                try:
+                    err_screenshot = await page.screenshot(quality=70, type='jpeg')
+                except: pass
+
+            track_channel_error(channel_url, f"No messages found.\nURL: {page_url}\nTitle: {page_title}", image_bytes=err_screenshot)
+            await smart_delay(CHANNEL_DELAY_MIN, CHANNEL_DELAY_MAX)
+            return
+
+        # Simulate reading
+        await simulate_reading_pattern(page)
+        await wait_out_idle_break()
+
+        batch = []
+        new_ids = []
+
+        high_water_mark = cursors.high_water_mark(channel_url)
+        extracted, oldest_seen, captured = [], None, 0
+        known = []  # Already-archived messages re-read for edit detection
+        if network_capture:
+            extracted, oldest_seen, captured = extract_captured_messages(network_capture, channel_url, cursors, known_out=known)
+            if captured:
+                log(f"   📡 Network capture: {captured} payload(s), {len(extracted)} new")
+
+        # DOM path: default mode, or nothing was captured for this channel
+        if not captured:
+            extracted, oldest_seen = await extract_new_messages(
+                messages, channel_url, cursors.recent_ids(channel_url),
+                high_water_mark=high_water_mark, known_out=known
+            )
+
+        # --- GAP DETECTION: everything between the HWM and the oldest message we saw is unseen ---
+        advance_hwm = True
+        if high_water_mark and oldest_seen and oldest_seen > high_water_mark:
+            archiver_state["gap_fill"]["gaps_detected"] += 1
+            log("   🕳️ Gap detected (oldest visible newer than last archived), scrolling back...")
+            recovered, depth, closed = await fill_message_gap(
+                page, messages, channel_url, cursors, high_water_mark,
+                [msg_id for _, msg_id, _ in extracted], network_capture
+            )
+            record_gap_fill(recovered, depth, closed)
+            log(f"   🧩 Gap fill: {len(recovered)} recovered in {depth} step(s) ({'closed' if closed else 'still open'})")
+            extracted = recovered + extracted
+            if closed:
+                open_gap_retries.pop(channel_url, None)
+            else:
+                # Keep the HWM below the gap so the next visit scrolls back again; give up
+                # after a few visits (history deleted or too deep to reach)
+                retries = open_gap_retries.get(channel_url, 0) + 1
+                advance_hwm = retries > GAP_FILL_MAX_RETRIES
+                if advance_hwm:
+                    # Messages seen while the gap was open are already known, so this visit
+                    # may have nothing new to record: move the HWM to the newest one seen
+                    seen_ids = [m for _, m, _ in extracted + known] + cursors.recent_ids(channel_url)
+                    newest = max((int(m) for m in seen_ids if str(m).isdigit()), default=None)
+                    if newest is not None:
+                        cursors.advance_hwm(channel_url, newest)
+                        open_gap_retries.pop(channel_url, None)
+                        log(f"   ⚠️ Gap still open after {GAP_FILL_MAX_RETRIES} retries, moved the cursor past it to {newest}")
+                else:
+                    open_gap_retries[channel_url] = retries
+        else:
+            open_gap_retries.pop(channel_url, None)
+
+        if DEBUG_MODE and extracted and extracted[0][0] is not None:
+            first_index, first_id, _ = extracted[0]
+            await save_message_html_for_inspection(messages.nth(first_index), first_id)
+            await save_channel_html_for_inspection(page, channel_url)
+
+        for _, msg_id, message_data in extracted:
+            if media_capture:
+                media_capture.attach_media(message_data)
+            batch.append(message_data)
+            new_ids.append(msg_id)
+
+            embed_data = message_data["raw_data"]["embed"]
+            if embed_data:
+                title = (embed_data.get('title') or 'No title')[:40]
+                log(f"   ✅ {title}...", "debug")
+                if embed_data.get('links'):
+                    log(f"      🔗 {len(embed_data['links'])} link(s)", "debug")
+            else:
+                log(f"   📝 {message_data['content'][:40]}...", "debug")
+
+        # Update Activity Metrics (+ arrival-rate estimate for the scheduler)
+        record_channel_visit(channel_url, len(batch))
+
+        if batch:
+            log(f"   ⬆️ {len(batch)} new message(s)")
+            message_spool.enqueue(batch)
+            cursors.record(channel_url, new_ids, advance_hwm=advance_hwm)
+            cursors.record_hashes(channel_url, [(msg_id, data["raw_data"]["content_hash"]) for msg_id, data in zip(new_ids, batch)])
+
+        edits = detect_message_edits(channel_url, cursors, known)
+        if edits:
+            log(f"   ✏️ {len(edits)} edited message(s), upserting")
+            message_spool.enqueue(edits, upsert=True)
+
+        track_channel_success(channel_url)
+        await smart_delay(CHANNEL_DELAY_MIN, CHANNEL_DELAY_MAX)
+
     except Exception as e:
-        log(f"   ⚠️ Embed error: {e}")
-        return None
+        import traceback
+        tb = traceback.format_exc()
+        log(f"   ⚠️ Exception in channel loop: {str(e)}")
+        # Diagnostic info
+        page_title = "Unknown"
+        page_url = channel_url
+        err_screenshot = None
+        try:
+            page_title = await page.title()
+            page_url = page.url
+            # Only capture when the alert would actually be sent
+            if not alert_dispatcher.in_cooldown(f"channel_error_{channel_url}"):
+                err_screenshot = await page.screenshot(quality=70, type='jpeg')
+        except: pass
+        track_channel_error(channel_url, f"{str(e)}\nURL: {page_url}\nTitle: {page_title}\n\nTraceback:\n{tb}", image_bytes=err_screenshot)
+        await smart_delay(4, 8)
+
+def detect_message_edits(channel_url, cursors, known):
+    """
+    Compare re-read archived messages with the content_hash index.
+    Returns the rows whose hash changed (with edit_count/edited_at set). Messages not in the
+    index yet, or last hashed from the other extraction path (DOM vs network), are only
+    (re)seeded - the two paths see different text for the same message.
+    """
+    edits, seeds = [], []
+    for _, msg_id, message_data in known:
+        content_hash = message_data["raw_data"]["content_hash"]
+        previous = cursors.content_hash(channel_url, msg_id)
+        if previous is None or content_hash_source(previous) != content_hash_source(content_hash):
+            seeds.append((msg_id, content_hash))
+        elif previous != content_hash:
+            edits.append((msg_id, message_data))
+    if seeds:
+        cursors.record_hashes(channel_url, seeds)
+    if not edits:
+        return []
+
+    counts = cursors.record_hashes(channel_url, [(msg_id, data["raw_data"]["content_hash"]) for msg_id, data in edits], edited=True)
+    edited_at = datetime.utcnow().isoformat()
+    for msg_id, message_data in edits:
+        message_data["raw_data"]["edit_count"] = counts[msg_id]
+        message_data["raw_data"]["edited_at"] = edited_at
+        if media_capture:
+            media_capture.attach_media(message_data)
+    archiver_state["edits_detected"] += len(edits)
+    return [message_data for _, message_data in edits]
+
+def extract_captured_messages(network_capture, channel_url, cursors, exclude=(), known_out=None):
+    """
+    Drain captured payloads for a channel.
+    Returns (new rows as (None, msg_id, message_data), oldest captured snowflake, payload count).
+    Already-archived payloads (e.g. MESSAGE_UPDATE) are appended to known_out if given.
+    """
+    captured = network_capture.drain(channel_url.split('/')[-1])
+    results = []
+    for payload in captured:
+        msg_id = str(payload["id"])
+        if msg_id in exclude:
+            continue
+        if cursors.is_seen(channel_url, msg_id):
+            if known_out is not None:
+                known_out.append((None, msg_id, build_message_data_from_payload(channel_url, payload)))
+            continue
+        results.append((None, msg_id, build_message_data_from_payload(channel_url, payload)))
+    numeric_ids = [int(payload["id"]) for payload in captured if str(payload["id"]).isdigit()]
+    return results, (min(numeric_ids) if numeric_ids else None), len(captured)
+
+async def fill_message_gap(page, messages, channel_url, cursors, high_water_mark, seen_ids, network_capture=None):
+    """
+    Scroll the message list back in bounded steps until a message at or below the
+    channel's high-water mark shows up (gap closed) or GAP_FILL_MAX_STEPS is reached.
+    Scrolling up also makes Discord fetch older history, which network capture picks up.
+    Returns (recovered rows, steps taken, closed).
+    """
+    scroller = page.locator(MESSAGE_SCROLLER_SELECTOR).first
+    if await scroller.count() == 0:
+        return [], 0, False
+
+    recovered = []
+    seen = set(seen_ids)
+    closed = False
+    steps = 0
+    for steps in range(1, GAP_FILL_MAX_STEPS + 1):
+        await wait_out_idle_break()
+        if stop_event.is_set():
+            break
+        position = await scroller.evaluate(
+            "el => { const top = el.scrollTop; el.scrollBy(0, -Math.round(el.clientHeight * 0.9)); return top; }"
+        )
+        await asyncio.sleep(random.uniform(1.0, 2.0))  # Let older history fetch and render
+
+        found, oldest, captured = [], None, 0
+        if network_capture:
+            found, oldest, captured = extract_captured_messages(network_capture, channel_url, cursors, seen)
+        if not captured:
+            found, oldest = await extract_new_messages(
+                messages, channel_url, list(seen) + cursors.recent_ids(channel_url),
+                limit=None, high_water_mark=high_water_mark
+            )
+
+        for _, msg_id, _ in found:
+            seen.add(msg_id)
+        recovered.extend(found)
+
+        if oldest is not None and oldest <= high_water_mark:
+            closed = True
+            break
+        if position == 0 and not found:
+            break  # Top of the history and nothing more loaded
 
-async def extract_message_author(message_element):
-    """Extract author info with robust fallbacks"""
     try:
-        # Priority 1: ID-based (Most specific, confirmed in inspection)
-        author_elem = message_element.locator('[id^="message-username-"]').first
+        await scroller.evaluate("el => el.scrollTo(0, el.scrollHeight)")
+    except: pass
+    return recovered, steps, closed
+
+def record_gap_fill(recovered, depth, closed):
+    stats = archiver_state["gap_fill"]
+    stats["gaps_closed" if closed else "gaps_unclosed"] += 1
+    stats["messages_recovered"] += len(recovered)
+    stats["total_depth"] += depth
+    stats["max_depth"] = max(stats["max_depth"], depth)
+
+async def maybe_take_idle_break():
+    """
+    Per-channel idle break check.
+    Logic: Random (10%) OR Forced after 15 channels without break
+    Duration is random (IDLE_BREAK_MIN to IDLE_BREAK_MAX) handled by take_idle_break
+    """
+    should_break = False
+    archiver_state["checks_since_idle"] += 1
+    
+    if archiver_state["checks_since_idle"] >= 15:
+        log("⚠️ Forced idle break (15 channels limit reached)")
+        should_break = True
+    elif random.random() < 0.10:
+        should_break = True
         
-        # Priority 2: Standard Class-based
-        if await author_elem.count() == 0:
-            author_elem = message_element.locator('span[class*="username"]').first
-            
-        # Priority 3: Header-based
-        if await author_elem.count() == 0:
-            author_elem = message_element.locator('h3 span').first
+    if should_break: 
+        await take_idle_break()
+        archiver_state["last_alert_time"]["last_idle_break"] = time.time()
+        archiver_state["checks_since_idle"] = 0 # Reset counter
 
-        if await author_elem.count() > 0:
-            # Get text from the first visible part (often the username span inside the wrapper)
-            author_name = await author_elem.inner_text()
+async def scan_channels_in_tabs(context, pages, channels_to_check, cursors, network_capture=None):
+    """
+    Spread a channel batch over a pool of tabs in the same BrowserContext.
+    Each tab pulls channels from a shared queue, SCAN_CONCURRENCY caps how many
+    scans run at once, and an idle break taken by any tab pauses all of them: the
+    others finish their current step and park at the next wait_out_idle_break().
+    """
+    channel_queue = asyncio.Queue()
+    for channel_url in channels_to_check:
+        channel_queue.put_nowait(channel_url)
+    scan_slots = asyncio.Semaphore(SCAN_CONCURRENCY)
+    break_lock = asyncio.Lock()
+    gate = asyncio.Event()
+    gate.set()
+    gate_token = idle_gate.set(gate)  # Inherited by the tab worker tasks below
+
+    async def tab_worker(tab_index):
+        while not stop_event.is_set():
+            try:
+                channel_url = channel_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
             
-            is_bot = await message_element.locator('[class*="botTag"]').count() > 0
+            async with break_lock:
+                await maybe_take_idle_break()
+            if stop_event.is_set():
+                return
             
-            # Avatar fallback
-            avatar_elem = message_element.locator('img[class*="avatar"]').first
-            avatar_url = None
-            if await avatar_elem.count() > 0:
-                avatar_url = await avatar_elem.get_attribute('src')
-                
-            return {"name": clean_text(author_name), "is_bot": is_bot, "avatar": avatar_url}
-    except: pass
-    return {"name": "Unknown", "is_bot": False, "avatar": None}
-
-async def wait_for_messages_to_load(page):
-    SELECTORS = [
-        'li[id^="chat-messages-"]',
-        '[class*="message-"][class*="cozy"]',
-        '[id^="message-content-"]',
-        'div[class*="messageContent-"]',
-        '[data-list-item-id^="chat-messages"]',
-        'article[class*="message-"]',
-        '[role="listitem"]',
-    ]
-    
-    log("   🔍 Loading messages...")
+            # Per-tab isolation: a crashed/closed tab is replaced, the others keep going
+            if pages[tab_index].is_closed():
+                log(f"   🔁 Tab {tab_index + 1} closed, opening a replacement")
+                pages[tab_index] = await open_tab(context, network_capture)
+            
+            async with scan_slots:
+                await scan_channel(pages[tab_index], channel_url, cursors, network_capture)
+
     try:
-        # Increase timeout and wait for a more generic chat container
-        await page.wait_for_selector('main[class*="chatContent"], div[class*="chat-"], [class*="messagesWrapper-"]', timeout=30000)
-    except: pass
+        results = await asyncio.gather(*(tab_worker(i) for i in range(len(pages))), return_exceptions=True)
+    finally:
+        idle_gate.reset(gate_token)
+    failures = [r for r in results if isinstance(r, Exception)]
+    for i, result in enumerate(results):
+        if isinstance(result, Exception):
+            log(f"   ⚠️ Tab {i + 1} worker failed: {str(result)[:100]}")
+    if failures and len(failures) == len(pages):
+        # Every tab died - most likely the context/browser itself; let the session restart
+        raise failures[0]
+
+# Maximum anti-detection scripts (context init scripts do not persist, re-added on every launch)
+STEALTH_INIT_SCRIPT = """
+    // Remove webdriver flag
+    Object.defineProperty(navigator, 'webdriver', {
+        get: () => undefined
+    });
     
-    for attempt in range(5): # Increase attempts
-        await page.evaluate("window.scrollTo(0, 0)")
-        await smart_delay(0.5, 1.5)
-        for selector in SELECTORS:
-            try:
-                elements = page.locator(selector)
-                if await elements.count() > 0:
-                    return selector, elements
-            except: continue
-        
-        # If not found, scroll to bottom and wait a bit longer
-        await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-        await smart_delay(1.0, 2.0)
+    // Randomize plugins
+    Object.defineProperty(navigator, 'plugins', {
+        get: () => {
+            const plugins = [
+                {name: 'Chrome PDF Plugin', filename: 'internal-pdf-viewer'},
+                {name: 'Chrome PDF Viewer', filename: 'mhjfbmdgcfjbbpaeojofohoefgiehjai'},
+                {name: 'Native Client', filename: 'internal-nacl-plugin'}
+            ];
+            return plugins;
+        }
+    });
+    
+    // Override chrome object
+    window.chrome = {
+        runtime: {},
+        loadTimes: function() {},
+        csi: function() {},
+        app: {}
+    };
+    
+    // Add realistic timing
+    const originalQuery = window.navigator.permissions.query;
+    window.navigator.permissions.query = (parameters) => (
+        parameters.name === 'notifications' ?
+            Promise.resolve({ state: Notification.permission }) :
+            originalQuery(parameters)
+    );
     
-    return None, None
+    // Remove automation indicators
+    delete navigator.__proto__.webdriver;
+"""
 
-async def detect_account_picker(page):
-    selectors = [
-        'button[class*="userButton"]',
-        '[class*="accountPicker"]',
-        '[class*="SelectAccount"]',
-        'div:has-text("Select Account")',
-        'div:has-text("Which account?")',
+def get_browser_launch_args(user_agent):
+    return [
+        '--disable-blink-features=AutomationControlled',
+        '--disable-dev-shm-usage',
+        '--no-sandbox',
+        '--disable-web-security',
+        '--disable-features=IsolateOrigins,site-per-process',
+        '--disable-site-isolation-trials',
+        '--disable-gpu',
+        '--proxy-bypass-list=*',
+        f'--user-agent={user_agent}'
     ]
-    for selector in selectors:
+
+def random_context_options(user_agent):
+    """Randomized fingerprint options shared by ephemeral and persistent contexts"""
+    # Randomize viewport (common resolutions)
+    viewports = [
+        {'width': 1920, 'height': 1080},
+        {'width': 1366, 'height': 768},
+        {'width': 1536, 'height': 864},
+        {'width': 1440, 'height': 900},
+        {'width': 2560, 'height': 1440}
+    ]
+    return {
+        "viewport": random.choice(viewports),
+        "user_agent": user_agent,
+        "locale": 'en-US',
+        "timezone_id": 'America/New_York',
+        "permissions": ['notifications'],
+        "color_scheme": 'dark' if random.random() > 0.3 else 'light',
+        "device_scale_factor": random.choice([1, 1.25, 1.5, 2])
+    }
+
+# 1x1 transparent GIF served in place of blocked images so <img> elements keep their src
+BLANK_GIF = bytes.fromhex("47494638396101000100800000000000ffffff21f90401000000002c00000000010001000002024401003b")
+# Rough transfer sizes for bytes-saved accounting (aborted requests never report a size)
+BLOCKED_RESOURCE_SIZE_ESTIMATE = {"image": 15 * 1024, "media": 400 * 1024, "font": 40 * 1024}
+
+BLANK_GIF_B64 = base64.b64encode(BLANK_GIF).decode()
+
+class ResourceFilter:
+    """
+    Per-page CDP request interception that keeps media and fonts off the wire:
+    - images are answered with a 1x1 GIF (no error handlers fire, src stays intact)
+    - other blocked types (video/audio, fonts) are aborted
+    - only the blocked resource types are intercepted (Fetch.enable patterns), so API,
+      script, stylesheet, document and websocket traffic never pauses. Unlike a Playwright
+      route this leaves the HTTP cache on, so Discord's bundle is still served from cache.
+    Pages that are not on a channel (login, captcha) are never filtered.
+    """
+
+    def __init__(self, blocked_types, allow_url_re=None):
+        self.blocked_types = set(blocked_types)
+        self.allow_url_re = allow_url_re  # Exemptions, e.g. embed images for media capture
+        self.sessions = weakref.WeakKeyDictionary()  # {page: task enabling Fetch on its CDP session}
+        self.stats = {"allowed": 0, "blocked": 0, "est_bytes_saved": 0, "by_type": {}}
+
+    async def attach(self, context):
+        """Filter the context's open pages and any page it opens later (popups included)"""
+        context.on("page", self.attach_page)
+        for page in context.pages:
+            await self.attach_page(page)
+
+    async def attach_page(self, page):
+        # The "page" event and open_tab() both attach new pages - share one setup
+        if page not in self.sessions:
+            self.sessions[page] = asyncio.ensure_future(self._enable(page))
+        await self.sessions[page]
+
+    async def _enable(self, page):
         try:
-            if await page.locator(selector).count() > 0:
-                return True
+            cdp = await page.context.new_cdp_session(page)
+            cdp.on("Fetch.requestPaused", lambda params: self._handle(page, cdp, params))
+            await cdp.send("Fetch.enable", {"patterns": [
+                {"urlPattern": "*", "resourceType": kind.capitalize(), "requestStage": "Request"}
+                for kind in sorted(self.blocked_types)
+            ]})
+        except Exception as e:
+            log(f"⚠️ Resource filter not attached: {str(e)[:80]}")
+
+    def _should_block(self, page, url):
+        if self.allow_url_re and self.allow_url_re.search(url):
+            return False
+        try:
+            return "discord.com/channels" in page.url
+        except Exception:
+            return False
+
+    async def _handle(self, page, cdp, params):
+        request_id = params["requestId"]
+        try:
+            if not self._should_block(page, params["request"]["url"]):
+                self.stats["allowed"] += 1
+                await cdp.send("Fetch.continueRequest", {"requestId": request_id})
+                return
+            kind = params.get("resourceType", "").lower()
+            self.stats["blocked"] += 1
+            self.stats["by_type"][kind] = self.stats["by_type"].get(kind, 0) + 1
+            self.stats["est_bytes_saved"] += BLOCKED_RESOURCE_SIZE_ESTIMATE.get(kind, 0)
+            if kind == "image":
+                await cdp.send("Fetch.fulfillRequest", {
+                    "requestId": request_id, "responseCode": 200,
+                    "responseHeaders": [{"name": "Content-Type", "value": "image/gif"}],
+                    "body": BLANK_GIF_B64
+                })
+            else:
+                await cdp.send("Fetch.failRequest", {"requestId": request_id, "errorReason": "BlockedByClient"})
+        except Exception:
+            # Request already handled or page gone
+            pass
+
+    def get_stats(self):
+        return {
+            **self.stats,
+            "blocked_types": sorted(self.blocked_types),
+            "est_mb_saved": round(self.stats["est_bytes_saved"] / (1024 * 1024), 1)
+        }
+
+# Embed images are served by Discord's media proxy; avatars/emoji come from cdn.discordapp.com
+EMBED_MEDIA_RE = re.compile(r'^https://(images-ext-\d+\.discordapp\.net|media\.discordapp\.net)/')
+MEDIA_CAPTURE_FOLDER = f"{UPLOAD_FOLDER}/media"
+MEDIA_CAPTURE_BUFFER = 64                   # Recent image bodies kept for lookup
+MEDIA_CAPTURE_BUFFER_BYTES = 64 * 1024 * 1024  # ...and their total size
+MEDIA_CAPTURE_MAX_BYTES = 8 * 1024 * 1024
+MEDIA_CAPTURE_UPLOADED_KEYS = 4096          # Stored keys remembered to skip re-uploads
+MEDIA_EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp", "image/gif": "gif", "image/avif": "avif"}
+
+class MediaCapture:
+    """
+    Keeps the bodies of embed images the archiver browser already downloaded, so the main
+    image of each new message can be stored once, content-addressed, in Supabase Storage
+    (media/<sha256[:2]>/<sha256>.<ext>), and its measurements recorded on the message:
+      raw_data["media"] = {"sha256", "size", "width", "height", "content_type", "source_url"}
+    The upload runs in the background after the row is written, so no storage key is
+    recorded - the object may not exist. Downstream (bot, API) can trust the recorded
+    dimensions instead of re-downloading.
+    Dimensions are of the variant Discord's proxy served, so they are a lower bound.
+    """
+
+    def __init__(self):
+        self.bodies = OrderedDict()  # {url: (bytes, content_type)}
+        self.buffered_bytes = 0
+        self.uploaded = OrderedDict()  # LRU of keys already stored
+        self.uploader = ThreadPoolExecutor(max_workers=2, thread_name_prefix="MediaUpload")
+        self.stats = {"responses": 0, "captured": 0, "missed": 0, "uploads": 0, "upload_failures": 0, "bytes_stored": 0}
+
+    def attach(self, context):
+        context.on("response", self._on_response)
+
+    async def _on_response(self, response):
+        try:
+            if response.request.resource_type != "image" or response.status != 200:
+                return
+            if not EMBED_MEDIA_RE.search(response.url):
+                return
+            body = await response.body()
+            if not body or len(body) > MEDIA_CAPTURE_MAX_BYTES:
+                return
+            self.stats["responses"] += 1
+            content_type = (response.headers.get("content-type") or "").split(";")[0].strip()
+            previous = self.bodies.pop(response.url, None)
+            if previous:
+                self.buffered_bytes -= len(previous[0])
+            self.bodies[response.url] = (body, content_type)
+            self.buffered_bytes += len(body)
+            while len(self.bodies) > MEDIA_CAPTURE_BUFFER or self.buffered_bytes > MEDIA_CAPTURE_BUFFER_BYTES:
+                _, (evicted, _) = self.bodies.popitem(last=False)
+                self.buffered_bytes -= len(evicted)
+        except Exception:
+            pass
+
+    def lookup(self, url):
+        if url in self.bodies:
+            return self.bodies[url]
+        # The DOM src and the fetched URL can differ only in resize parameters
+        base = url.split("?")[0]
+        for fetched_url in reversed(self.bodies):
+            if fetched_url.split("?")[0] == base:
+                return self.bodies[fetched_url]
+        return None
+
+    def attach_media(self, message_data):
+        """Add raw_data["media"] for the message's main embed image, if the browser fetched it"""
+        embed = message_data["raw_data"].get("embed")
+        if not embed:
+            return
+        url = (embed.get("images") or [None])[0] or embed.get("thumbnail")
+        if not url:
+            return
+        found = self.lookup(url)
+        if not found:
+            self.stats["missed"] += 1
+            return
+        body, content_type = found
+        try:
+            with Image.open(BytesIO(body)) as img:
+                width, height = img.size
+                content_type = content_type or Image.MIME.get(img.format, "")
+        except Exception:
+            return  # Not a decodable image (e.g. a stub) - nothing worth storing
+
+        sha256 = hashlib.sha256(body).hexdigest()
+        key = f"{MEDIA_CAPTURE_FOLDER}/{sha256[:2]}/{sha256}.{MEDIA_EXTENSIONS.get(content_type, 'bin')}"
+        message_data["raw_data"]["media"] = {
+            "sha256": sha256, "size": len(body),
+            "width": width, "height": height, "content_type": content_type, "source_url": url
+        }
+        self.stats["captured"] += 1
+        if key in self.uploaded:
+            self.uploaded.move_to_end(key)
+            return
+        self.uploaded[key] = True
+        while len(self.uploaded) > MEDIA_CAPTURE_UPLOADED_KEYS:
+            self.uploaded.popitem(last=False)
+        self.uploader.submit(self._upload, body, key, content_type)
+
+    def _upload(self, body, key, content_type):
+        if supabase_utils.upload_bytes(body, SUPABASE_BUCKET, key, content_type or "application/octet-stream", debug=False):
+            self.stats["uploads"] += 1
+            self.stats["bytes_stored"] += len(body)
+        else:
+            self.stats["upload_failures"] += 1
+            self.uploaded.pop(key, None)
+
+    def get_stats(self):
+        return {**self.stats, "buffered": len(self.bodies), "buffered_mb": round(self.buffered_bytes / (1024 * 1024), 1)}
+
+media_capture = MediaCapture() if MEDIA_CAPTURE_MODE else None
+resource_filter = ResourceFilter(
+    BLOCKED_RESOURCE_TYPES, EMBED_MEDIA_RE if MEDIA_CAPTURE_MODE else None
+) if BLOCKED_RESOURCE_TYPES else None
+
+async def new_archiver_context(browser, user_agent, state_path):
+    """New BrowserContext with randomized fingerprint, saved session and anti-detection scripts"""
+    context = await browser.new_context(
+        storage_state=state_path if os.path.exists(state_path) else None,
+        **random_context_options(user_agent)
+    )
+    await context.add_init_script(STEALTH_INIT_SCRIPT)
+    return context
+
+def load_profile_fingerprint():
+    """
+    Fingerprint pinned to the persistent profile. The cached Discord session should not
+    see its UA/viewport change between restarts, so it is chosen once and stored.
+    """
+    path = os.path.join(BROWSER_PROFILE_DIR, PROFILE_FINGERPRINT_FILE)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            log(f"⚠️ Unreadable profile fingerprint, picking a new one: {e}")
+    options = random_context_options(get_realistic_user_agent())
+    os.makedirs(BROWSER_PROFILE_DIR, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(options, f)
+    return options
+
+async def seed_profile_from_storage_state(context, state_path):
+    """First launch of an empty profile: import cookies + localStorage from storage_state.json"""
+    if not os.path.exists(state_path):
+        return
+    with open(state_path, 'r') as f:
+        state = json.load(f)
+    if state.get("cookies"):
+        await context.add_cookies(state["cookies"])
+    origins = [o for o in state.get("origins") or [] if o.get("localStorage")]
+    if origins:
+        seed_page = await context.new_page()
+        try:
+            for origin in origins:
+                # Any same-origin document will do; robots.txt avoids booting the web app
+                await seed_page.goto(origin["origin"].rstrip('/') + "/robots.txt", timeout=20000)
+                await seed_page.evaluate(
+                    "items => items.forEach(i => localStorage.setItem(i.name, i.value))",
+                    origin["localStorage"]
+                )
+        finally:
+            await seed_page.close()
+    log("🌱 Seeded persistent profile from saved session")
+
+async def launch_persistent_archiver_context(p, state_path):
+    """
+    Launch Chromium on the persistent profile under data/ so the HTTP cache, service
+    worker and IndexedDB survive restarts (Discord's bundle is not re-downloaded).
+    """
+    first_run = not os.path.exists(os.path.join(BROWSER_PROFILE_DIR, PROFILE_FINGERPRINT_FILE))
+    options = load_profile_fingerprint()
+    # A killed container leaves Chromium's profile lock behind
+    for lock_name in ("SingletonLock", "SingletonCookie", "SingletonSocket"):
+        try:
+            os.remove(os.path.join(BROWSER_PROFILE_DIR, lock_name))
+        except OSError:
+            pass
+    context = await p.chromium.launch_persistent_context(
+        BROWSER_PROFILE_DIR,
+        headless=HEADLESS_MODE,
+        args=get_browser_launch_args(options["user_agent"]),
+        **options
+    )
+    await context.add_init_script(STEALTH_INIT_SCRIPT)
+    if first_run:
+        await seed_profile_from_storage_state(context, state_path)
+    return context
+
+def record_first_channel_timing():
+    """Log time from browser launch to the first channel with messages loaded (once per launch)"""
+    startup = archiver_state["startup"]
+    if startup["pending_since"] is None:
+        return
+    elapsed = time.time() - startup["pending_since"]
+    startup["pending_since"] = None
+    mode = "persistent" if PERSISTENT_PROFILE_MODE else "cold"
+    startup["recent"].append({"mode": mode, "seconds": round(elapsed, 1), "at": datetime.utcnow().isoformat()})
+    log(f"⏱️ Launch → first channel: {elapsed:.1f}s ({mode} start)")
+
+async def open_tab(context, network_capture=None):
+    """New page with the resource filter and network capture attached before it navigates"""
+    page = await context.new_page()
+    if resource_filter:
+        await resource_filter.attach_page(page)
+    if network_capture:
+        network_capture.attach(page)
+    return page
+
+async def open_tab_pool(context, network_capture=None):
+    """Open TAB_POOL_SIZE pages in the context (pages[0] is the main tab)"""
+    # Persistent contexts start with a page already open - reuse it
+    pages = list(context.pages[:TAB_POOL_SIZE])
+    if network_capture:
+        for tab in pages:
+            network_capture.attach(tab)
+    while len(pages) < TAB_POOL_SIZE:
+        pages.append(await open_tab(context, network_capture))
+    return pages
+
+def read_private_bytes(pid, page_size):
+    """
+    USS of one process: its private pages only. Chromium's processes share most of their
+    code and shared-memory segments, so summing RSS counts those pages once per process.
+    """
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            return sum(
+                int(line.split()[1]) * 1024 for line in f
+                if line.startswith(('Private_Clean:', 'Private_Dirty:'))
+            )
+    except OSError:
+        # Kernels before 4.14: resident minus shared pages
+        with open(f'/proc/{pid}/statm') as f:
+            fields = f.read().split()
+        return max(0, int(fields[1]) - int(fields[2])) * page_size
+
+def get_process_tree_uss_mb(root_pid=None):
+    """USS of this process plus all descendants (the Chromium processes), read from /proc"""
+    root_pid = root_pid or os.getpid()
+    try:
+        children = {}
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    # "pid (comm) state ppid ..." - comm may contain spaces
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+                children.setdefault(ppid, []).append(int(entry))
+            except (OSError, ValueError, IndexError):
+                continue
+
+        page_size = os.sysconf('SC_PAGE_SIZE')
+        total, stack = 0, [root_pid]
+        while stack:
+            pid = stack.pop()
+            try:
+                total += read_private_bytes(pid, page_size)
+            except (OSError, ValueError, IndexError):
+                pass
+            stack.extend(children.get(pid, []))
+        return total / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None  # No /proc (non-Linux host)
+
+async def sample_page_memory(page):
+    """JS heap and DOM node count of a tab via CDP Performance.getMetrics"""
+    cdp = await page.context.new_cdp_session(page)
+    try:
+        await cdp.send("Performance.enable")
+        result = await cdp.send("Performance.getMetrics")
+        metrics = {m["name"]: m["value"] for m in result.get("metrics", [])}
+        return {
+            "js_heap_mb": round(metrics.get("JSHeapUsedSize", 0) / (1024 * 1024), 1),
+            "dom_nodes": int(metrics.get("Nodes", 0))
+        }
+    finally:
+        try:
+            await cdp.detach()
         except: pass
-    return False
+
+async def recycle_if_memory_high(context, pages, reopen_context, state_path, network_capture=None):
+    """
+    Sample memory between batches and proactively recycle before the OOM killer does:
+    - a tab over MAX_JS_HEAP_MB / MAX_DOM_NODES is closed and reopened on the same URL
+    - if the whole process tree's private memory (USS) exceeds MAX_BROWSER_USS_MB, the context is rebuilt via
+      reopen_context() from the saved storage_state.json (or the persistent profile)
+    Returns the (possibly new) context and pages.
+    """
+    memory = archiver_state["memory"]
+    tabs = []
+    for tab in pages:
+        try:
+            tabs.append(await sample_page_memory(tab))
+        except Exception:
+            tabs.append(None)
+    uss_mb = get_process_tree_uss_mb()
+    memory["last_sample"] = {
+        "at": datetime.utcnow().isoformat(),
+        "uss_mb": round(uss_mb, 1) if uss_mb is not None else None,
+        "tabs": tabs
+    }
+
+    if uss_mb is not None and uss_mb > MAX_BROWSER_USS_MB:
+        log(f"🧠 USS {uss_mb:.0f}MB > {MAX_BROWSER_USS_MB:.0f}MB, recycling browser context...")
+        try:
+            await context.storage_state(path=state_path)
+        except Exception as e:
+            log(f"   ⚠️ Could not save session before recycle: {e}")
+        try:
+            await context.close()
+        except: pass
+        context = await reopen_context()
+        pages = await open_tab_pool(context, network_capture)
+        try:
+            await pages[0].goto("https://discord.com/channels/@me", timeout=30000)
+        except: pass
+        memory["context_recycles"] += 1
+        return context, pages
+
+    for i, sample in enumerate(tabs):
+        if not sample:
+            continue
+        if sample["js_heap_mb"] > MAX_JS_HEAP_MB or sample["dom_nodes"] > MAX_DOM_NODES:
+            log(f"🧠 Tab {i + 1}: heap {sample['js_heap_mb']}MB, {sample['dom_nodes']} nodes - recycling tab")
+            url = pages[i].url
+            try:
+                await pages[i].close()
+            except: pass
+            pages[i] = await open_tab(context, network_capture)
+            if "discord.com" in url:
+                try:
+                    await pages[i].goto(url, timeout=30000)
+                except: pass
+            memory["page_recycles"] += 1
+    return context, pages
 
 async def async_archiver_logic():
     """MAXIMUM STEALTH Discord scraper"""
@@ -1219,106 +2605,74 @@ async def async_archiver_logic():
         log("🛠 DEBUG: HTML capture enabled")
     
     state_path = os.path.join(DATA_DIR, STORAGE_STATE_FILE)
-    remote_state_path = f"{UPLOAD_FOLDER}/{STORAGE_STATE_FILE}"
-    last_ids_path = os.path.join(DATA_DIR, LAST_MESSAGE_ID_FILE)
+    remote_state_path = f"{WORKER_UPLOAD_FOLDER}/{STORAGE_STATE_FILE}"
     
-    try:
-        data = supabase_utils.download_file(state_path, remote_state_path, SUPABASE_BUCKET)
-        if data: log("✅ Session restored")
-    except: pass
-
-    last_ids = {}
-    if os.path.exists(last_ids_path):
+    for restore_path in worker_remote_paths(STORAGE_STATE_FILE):
         try:
-            with open(last_ids_path, 'r') as f: last_ids = json.load(f)
-        except: pass
+            data = await supabase_utils_async.download_file(state_path, restore_path, SUPABASE_BUCKET)
+        except: data = None
+        if data:
+            log(f"✅ Session restored{'' if restore_path == remote_state_path else ' (shared session)'}")
+            break
+
+    # Both may fall back to a blocking Storage download - keep it off the event loop
+    cursors = await asyncio.to_thread(load_channel_cursors)
+    if lease_manager:
+        lease_manager.start_heartbeat(cursors, stop_event)
+        log(f"🤝 Worker '{ARCHIVER_WORKER_ID}' sharding channels via {LEASE_BACKEND} leases")
         
+    # Start (or resume) background ingestion - replays anything left from a previous run
+    message_spool.start()
+
     # Load Persistent Metrics
-    load_channel_metrics()
+    await asyncio.to_thread(load_channel_metrics)
     last_metric_save = time.time()
 
     while not stop_event.is_set():
         try:
             async with async_playwright() as p:
-                user_agent = get_realistic_user_agent()
-                log(f"🎭 UA: {user_agent[:60]}...")
-        
-                browser = await p.chromium.launch(
-                    headless=HEADLESS_MODE,
-                    args=[
-                        '--disable-blink-features=AutomationControlled',
-                        '--disable-dev-shm-usage',
-                        '--no-sandbox',
-                        '--disable-web-security',
-                        '--disable-features=IsolateOrigins,site-per-process',
-                        '--disable-site-isolation-trials',
-                        '--disable-gpu',
-                        '--proxy-bypass-list=*',
-                        f'--user-agent={user_agent}'
-                    ]
-                )
-        
-                # Randomize viewport (common resolutions)
-                viewports = [
-                    {'width': 1920, 'height': 1080},
-                    {'width': 1366, 'height': 768},
-                    {'width': 1536, 'height': 864},
-                    {'width': 1440, 'height': 900},
-                    {'width': 2560, 'height': 1440}
-                ]
-                viewport = random.choice(viewports)
+                archiver_state["startup"]["pending_since"] = time.time()
+                browser = None
+                user_agent = None
+                if PERSISTENT_PROFILE_MODE:
+                    log(f"🗄️ Persistent profile: {BROWSER_PROFILE_DIR}")
+                else:
+                    user_agent = get_realistic_user_agent()
+                    log(f"🎭 UA: {user_agent[:60]}...")
+            
+                    browser = await p.chromium.launch(
+                        headless=HEADLESS_MODE,
+                        args=get_browser_launch_args(user_agent)
+                    )
+
+                async def reopen_context():
+                    if PERSISTENT_PROFILE_MODE:
+                        new_context = await launch_persistent_archiver_context(p, state_path)
+                    else:
+                        new_context = await new_archiver_context(browser, user_agent, state_path)
+                    if resource_filter:
+                        await resource_filter.attach(new_context)
+                    if media_capture:
+                        media_capture.attach(new_context)
+                    return new_context
+
+                context = await reopen_context()
+                if resource_filter:
+                    log(f"🚫 Blocking {', '.join(sorted(resource_filter.blocked_types))} requests on channel pages")
                 
-                context = await browser.new_context(
-                    viewport=viewport,
-                    user_agent=user_agent,
-                    storage_state=state_path if os.path.exists(state_path) else None,
-                    locale='en-US',
-                    timezone_id='America/New_York',
-                    permissions=['notifications'],
-                    color_scheme='dark' if random.random() > 0.3 else 'light',
-                    device_scale_factor=random.choice([1, 1.25, 1.5, 2])
-                )
+                network_capture = None
+                if NETWORK_CAPTURE_MODE:
+                    network_capture = NetworkMessageCapture()
+                    log("📡 Network capture mode enabled (DOM extraction as fallback)")
                 
-                # Maximum anti-detection scripts
-                await context.add_init_script("""
-                    // Remove webdriver flag
-                    Object.defineProperty(navigator, 'webdriver', {
-                        get: () => undefined
-                    });
-                    
-                    // Randomize plugins
-                    Object.defineProperty(navigator, 'plugins', {
-                        get: () => {
-                            const plugins = [
-                                {name: 'Chrome PDF Plugin', filename: 'internal-pdf-viewer'},
-                                {name: 'Chrome PDF Viewer', filename: 'mhjfbmdgcfjbbpaeojofohoefgiehjai'},
-                                {name: 'Native Client', filename: 'internal-nacl-plugin'}
-                            ];
-                            return plugins;
-                        }
-                    });
-                    
-                    // Override chrome object
-                    window.chrome = {
-                        runtime: {},
-                        loadTimes: function() {},
-                        csi: function() {},
-                        app: {}
-                    };
-                    
-                    // Add realistic timing
-                    const originalQuery = window.navigator.permissions.query;
-                    window.navigator.permissions.query = (parameters) => (
-                        parameters.name === 'notifications' ?
-                            Promise.resolve({ state: Notification.permission }) :
-                            originalQuery(parameters)
-                    );
-                    
-                    // Remove automation indicators
-                    delete navigator.__proto__.webdriver;
-                """)
+                # Extra tabs share cookies/session with the main page via the context
+                pages = await open_tab_pool(context, network_capture)
+                page = pages[0]
+                if len(pages) > 1:
+                    log(f"🗂️ Tab pool: {len(pages)} tabs, max {SCAN_CONCURRENCY} concurrent scans")
                 
-                page = await context.new_page()
+                # Live portal follows the main tab (screencast only runs while someone watches)
+                await live_stream.attach(page)
                 set_status("RUNNING")
 
                 while not stop_event.is_set():
@@ -1338,11 +2692,9 @@ async def async_archiver_logic():
                                 send_telegram_alert("Account Picker", "Manual selection needed", "warning")
                             
                             wait_cycles = 0
-                            while wait_cycles < 120 and not stop_event.is_set():
-                                try:
-                                    scr = await page.screenshot(quality=85, type='jpeg')
-                                    socketio.emit('screenshot', base64.b64encode(scr).decode('utf-8'))
-                                except: pass
+                            while wait_cycles < 600 and not stop_event.is_set():
+                                # Frames reach the portal via the screencast; poll input every second
+                                await live_stream.sync()
                                 
                                 try:
                                     while not input_queue.empty():
@@ -1378,195 +2730,57 @@ async def async_archiver_logic():
                                 
                                 if "discord.com/channels" in page.url and "/login" not in page.url:
                                     await context.storage_state(path=state_path)
-                                    supabase_utils.upload_file(state_path, SUPABASE_BUCKET, remote_state_path, debug=False)
+                                    await supabase_utils_async.upload_file(state_path, SUPABASE_BUCKET, remote_state_path, debug=False)
                                     log("✅ Login success!")
                                     await smart_delay(3, 7)
                                     break
                                 
-                                await asyncio.sleep(5)
+                                await asyncio.sleep(1)
                                 wait_cycles += 1
-                                if wait_cycles % 10 == 0: log(f"⏳ {wait_cycles*5}s elapsed...")
+                                if wait_cycles % 50 == 0: log(f"⏳ {wait_cycles}s elapsed...")
 
 
                         # Dynamic Channel Loading (Small Batch Strategy)
                         cm.reload() 
                         enabled_channels = cm.get_enabled_channels()
                         all_urls = [c['url'] for c in enabled_channels]
+                        if network_capture:
+                            network_capture.watch(all_urls)
                         
                         if not all_urls:
                             log("⚠️ No enabled channels found. Waiting...")
                             await asyncio.sleep(60)
                             continue
 
-                        # Pick a small batch (3-5 channels)
-                        channels_to_check = get_small_batch_channels(all_urls)
-                        
-                        for channel_url in channels_to_check:
-                            if stop_event.is_set(): break
-
-
-                            # --- IDLE BREAK CHECK (Per Channel) ---
-                            # Logic: Random (10%) OR Forced after 15 channels without break
-                            # Duration is random (IDLE_BREAK_MIN to IDLE_BREAK_MAX) handled by take_idle_break
-                            
-                            should_break = False
-                            archiver_state["checks_since_idle"] += 1
-                            
-                            if archiver_state["checks_since_idle"] >= 15:
-                                log("⚠️ Forced idle break (15 channels limit reached)")
-                                should_break = True
-                            elif random.random() < 0.10:
-                                should_break = True
-                                
-                            if should_break: 
-                                await take_idle_break()
-                                archiver_state["last_alert_time"]["last_idle_break"] = time.time()
-                                archiver_state["checks_since_idle"] = 0 # Reset counter
-                                if stop_event.is_set(): break
-                            
-                            # Persistent failure check
-                            if archiver_state["error_counts"].get(channel_url, 0) > 2:
-                                log(f"   🔄 Channel {channel_url.split('/')[-1]} has high error count. Hard refreshing...")
-                                try:
-                                    await page.reload(timeout=30000)
-                                    await smart_delay(5, 10)
-                                except: pass
-
-                            archiver_state["total_checks"] += 1
-                            log(f"📂 [{archiver_state['total_checks']}] {channel_url.split('/')[-1]}")
-                            
+                        # Scale-out: only scan the channels this worker holds a lease on
+                        if lease_manager:
                             try:
-                                # Always use click navigation (fallback to URL only if click fails)
-                                await navigate_to_channel(page, channel_url)
-                                await smart_delay(2, 5)
-                                
-                                # Human behavior simulation
-                                if random.random() < MOUSE_MOVEMENT_CHANCE:
-                                    await advanced_mouse_movement(page)
-                                
-                                if random.random() < SCROLL_CHANCE:
-                                    await realistic_scroll_behavior(page)
-                                
-                                # Random pause (thinking/reading)
-                                await simulate_human_pause()
-                                
-                                try:
-                                    scr = await page.screenshot(quality=85, type='jpeg')
-                                    socketio.emit('screenshot', base64.b64encode(scr).decode('utf-8'))
-                                except: pass
-                                
-                                selector, messages = await wait_for_messages_to_load(page)
-                                if not messages:
-                                    log("   ⚠️ No messages")
-                                    # Diagnostic info
-                                    page_title = await page.title()
-                                    page_url = page.url
-                                    err_screenshot = None
-                                    try:
-                                        err_screenshot = await page.screenshot(quality=70, type='jpeg')
-                                    except: pass
-                                    
-                                    track_channel_error(channel_url, f"No messages found.\nURL: {page_url}\nTitle: {page_title}", image_bytes=err_screenshot)
-                                    await smart_delay(CHANNEL_DELAY_MIN, CHANNEL_DELAY_MAX)
-                                    continue
-                                
-                                # Simulate reading
-                                await simulate_reading_pattern(page)
-                                
-                                count = await messages.count()
-                                batch = []
-                                current_ids = last_ids.get(channel_url, [])
-                                
-                                debug_saved = False
-                                for i in range(max(0, count - 10), count):
-                                    msg = messages.nth(i)
-                                    raw_id = await msg.get_attribute('id') or await msg.get_attribute('data-list-item-id') or ""
-                                    # Discord snowflake IDs are 17-19 digits. Extract the final numeric segment.
-                                    match = re.search(r'(\d{17,19})$', raw_id)
-                                    msg_id = match.group(1) if match else raw_id.replace('chat-messages-', '').replace('message-', '')
-                                    
-                                    if not msg_id or msg_id in current_ids: continue
-                                    
-                                    if DEBUG_MODE and not debug_saved:
-                                        await save_message_html_for_inspection(msg, msg_id)
-                                        debug_saved = True
-                                    
-                                    author_data = await extract_message_author(msg)
-                                    embed_data = await extract_embed_data(msg)
-                                    
-                                    content_loc = msg.locator('[id^="message-content-"]').first
-                                    plain_content = await content_loc.inner_text() if await content_loc.count() else ""
-                                    
-                                    message_data = {
-                                        "id": int(msg_id) if msg_id.isdigit() else abs(hash(msg_id)) % (10 ** 15),
-                                        "channel_id": channel_url.split('/')[-1],
-                                        "content": clean_text(plain_content),
-                                        "scraped_at": datetime.utcnow().isoformat(),
-                                        "raw_data": {
-                                            "author": author_data,
-                                            "channel_url": channel_url,
-                                            "embed": embed_data,
-                                            "has_embed": embed_data is not None
-                                        }
-                                    }
-                                    
-                                    hash_content = {
-                                        "content": plain_content,
-                                        "embed_title": embed_data.get("title") if embed_data else None,
-                                        "embed_desc": embed_data.get("description") if embed_data else None
-                                    }
-                                    message_data["raw_data"]["content_hash"] = generate_content_hash(hash_content)
-                                    
-                                    batch.append(message_data)
-                                    current_ids.append(msg_id)
-                                    
-                                    if embed_data:
-                                        title = (embed_data.get('title') or 'No title')[:40]
-                                        log(f"   ✅ {title}...")
-                                        if embed_data.get('links'):
-                                            log(f"      🔗 {len(embed_data['links'])} link(s)")
-                                    else:
-                                        log(f"   📝 {plain_content[:40]}...")
-                                    
-                                    # Random micro-delay between messages
-                                    await asyncio.sleep(random.gauss(0.2, 0.1))
-
-                                # Update Activity Metrics
-                                if channel_url not in archiver_state["channel_metrics"]:
-                                    archiver_state["channel_metrics"][channel_url] = {'msg_count': 0}
-                                archiver_state["channel_metrics"][channel_url]['msg_count'] += len(batch)
-                                archiver_state["channel_metrics"][channel_url]['last_check'] = time.time()
-
-                                if batch:
-                                    log(f"   ⬆️ {len(batch)} new message(s)")
-                                    supabase_utils.insert_discord_messages(batch)
-                                    last_ids[channel_url] = current_ids[-200:]
-                                    with open(last_ids_path, 'w') as f: json.dump(last_ids, f)
-                                
-                                track_channel_success(channel_url)
-                                await smart_delay(CHANNEL_DELAY_MIN, CHANNEL_DELAY_MAX)
-
+                                all_urls = await asyncio.to_thread(lease_manager.rebalance, all_urls, cursors)
                             except Exception as e:
-                                import traceback
-                                tb = traceback.format_exc()
-                                log(f"   ⚠️ Exception in channel loop: {str(e)}")
-                                # Diagnostic info
-                                page_title = "Unknown"
-                                page_url = channel_url
-                                err_screenshot = None
-                                try:
-                                    page_title = await page.title()
-                                    page_url = page.url
-                                    err_screenshot = await page.screenshot(quality=70, type='jpeg')
-                                except: pass
-                                track_channel_error(channel_url, f"{str(e)}\nURL: {page_url}\nTitle: {page_title}\n\nTraceback:\n{tb}", image_bytes=err_screenshot)
-                                await smart_delay(4, 8)
-
+                                log(f"⚠️ Lease rebalance failed, keeping current leases: {e}")
+                                all_urls = [u for u in all_urls if lease_manager.holds(u)]
+                            if not all_urls:
+                                log("🔒 No channel leases available for this worker. Waiting...")
+                                await asyncio.sleep(60)
+                                continue
+
+                        # Pick a small batch (3-5 channels per tab)
+                        batch_size = random.randint(3, 5) * len(pages) if len(pages) > 1 else None
+                        channels_to_check = pick_channel_batch(all_urls, batch_size)
                         
+                        await scan_channels_in_tabs(context, pages, channels_to_check, cursors, network_capture)
+                        context, pages = await recycle_if_memory_high(context, pages, reopen_context, state_path, network_capture)
+                        if pages[0] is not page:
+                            page = pages[0]
+                            await live_stream.attach(page)
+
                         # Save metrics periodically
                         if time.time() - last_metric_save > 600: # Every 10 mins
                             save_channel_metrics()
                             last_metric_save = time.time()
+                        
+                        if cursors.mirror_due():
+                            save_channel_cursors(cursors)
 
                         # --- LONG SLEEP CHECK (Post Batch) ---
                         if random.random() < LONG_SLEEP_CHANCE:
@@ -1602,6 +2816,17 @@ async def async_archiver_logic():
             send_telegram_alert("CRITICAL: Top-level Archiver Error", f"The archiver loop encountered a major error: {str(e)}\nRestarting loop in 15s...")
             await asyncio.sleep(15)
     
+    if lease_manager:
+        try:
+            lease_manager.release_all(cursors)
+            log("🔓 Released channel leases")
+        except Exception as e:
+            log(f"⚠️ Failed to release leases: {e}")
+
+    # Drain what is spooled; the next start() replays anything left
+    message_spool.stop()
+    log(f"📦 Ingest spool stopped ({message_spool.pending()} row(s) pending)")
+
     log("✅ Archiver logic stopped")
     
     set_status("STOPPED")
@@ -1656,9 +2881,30 @@ def test_channel():
         "session_start": archiver_state["session_start_time"],
         "mouse_movements": archiver_state["mouse_movements"],
         "scrolls": archiver_state["scrolls_performed"],
-        "idle_breaks": archiver_state["idle_breaks_taken"]
+        "idle_breaks": archiver_state["idle_breaks_taken"],
+        "scheduler": get_scheduler_stats(),
+        "ingest": message_spool.get_stats(),
+        "gap_fill": archiver_state["gap_fill"],
+        "live_stream": live_stream.get_stats(),
+        "memory": archiver_state["memory"],
+        "startup": list(archiver_state["startup"]["recent"]),
+        "resource_filter": resource_filter.get_stats() if resource_filter else None,
+        "logs": log_ring.get_stats(),
+        "alerts": alert_dispatcher.get_stats(),
+        "leases": lease_manager.get_stats() if lease_manager else None,
+        "selectors": selector_registry.get_stats(),
+        "media_capture": media_capture.get_stats() if media_capture else None,
+        "edits_detected": archiver_state["edits_detected"],
+        "storage_cache": storage_cache.get_stats(),
+        "kv_state": kv_state.get_stats()
     })
 
+@app.route('/api/logs')
+def api_logs():
+    """Recent structured log entries, optionally filtered: /api/logs?level=error&channel=<id>&limit=50"""
+    limit = min(request.args.get('limit', 100, type=int), LOG_RING_SIZE)
+    return jsonify(log_ring.recent(limit, request.args.get('level'), request.args.get('channel')))
+
 @app.route('/health')
 def health(): return jsonify({"status": "ok"})
 
@@ -1693,6 +2939,17 @@ def stripe_webhook():
 @socketio.on('input')
 def handle_input(data): input_queue.put(data)
 
+@socketio.on('connect')
+def handle_connect():
+    last_frame = live_stream.viewer_joined()
+    if last_frame:
+        socketio.emit('screenshot', last_frame, to=request.sid)
+    socketio.emit('log_batch', {'lines': log_ring.recent(100), 'dropped': log_ring.dropped}, to=request.sid)
+
+@socketio.on('disconnect')
+def handle_disconnect(*args):
+    live_stream.viewer_left()
+
 
 # if __name__ == '__main__':
 #     import telegram_bot
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Derive products rows for discord_messages archived before ingest-time extraction.
+
+Walks discord_messages in id order (keyset, so the cost per batch stays flat), runs
+products.to_row with the current channel map and upserts the rows. Safe to re-run: rows
+are merged, so it also refreshes rows after a change to extraction (EXTRACT_VERSION) or
+to channel names / regions.
+
+Usage:
+  python backfill_products.py [--since 2026-01-01] [--batch-size 500] [--only-missing] [--dry-run]
+"""
+
+import argparse
+import time
+
+import kv_state
+import products
+import supabase_utils
+
+CHANNELS_PATH = "discord_josh/channels.json"
+MESSAGE_SELECT = "id,channel_id,content,scraped_at,raw_data"
+
+
+def load_channel_map():
+    store = kv_state.open_store("channels", legacy_path=CHANNELS_PATH, legacy_transform=kv_state.list_to_kv)
+    store.refresh()
+    return products.build_channel_map(kv_state.kv_to_list(store.snapshot(copy_values=False)))
+
+
+def fetch_messages(after_id, batch_size, since=None):
+    url, key = supabase_utils.get_supabase_config()
+    query = f"select={MESSAGE_SELECT}&order=id.asc&limit={batch_size}"
+    if after_id is not None: query += f"&id=gt.{after_id}"
+    if since: query += f"&scraped_at=gte.{since}"
+    response = supabase_utils.get_http_session().get(
+        f"{url}/rest/v1/discord_messages?{query}",
+        headers={'apikey': key, 'Authorization': f'Bearer {key}'},
+        timeout=60
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def backfill(since=None, batch_size=500, only_missing=False, dry_run=False):
+    channel_map = load_channel_map()
+    print(f"🚀 Backfilling products (extract v{products.EXTRACT_VERSION}, {len(channel_map)} channels)")
+    after_id, scanned, written, failed = None, 0, 0, 0
+    started = time.time()
+    while True:
+        messages = fetch_messages(after_id, batch_size, since)
+        if not messages:
+            break
+        after_id = messages[-1]["id"]
+        scanned += len(messages)
+        rows = products.derive_rows(messages, channel_map)
+        if rows and not dry_run:
+            status = supabase_utils.post_product_rows(rows, timeout=60, merge=not only_missing)
+            if status in (200, 201, 204):
+                written += len(rows)
+            else:
+                failed += len(rows)
+        print(f"   {scanned} messages scanned, {written} rows written, {failed} failed (last id {after_id})")
+        if len(messages) < batch_size:
+            break
+    print(f"✅ Done in {time.time() - started:.0f}s: {scanned} messages, {written} products rows, {failed} failed")
+    return failed == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--since", help="Only messages scraped at or after this ISO date/time")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--only-missing", action="store_true", help="Leave existing products rows untouched")
+    parser.add_argument("--dry-run", action="store_true", help="Derive rows without writing them")
+    args = parser.parse_args()
+    ok = backfill(args.since, args.batch_size, args.only_missing, args.dry_run)
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Offline extraction benchmark over saved Discord HTML.
+
+Fixtures are the files app.py writes in DEBUG mode:
+  data/message_inspection_<id>.html    one message element
+  data/channel_inspection_<id>_<ts>.html  a rendered channel (scripts stripped)
+
+Each fixture is loaded into a local headless page with set_content and run through
+wait_for_messages_to_load, the bulk in-page extractor, and the per-element path
+(extract_message_author + extract_embed_data). Reported per path:
+  - messages/sec
+  - Playwright protocol calls per message (each is at least one CDP round trip)
+  - diffs against golden JSON (written with --update-golden)
+
+Human-behaviour delays (smart_delay) are disabled so only extraction is timed. Only
+message_extraction is imported, so nothing of the archiver (spool, leases, Flask) starts.
+
+Usage:
+  python bench_extraction.py [--fixtures data] [--golden data/extraction_golden] [--repeat 5] [--update-golden]
+"""
+
+import argparse
+import asyncio
+import difflib
+import glob
+import json
+import os
+import re
+import sys
+import time
+
+from playwright.async_api import async_playwright
+
+import message_extraction as extraction
+
+CHANNEL_URL_RE = re.compile(r'<!-- Channel URL: (\S+) -->')
+MESSAGE_ID_RE = re.compile(r'<!-- Message ID: (\S+) -->')
+VOLATILE_KEYS = {"scraped_at"}
+DATA_DIR = "data"  # Where app.py writes the DEBUG dumps
+
+
+class ProtocolCallCounter:
+    """Counts client -> server Playwright calls by wrapping the connection's send method"""
+
+    def __init__(self):
+        self.calls = 0
+        self.available = False
+
+    def install(self):
+        try:
+            from playwright._impl._connection import Connection
+        except ImportError:
+            return
+        original = getattr(Connection, "_send_message_to_server", None)
+        if original is None:
+            return
+        counter = self
+
+        def counting_send(self, *args, **kwargs):
+            counter.calls += 1
+            return original(self, *args, **kwargs)
+
+        Connection._send_message_to_server = counting_send
+        self.available = True
+
+
+def strip_volatile(value):
+    if isinstance(value, dict):
+        return {k: strip_volatile(v) for k, v in value.items() if k not in VOLATILE_KEYS}
+    if isinstance(value, list):
+        return [strip_volatile(v) for v in value]
+    return value
+
+
+def load_fixtures(fixtures_dir):
+    fixtures = []
+    for path in sorted(glob.glob(os.path.join(fixtures_dir, "channel_inspection_*.html"))):
+        with open(path, 'r', encoding='utf-8') as f:
+            html = f.read()
+        match = CHANNEL_URL_RE.search(html)
+        channel_url = match.group(1) if match else "https://discord.com/channels/0/0"
+        fixtures.append({"name": os.path.basename(path), "kind": "channel", "html": html, "channel_url": channel_url})
+
+    for path in sorted(glob.glob(os.path.join(fixtures_dir, "message_inspection_*.html"))):
+        with open(path, 'r', encoding='utf-8') as f:
+            html = f.read()
+        match = MESSAGE_ID_RE.search(html)
+        msg_id = match.group(1) if match else "0"
+        body = re.sub(r'<!--.*?-->\s*', '', html, count=2, flags=re.S).lstrip()
+        if not body.startswith("<li"):
+            # Older dumps saved inner HTML only; restore the list item the selectors expect
+            body = f'<li id="chat-messages-0-{msg_id}" class="messageListItem">{body}</li>'
+        page_html = f'<html><body><main class="chatContent"><ol data-list-id="chat-messages">{body}</ol></main></body></html>'
+        fixtures.append({
+            "name": os.path.basename(path), "kind": "message", "html": page_html,
+            "channel_url": "https://discord.com/channels/0/0"
+        })
+    return fixtures
+
+
+async def run_paths(page, fixture):
+    """Run every extraction path once. Returns {path: (messages, seconds, calls, output)}"""
+    results = {}
+    counter = BENCH_COUNTER
+
+    started, calls = time.perf_counter(), counter.calls
+    selector, messages = await extraction.wait_for_messages_to_load(page)
+    results["wait_for_messages_to_load"] = (1, time.perf_counter() - started, counter.calls - calls, selector)
+    if not messages:
+        return results
+
+    started, calls = time.perf_counter(), counter.calls
+    bulk, _ = await extraction.extract_new_messages(messages, fixture["channel_url"], [], limit=None)
+    results["bulk"] = (len(bulk), time.perf_counter() - started, counter.calls - calls,
+                       [data for _, _, data in bulk])
+
+    started, calls = time.perf_counter(), counter.calls
+    per_element, _ = await extraction.extract_new_messages_per_element(messages, fixture["channel_url"], [], limit=None)
+    results["per_element"] = (len(per_element), time.perf_counter() - started, counter.calls - calls,
+                              [data for _, _, data in per_element])
+
+    started, calls = time.perf_counter(), counter.calls
+    parts = []
+    count = await messages.count()
+    for i in range(count):
+        element = messages.nth(i)
+        parts.append({
+            "author": await extraction.extract_message_author(element),
+            "embed": await extraction.extract_embed_data(element)
+        })
+    results["author+embed"] = (count, time.perf_counter() - started, counter.calls - calls, parts)
+    return results
+
+
+def diff_golden(golden_dir, fixture, path_name, output, update):
+    golden_path = os.path.join(golden_dir, f"{fixture['name']}.{path_name}.json")
+    current = json.dumps(strip_volatile(output), indent=2, sort_keys=True, ensure_ascii=False)
+    if update or not os.path.exists(golden_path):
+        os.makedirs(golden_dir, exist_ok=True)
+        with open(golden_path, 'w', encoding='utf-8') as f:
+            f.write(current)
+        return None
+    with open(golden_path, 'r', encoding='utf-8') as f:
+        expected = f.read()
+    if expected == current:
+        return None
+    return "".join(difflib.unified_diff(
+        expected.splitlines(True), current.splitlines(True),
+        fromfile=f"golden/{os.path.basename(golden_path)}", tofile="current", n=2
+    ))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Offline Discord extraction benchmark")
+    parser.add_argument("--fixtures", default=DATA_DIR, help="Directory with *_inspection_*.html files")
+    parser.add_argument("--golden", default=os.path.join(DATA_DIR, "extraction_golden"))
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per fixture")
+    parser.add_argument("--update-golden", action="store_true")
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures)
+    if not fixtures:
+        print(f"No fixtures in {args.fixtures} - run the archiver with DEBUG=true to collect some")
+        return 1
+
+    async def no_delay(*_args, **_kwargs):
+        return None
+    extraction.smart_delay = no_delay
+
+    totals = {}  # {path: [messages, seconds, calls]}
+    diffs = []
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        page = await browser.new_page()
+        for fixture in fixtures:
+            await page.set_content(fixture["html"], wait_until="domcontentloaded")
+            for run in range(args.repeat):
+                for path_name, (count, seconds, calls, output) in (await run_paths(page, fixture)).items():
+                    total = totals.setdefault(path_name, [0, 0.0, 0])
+                    total[0] += count
+                    total[1] += seconds
+                    total[2] += calls
+                    if run == 0:
+                        diff = diff_golden(args.golden, fixture, path_name, output, args.update_golden)
+                        if diff:
+                            diffs.append((fixture["name"], path_name, diff))
+        await browser.close()
+
+    print(f"\n{'=' * 78}")
+    print(f"EXTRACTION BENCHMARK: {len(fixtures)} fixture(s) x {args.repeat} run(s)")
+    print(f"{'=' * 78}")
+    print(f"{'path':<28}{'items':>8}{'seconds':>10}{'items/sec':>12}{'calls/item':>14}")
+    for path_name, (count, seconds, calls) in totals.items():
+        rate = count / seconds if seconds else 0
+        per_item = f"{calls / count:.1f}" if count and BENCH_COUNTER.available else "n/a"
+        print(f"{path_name:<28}{count:>8}{seconds:>10.3f}{rate:>12.1f}{per_item:>14}")
+
+    if args.update_golden:
+        print(f"\n💾 Golden files written to {args.golden}")
+    elif diffs:
+        print(f"\n❌ {len(diffs)} output(s) differ from golden:")
+        for name, path_name, diff in diffs:
+            print(f"\n--- {name} [{path_name}] ---\n{diff}")
+        return 1
+    else:
+        print("\n✅ All outputs match golden")
+    return 0
+
+
+BENCH_COUNTER = ProtocolCallCounter()
+
+if __name__ == "__main__":
+    BENCH_COUNTER.install()
+    sys.exit(asyncio.run(main()))
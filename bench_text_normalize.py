@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Differential check and benchmark for text_normalize.py.
+
+The previous per-service implementations are kept below verbatim as the reference. Every
+text of the corpus is run through both; any difference is printed and the script exits 1.
+Corpus:
+  - a generated corpus mixing the alert phrases, near-misses of them, mentions, markdown
+    links, control characters and Unicode whitespace (seeded, --generated N texts)
+  - optionally real rows: a JSON list of discord_messages (e.g. a REST export) via
+    --messages; content, embed title/description/fields/footer are used
+
+Reported per function: reference and new time for the whole corpus and the speed-up.
+
+Usage:
+  python bench_text_normalize.py [--messages export.json] [--generated 20000] [--repeat 5] [--seed 1]
+"""
+
+import argparse
+import json
+import random
+import re
+import sys
+import time
+
+import text_normalize
+
+PHRASES_TO_REMOVE = list(text_normalize.PHRASES_TO_REMOVE)
+REGEX_PATTERNS_TO_REMOVE = list(text_normalize.REGEX_PATTERNS_TO_REMOVE)
+
+
+# --- Reference implementations (as they were in each service) ---
+def ref_sanitize_text(text: str, max_length: int = 2000) -> str:
+    if not text:
+        return ""
+    text = str(text)
+    text = text.replace('\x00', '')
+    text = text.replace('\r', ' ')
+    text = text.replace('\n', ' ')
+    text = text.replace('\t', ' ')
+    text = ''.join(char for char in text if ord(char) >= 32 and ord(char) != 127)
+    text = ' '.join(text.split())
+    if len(text) > max_length:
+        text = text[:max_length]
+    return text.strip()
+
+
+def ref_ascii_text(text):
+    if not text: return ""
+    text = str(text).replace('\x00', '')
+    return ' '.join(text.split()).encode('ascii', 'ignore').decode('ascii')
+
+
+def ref_clean_alert_text(text: str) -> str:
+    if not text:
+        return text
+    text = re.sub(r'\[([^\]]+)\]\((https?://[^\)]+)\)', r'\1', text)
+    for phrase in PHRASES_TO_REMOVE:
+        text = re.sub(re.escape(phrase), "", text, flags=re.IGNORECASE)
+    for pattern in REGEX_PATTERNS_TO_REMOVE:
+        text = re.sub(pattern, "", text, flags=re.IGNORECASE)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text
+
+
+def ref_signature_text(text: str) -> str:
+    if not text: return ""
+    text = re.sub(r'<@&?\d+>|<#\d+>', '', text)
+    text = re.sub(r'@[A-Za-z0-9_]+\b', '', text)
+    text = text.replace('|', '').replace('[', '').replace(']', '')
+    return " ".join(text.lower().split()).strip()
+
+
+def ref_display_text(text: str) -> str:
+    if not text: return ""
+    text = re.sub(r'<@&?\d+>|<#\d+>', '', text)
+    text = re.sub(r'^[ \t]*@[A-Za-z0-9_ ]+([|:-]|$)', '', text)
+    text = re.sub(r'@[A-Za-z0-9_]+\b', '', text)
+    text = text.strip().strip('|').strip(':').strip('-').strip()
+    return text
+
+
+PAIRS = [
+    ("sanitize_text", ref_sanitize_text, text_normalize.sanitize_text),
+    ("ascii_text", ref_ascii_text, text_normalize.ascii_text),
+    ("clean_alert_text", ref_clean_alert_text, text_normalize.clean_alert_text),
+    ("signature_text", ref_signature_text, text_normalize.signature_text),
+    ("display_text", ref_display_text, text_normalize.display_text),
+]
+
+
+# --- Corpus ---
+WORDS = ["Nike", "Dunk", "Low", "Retro", "Price", "£129.99", "$59", "(-32%)", "Argos", "Instore",
+         "restock", "Size", "UK", "10", "|", ":", "-", "[", "]", "(", ")", "@", "<", ">", "#",
+         "x", "v2.0.0", "Today", "at", "10:42", "PM", "[12:00:00]", "www", ".com", "café", "🔥"]
+SPACES = [" ", "  ", "\t", "\n", "\r\n", "\x00", "\x07", "\x1f", "\x7f", "\xa0", " ", "　", "\x85", ""]
+SPECIALS = PHRASES_TO_REMOVE + [
+    "Monitors v1.2 | CCN x Zephyr Monitors [10:11:12]", " | CCN x Zephyr Monitors [footer] trailing",
+    "Today at 9:05 am", "Experimental  software.  AI can be inaccurate,  DYOR!", "<@123456>", "<@&987>",
+    "<#555>", "@everyone", "@Role_1", "[Buy here](https://example.com/p?id=1)", "[x](http://a.b)",
+    "CC", "N", "Crep", "ChiefNotify", "@Unfil", "tered", "Zephyr", "ccn", "crepchiefnotify",
+]
+
+
+def random_text(rng: random.Random) -> str:
+    parts = []
+    for _ in range(rng.randint(0, 14)):
+        roll = rng.random()
+        if roll < 0.2:
+            special = rng.choice(SPECIALS)
+            parts.append(special.upper() if rng.random() < 0.1 else special)
+        elif roll < 0.3:
+            # Phrase split by another phrase, so a removal joins a new match
+            phrase = rng.choice(PHRASES_TO_REMOVE)
+            cut = rng.randint(1, max(1, len(phrase) - 1))
+            parts.append(phrase[:cut] + rng.choice(PHRASES_TO_REMOVE) + phrase[cut:])
+        else:
+            parts.append(rng.choice(WORDS))
+        parts.append(rng.choice(SPACES))
+    if rng.random() < 0.1:
+        parts.insert(0, rng.choice(["@Role |", " @Some Role:", "@x -", "\t@a_b"]))
+    return "".join(parts)
+
+
+def message_texts(path: str):
+    with open(path, 'r', encoding='utf-8') as f:
+        rows = json.load(f)
+    for row in rows:
+        yield row.get("content") or ""
+        raw = row.get("raw_data") or {}
+        embed = raw.get("embed") or {}
+        yield embed.get("title") or ""
+        yield embed.get("description") or ""
+        footer = embed.get("footer")
+        yield (footer.get("text") if isinstance(footer, dict) else footer) or ""
+        for field in embed.get("fields") or []:
+            yield field.get("name") or ""
+            yield field.get("value") or ""
+
+
+def build_corpus(args):
+    rng = random.Random(args.seed)
+    corpus = [random_text(rng) for _ in range(args.generated)]
+    corpus += ["", None, "   ", "\x00", "".join(chr(c) for c in range(0x3100))]
+    if args.messages:
+        corpus += list(message_texts(args.messages))
+    return corpus
+
+
+# --- Runs ---
+def check(corpus) -> int:
+    mismatches = 0
+    for name, ref, new in PAIRS:
+        for text in corpus:
+            expected, actual = ref(text), new(text)
+            if expected != actual:
+                mismatches += 1
+                if mismatches <= 20:
+                    print(f"MISMATCH {name}: {text!r}\n  reference: {expected!r}\n  new:       {actual!r}")
+    return mismatches
+
+
+def timed(fn, corpus, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for text in corpus:
+            fn(text)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", help="JSON list of discord_messages rows")
+    parser.add_argument("--generated", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args)
+    print(f"Corpus: {len(corpus)} texts")
+    mismatches = check(corpus)
+    print(f"Differential check: {'OK' if not mismatches else f'{mismatches} mismatch(es)'}")
+
+    print(f"{'function':<18} {'reference':>12} {'new':>12} {'speed-up':>9}")
+    for name, ref, new in PAIRS:
+        ref_time = timed(ref, corpus, args.repeat)
+        new_time = timed(new, corpus, args.repeat)
+        print(f"{name:<18} {ref_time * 1000:>10.1f}ms {new_time * 1000:>10.1f}ms {ref_time / new_time:>8.2f}x")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
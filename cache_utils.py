@@ -164,36 +164,39 @@ class ProductListCache:
     """
     
     def __init__(self, ttl_seconds: int = 60, max_products_per_entry: int = 5000):
-        self.cache: Dict[str, tuple[List[Dict], datetime, int, bool]] = {}  # key -> (products, timestamp, next_sql_offset, db_end_reached)
+        self.cache: Dict[str, tuple[List[Dict], datetime, Any, bool]] = {}  # key -> (products, timestamp, scan_position, db_end_reached)
         self.ttl_seconds = ttl_seconds
         self.max_products_per_entry = max_products_per_entry
         self.hits = 0
         self.misses = 0
     
-    def get(self, key: str) -> Optional[tuple[List[Dict], int, bool]]:
-        """Get cached product list. Returns (products, next_sql_offset, db_end_reached)"""
+    def get(self, key: str) -> Optional[tuple[List[Dict], Any, bool]]:
+        """Get cached product list. Returns (products, scan_position, db_end_reached)"""
         if key in self.cache:
-            products, timestamp, next_sql_offset, db_end_reached = self.cache[key]
+            products, timestamp, scan_position, db_end_reached = self.cache[key]
             age = (datetime.now(timezone.utc) - timestamp).total_seconds()
             if age < self.ttl_seconds:
                 self.hits += 1
-                return products, next_sql_offset, db_end_reached
+                return products, scan_position, db_end_reached
             else:
                 del self.cache[key]
         
         self.misses += 1
         return None
     
-    def set(self, key: str, products: List[Dict], next_sql_offset: int, db_end_reached: bool):
-        """Store complete product list with metadata"""
+    def set(self, key: str, products: List[Dict], scan_position: Any, db_end_reached: bool):
+        """
+        Store complete product list with metadata. scan_position is where the DB scan
+        continues - the (scraped_at, id) keyset of the last scanned row.
+        """
         # Limit products to prevent memory issues
         if len(products) > self.max_products_per_entry:
             print(f"[CACHE] Warning: Truncating {len(products)} products to {self.max_products_per_entry}")
             products = products[:self.max_products_per_entry]
         
-        self.cache[key] = (products, datetime.now(timezone.utc), next_sql_offset, db_end_reached)
+        self.cache[key] = (products, datetime.now(timezone.utc), scan_position, db_end_reached)
         status = "END REACHED" if db_end_reached else "PARTIAL"
-        print(f"[CACHE] Stored {len(products)} products (Next SQL Offset: {next_sql_offset}, Status: {status})")
+        print(f"[CACHE] Stored {len(products)} products (Scan position: {scan_position}, Status: {status})")
     
     def invalidate(self, pattern: Optional[str] = None):
         """Invalidate cache entries"""
@@ -233,7 +236,7 @@ class ProductListCache:
         valid_entries = 0
         total_products = 0
         
-        for key, (products, timestamp, next_sql_offset, db_end_reached) in self.cache.items():
+        for key, (products, timestamp, scan_position, db_end_reached) in self.cache.items():
             age = (now - timestamp).total_seconds()
             if age < self.ttl_seconds:
                 valid_entries += 1
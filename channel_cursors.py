@@ -0,0 +1,209 @@
+"""
+channel_cursors.py - Per-channel high-water marks for the archiver
+
+Replaces last_message_ids.json (200 IDs per channel in a list, rewritten after every batch):
+1. Discord IDs are time-ordered snowflakes, so each channel keeps a high-water mark (HWM);
+   anything at or below it has already been archived
+2. A small bounded recent set per channel catches non-numeric IDs and out-of-order arrivals
+3. Every membership check is O(1); every batch writes only the new IDs to SQLite
+4. A compact JSON snapshot is mirrored to Supabase Storage on a timer so a fresh container
+   can restore its cursors without rescanning
+5. A bounded message_id -> content_hash index per channel lets visible messages be rehashed
+   on every visit so edits are detected (not mirrored - it rebuilds itself from the page)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+RECENT_IDS_PER_CHANNEL = 200
+MIRROR_INTERVAL_SECONDS = 300
+
+
+class ChannelCursorStore:
+    """SQLite-backed HWM + recent-ID store, cached in memory"""
+
+    def __init__(self, db_path: str, recent_size: int = RECENT_IDS_PER_CHANNEL):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.db_path = db_path
+        self.recent_size = recent_size
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS hwm (channel TEXT PRIMARY KEY, msg_id TEXT NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS recent ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, msg_id TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS recent_channel ON recent (channel, seq)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            "channel TEXT NOT NULL, msg_id TEXT NOT NULL, content_hash TEXT NOT NULL, "
+            "edits INTEGER NOT NULL DEFAULT 0, seen_at REAL NOT NULL, PRIMARY KEY (channel, msg_id))"
+        )
+
+        self.hwm: Dict[str, int] = {}
+        self.recent: Dict[str, "OrderedDict[str, None]"] = {}
+        self.hashes: Dict[str, "OrderedDict[str, Tuple[str, int]]"] = {}  # {channel: {msg_id: (hash, edits)}}
+        self.dirty = False
+        self.last_mirror = time.time()
+        self._load()
+
+    def _load(self):
+        for channel, msg_id in self._conn.execute("SELECT channel, msg_id FROM hwm"):
+            self.hwm[channel] = int(msg_id)
+        for channel, msg_id in self._conn.execute("SELECT channel, msg_id FROM recent ORDER BY seq"):
+            self._remember(channel, msg_id)
+        for channel, msg_id, content_hash, edits in self._conn.execute(
+            "SELECT channel, msg_id, content_hash, edits FROM hashes ORDER BY seen_at"
+        ):
+            self.hashes.setdefault(channel, OrderedDict())[msg_id] = (content_hash, edits)
+
+    def is_empty(self) -> bool:
+        return not self.hwm and not self.recent
+
+    def _remember(self, channel: str, msg_id: str):
+        ids = self.recent.setdefault(channel, OrderedDict())
+        ids[msg_id] = None
+        ids.move_to_end(msg_id)
+        while len(ids) > self.recent_size:
+            ids.popitem(last=False)
+
+    # --- Reads ---
+    def high_water_mark(self, channel: str) -> Optional[int]:
+        return self.hwm.get(channel)
+
+    def is_seen(self, channel: str, msg_id: str) -> bool:
+        msg_id = str(msg_id)
+        if msg_id in self.recent.get(channel, ()):
+            return True
+        hwm = self.hwm.get(channel)
+        return hwm is not None and msg_id.isdigit() and int(msg_id) <= hwm
+
+    def recent_ids(self, channel: str) -> List[str]:
+        return list(self.recent.get(channel, ()))
+
+    # --- Writes ---
+    def record(self, channel: str, msg_ids: Iterable[str], advance_hwm: bool = True):
+        """
+        Mark IDs as archived. Writes only the new IDs (and the HWM if it moved).
+        advance_hwm=False keeps the HWM where it is (an unclosed gap below these IDs),
+        so the IDs only land in the recent set and the gap is looked for again.
+        """
+        new_ids = [str(m) for m in msg_ids if m and str(m) not in self.recent.get(channel, ())]
+        if not new_ids:
+            return
+        numeric = [int(m) for m in new_ids if m.isdigit()] if advance_hwm else []
+        new_hwm = max(numeric) if numeric else None
+        moved = new_hwm is not None and new_hwm > self.hwm.get(channel, -1)
+
+        for msg_id in new_ids:
+            self._remember(channel, msg_id)
+        if moved:
+            self.hwm[channel] = new_hwm
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("INSERT INTO recent (channel, msg_id) VALUES (?, ?)", [(channel, m) for m in new_ids])
+            if moved:
+                self._conn.execute("INSERT OR REPLACE INTO hwm (channel, msg_id) VALUES (?, ?)", (channel, str(new_hwm)))
+            # Keep the table bounded the same way as the in-memory set
+            self._conn.execute(
+                "DELETE FROM recent WHERE channel = ? AND seq NOT IN "
+                "(SELECT seq FROM recent WHERE channel = ? ORDER BY seq DESC LIMIT ?)",
+                (channel, channel, self.recent_size)
+            )
+            self._conn.execute("COMMIT")
+        self.dirty = True
+
+    def advance_hwm(self, channel: str, msg_id) -> bool:
+        """Move the HWM up to msg_id (never down), e.g. past a gap that can't be closed"""
+        msg_id = str(msg_id)
+        if not msg_id.isdigit() or int(msg_id) <= self.hwm.get(channel, -1):
+            return False
+        self.hwm[channel] = int(msg_id)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO hwm (channel, msg_id) VALUES (?, ?)", (channel, msg_id))
+        self.dirty = True
+        return True
+
+    # --- Content hash index (edit detection) ---
+    def content_hash(self, channel: str, msg_id: str) -> Optional[str]:
+        entry = self.hashes.get(channel, {}).get(str(msg_id))
+        return entry[0] if entry else None
+
+    def record_hashes(self, channel: str, entries: Iterable[Tuple[str, str]], edited: bool = False) -> Dict[str, int]:
+        """
+        Store (msg_id, content_hash) pairs. With edited=True each message's edit counter is
+        incremented. Returns {msg_id: edit_count}.
+        """
+        hashes = self.hashes.setdefault(channel, OrderedDict())
+        now = time.time()
+        rows, counts = [], {}
+        for msg_id, content_hash in entries:
+            msg_id = str(msg_id)
+            edits = hashes.get(msg_id, (None, 0))[1] + (1 if edited else 0)
+            hashes[msg_id] = (content_hash, edits)
+            hashes.move_to_end(msg_id)
+            rows.append((channel, msg_id, content_hash, edits, now))
+            counts[msg_id] = edits
+        evicted = []
+        while len(hashes) > self.recent_size:
+            evicted.append((channel, hashes.popitem(last=False)[0]))
+        if rows:
+            with self._lock:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO hashes (channel, msg_id, content_hash, edits, seen_at) VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+                self._conn.executemany("DELETE FROM hashes WHERE channel = ? AND msg_id = ?", evicted)
+                self._conn.execute("COMMIT")
+        return counts
+
+    # --- Snapshots (Supabase mirror / legacy import) ---
+    def snapshot(self) -> Dict[str, Any]:
+        channels = set(self.hwm) | set(self.recent)
+        return {
+            channel: {"hwm": str(self.hwm[channel]) if channel in self.hwm else None, "recent": self.recent_ids(channel)}
+            for channel in channels
+        }
+
+    def load_snapshot(self, data: Dict[str, Any]) -> int:
+        """
+        Merge a snapshot into the store. Accepts both the mirrored format
+        ({url: {"hwm": "...", "recent": [...]}}) and legacy last_message_ids.json ({url: [ids]}).
+        """
+        for channel, entry in (data or {}).items():
+            if isinstance(entry, list):
+                ids = entry
+            else:
+                ids = list(entry.get("recent") or [])
+                if entry.get("hwm"):
+                    ids.append(str(entry["hwm"]))
+            self.record(channel, ids)
+        return len(data or {})
+
+    def mirror_due(self) -> bool:
+        return self.dirty and time.time() - self.last_mirror > MIRROR_INTERVAL_SECONDS
+
+    def write_snapshot(self, path: str) -> str:
+        with open(path, "w") as f:
+            json.dump(self.snapshot(), f)
+        self.dirty = False
+        self.last_mirror = time.time()
+        return path
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "channels": len(set(self.hwm) | set(self.recent)),
+            "recent_ids": sum(len(ids) for ids in self.recent.values()),
+            "hashed_messages": sum(len(h) for h in self.hashes.values()),
+            "dirty": self.dirty,
+            "last_mirror": self.last_mirror
+        }
@@ -0,0 +1,271 @@
+"""
+channel_leases.py - Channel leases for running several archiver workers side by side
+
+Each worker (own Discord session, own storage_state) only scans channels it holds a lease on:
+1. A lease is a time-limited row (channel, worker_id, expires_at); a heartbeat renews it
+2. A lease whose worker stopped renewing expires and is taken over by a live worker
+3. Every worker claims up to its fair share (channels / live workers) and releases the
+   excess when another worker joins, so the channel list shards itself with no double-scraping
+4. The lease row carries the channel's high-water mark, so a worker taking a channel over
+   continues from where the previous holder stopped
+
+Backends:
+- SupabaseLeaseBackend: channel_leases table shared by every node (see schema.sql)
+- SQLiteLeaseBackend: a local file - stand-in for several workers on one host / development
+
+Lease expiry uses each worker's wall clock, so nodes need roughly synchronized clocks
+(NTP); LEASE_TTL_SECONDS is kept generous relative to any expected skew.
+"""
+
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import supabase_utils
+
+LEASE_TTL_SECONDS = 600
+HEARTBEAT_FRACTION = 3          # Renew every TTL / 3
+PRESENCE_PREFIX = "worker:"     # Presence rows let a worker with no leases yet count as live
+
+
+class SQLiteLeaseBackend:
+    """Leases in a local SQLite file. Every claim/renew is a single conditional UPDATE."""
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS channel_leases ("
+            "channel TEXT PRIMARY KEY, worker_id TEXT NOT NULL DEFAULT '', "
+            "expires_at REAL NOT NULL DEFAULT 0, hwm TEXT)"
+        )
+
+    def fetch_all(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT channel, worker_id, expires_at, hwm FROM channel_leases").fetchall()
+        return [{"channel": c, "worker_id": w, "expires_at": e, "hwm": h} for c, w, e, h in rows]
+
+    def try_claim(self, channel: str, worker_id: str, expires_at: float, now: float) -> Tuple[bool, Optional[str]]:
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO channel_leases (channel) VALUES (?)", (channel,))
+            cur = self._conn.execute(
+                "UPDATE channel_leases SET worker_id = ?, expires_at = ? "
+                "WHERE channel = ? AND (worker_id = ? OR expires_at < ?)",
+                (worker_id, expires_at, channel, worker_id, now)
+            )
+            if cur.rowcount != 1:
+                return False, None
+            row = self._conn.execute("SELECT hwm FROM channel_leases WHERE channel = ?", (channel,)).fetchone()
+        return True, row[0] if row else None
+
+    def renew_all(self, worker_id: str, expires_at: float) -> Set[str]:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE channel_leases SET expires_at = ? WHERE worker_id = ? AND expires_at > 0",
+                (expires_at, worker_id)
+            )
+            rows = self._conn.execute(
+                "SELECT channel FROM channel_leases WHERE worker_id = ? AND expires_at = ?", (worker_id, expires_at)
+            ).fetchall()
+        return {r[0] for r in rows}
+
+    def set_hwm(self, channel: str, worker_id: str, hwm: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE channel_leases SET hwm = ? WHERE channel = ? AND worker_id = ?", (hwm, channel, worker_id)
+            )
+
+    def release(self, channels: Iterable[str], worker_id: str):
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE channel_leases SET expires_at = 0 WHERE channel = ? AND worker_id = ?",
+                [(c, worker_id) for c in channels]
+            )
+
+
+class SupabaseLeaseBackend:
+    """Leases in the channel_leases table via PostgREST. A claim is one conditional PATCH."""
+
+    def __init__(self, timeout: int = 10):
+        self.timeout = timeout
+
+    def _request(self, method: str, params: Dict[str, str], payload=None, prefer: str = "return=minimal"):
+        url, key = supabase_utils.get_supabase_config()
+        headers = {
+            'apikey': key,
+            'Authorization': f'Bearer {key}',
+            'Content-Type': 'application/json',
+            'Prefer': prefer
+        }
+        response = supabase_utils.get_http_session().request(
+            method, f"{url}/rest/v1/channel_leases",
+            headers=headers, params=params, json=payload, timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json() if "return=representation" in prefer or method == "GET" else None
+
+    def fetch_all(self) -> List[Dict[str, Any]]:
+        return self._request("GET", {"select": "channel,worker_id,expires_at,hwm"})
+
+    def try_claim(self, channel: str, worker_id: str, expires_at: float, now: float) -> Tuple[bool, Optional[str]]:
+        self._request(
+            "POST", {"on_conflict": "channel"},
+            {"channel": channel, "worker_id": "", "expires_at": 0},
+            prefer="resolution=ignore-duplicates,return=minimal"
+        )
+        rows = self._request(
+            "PATCH",
+            {"channel": f"eq.{channel}", "or": f'(worker_id.eq."{worker_id}",expires_at.lt.{now})'},
+            {"worker_id": worker_id, "expires_at": expires_at},
+            prefer="return=representation"
+        )
+        if not rows:
+            return False, None
+        return True, rows[0].get("hwm")
+
+    def renew_all(self, worker_id: str, expires_at: float) -> Set[str]:
+        rows = self._request(
+            "PATCH", {"worker_id": f"eq.{worker_id}", "expires_at": "gt.0"},
+            {"expires_at": expires_at}, prefer="return=representation"
+        )
+        return {r["channel"] for r in rows or []}
+
+    def set_hwm(self, channel: str, worker_id: str, hwm: str):
+        self._request("PATCH", {"channel": f"eq.{channel}", "worker_id": f"eq.{worker_id}"}, {"hwm": hwm})
+
+    def release(self, channels: Iterable[str], worker_id: str):
+        for channel in channels:
+            self._request("PATCH", {"channel": f"eq.{channel}", "worker_id": f"eq.{worker_id}"}, {"expires_at": 0})
+
+
+class ChannelLeaseManager:
+    """Keeps this worker's share of channel leases claimed, renewed and balanced"""
+
+    def __init__(self, backend, worker_id: str, ttl: float = LEASE_TTL_SECONDS):
+        self.backend = backend
+        self.worker_id = worker_id
+        self.ttl = ttl
+        self.presence = f"{PRESENCE_PREFIX}{worker_id}"
+        self.held: Set[str] = set()
+        # The heartbeat thread and rebalance (run in a worker thread) both rewrite held;
+        # each runs whole under the lock so a renewal never races a claim or a release
+        self._lock = threading.RLock()
+        self.synced_hwm: Dict[str, str] = {}
+        self._thread = None
+        self.live_workers = 1
+        self.stats = {"claims": 0, "takeovers": 0, "releases": 0, "lost": 0, "errors": 0}
+
+    # --- Balancing (called from the archiver loop) ---
+    def rebalance(self, channels: List[str], cursors) -> List[str]:
+        """
+        Claim free/expired channels up to the fair share and release the excess.
+        Returns the subset of channels this worker should scan.
+        """
+        with self._lock:
+            return self._rebalance(channels, cursors)
+
+    def _rebalance(self, channels: List[str], cursors) -> List[str]:
+        now = time.time()
+        expires_at = now + self.ttl
+        self.backend.try_claim(self.presence, self.worker_id, expires_at, now)
+        rows = {r["channel"]: r for r in self.backend.fetch_all()}
+
+        live = {r["worker_id"] for r in rows.values() if r["worker_id"] and r["expires_at"] > now}
+        live.add(self.worker_id)
+        self.live_workers = len(live)
+        share = math.ceil(len(channels) / self.live_workers) if channels else 0
+
+        enabled = set(channels)
+        mine = [c for c in channels if c in rows and rows[c]["worker_id"] == self.worker_id and rows[c]["expires_at"] > now]
+        excess = [c for c in self.held if c not in enabled] + mine[share:]
+        if excess:
+            self._release(excess, cursors)
+            mine = mine[:share]
+
+        free = [c for c in channels if c not in rows or rows[c]["expires_at"] <= now]
+        random.shuffle(free)
+        for channel in free:
+            if len(mine) >= share:
+                break
+            claimed, hwm = self.backend.try_claim(channel, self.worker_id, expires_at, now)
+            if not claimed:
+                continue
+            self.stats["claims"] += 1
+            previous = rows.get(channel, {})
+            if previous.get("worker_id") not in (None, "", self.worker_id) and previous.get("expires_at"):
+                # Expired rather than released: its worker died
+                self.stats["takeovers"] += 1
+            if hwm:
+                # Continue from the previous holder's high-water mark
+                cursors.record(channel, [hwm])
+                self.synced_hwm[channel] = str(hwm)
+            mine.append(channel)
+
+        self.held = set(mine)
+        return mine
+
+    def holds(self, channel: str) -> bool:
+        return channel in self.held
+
+    # --- Heartbeat ---
+    def heartbeat(self, cursors):
+        """Renew every held lease and publish high-water marks that moved"""
+        with self._lock:
+            self._heartbeat(cursors)
+
+    def _heartbeat(self, cursors):
+        renewed = self.backend.renew_all(self.worker_id, time.time() + self.ttl)
+        lost = self.held - renewed
+        if lost:
+            self.stats["lost"] += len(lost)
+            self.held -= lost
+        for channel in list(self.held):
+            hwm = cursors.high_water_mark(channel)
+            if hwm is not None and self.synced_hwm.get(channel) != str(hwm):
+                self.backend.set_hwm(channel, self.worker_id, str(hwm))
+                self.synced_hwm[channel] = str(hwm)
+
+    def start_heartbeat(self, cursors, stop_event: threading.Event):
+        if self._thread and self._thread.is_alive():
+            return
+
+        def run():
+            while not stop_event.wait(self.ttl / HEARTBEAT_FRACTION):
+                try:
+                    self.heartbeat(cursors)
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    print(f"[LEASE] Heartbeat failed: {e}")
+
+        self._thread = threading.Thread(target=run, daemon=True, name="ChannelLeaseHeartbeat")
+        self._thread.start()
+
+    def _release(self, channels: List[str], cursors):
+        """Callers hold the lock"""
+        for channel in channels:
+            hwm = cursors.high_water_mark(channel)
+            if hwm is not None:
+                self.backend.set_hwm(channel, self.worker_id, str(hwm))
+        self.backend.release(channels, self.worker_id)
+        self.held -= set(channels)
+        self.stats["releases"] += len(channels)
+
+    def release_all(self, cursors):
+        """Hand every lease back (clean shutdown) so other workers pick them up immediately"""
+        with self._lock:
+            self._release(list(self.held), cursors)
+            self.backend.release([self.presence], self.worker_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "worker_id": self.worker_id,
+            "held": len(self.held),
+            "live_workers": self.live_workers
+        }
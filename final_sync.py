@@ -1,7 +1,7 @@
 import os
 import json
-import requests
 from dotenv import load_dotenv
+import supabase_utils
 
 load_dotenv()
 
@@ -71,7 +71,7 @@ def sync():
         # Send in batches of 50 to be safe
         for i in range(0, len(sql_categories), 50):
             batch = sql_categories[i:i+50]
-            response = requests.post(endpoint, headers=headers, json=batch, timeout=30)
+            response = supabase_utils.get_http_session().post(endpoint, headers=headers, json=batch, timeout=30)
             if response.status_code in [200, 201, 204]:
                 print(f"   ✅ Batch {i//50 + 1} synced")
             else:
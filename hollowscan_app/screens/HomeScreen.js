@@ -74,6 +74,7 @@ const HomeScreen = () => {
     const [isRefreshing, setIsRefreshing] = useState(false);
     const [isLoadingMore, setIsLoadingMore] = useState(false);
     const [offset, setOffset] = useState(0);
+    const [cursor, setCursor] = useState(null); // next_cursor of the last page (stable under new arrivals)
     const [hasMore, setHasMore] = useState(true);
     // REMOVED Local isPremium state - using context userIsPremium Instead
     const [totalAvailable, setTotalAvailable] = useState(0);
@@ -255,6 +256,7 @@ const HomeScreen = () => {
     const fetchInitialData = async (forceRefresh = false) => {
         setIsLoading(true);
         setOffset(0);
+        setCursor(null);
         setHasMore(true);
 
         await Promise.all([
@@ -302,6 +304,10 @@ const HomeScreen = () => {
                 url += `&force_refresh=true`;
             }
 
+            if (!reset && cursor) {
+                url += `&cursor=${encodeURIComponent(cursor)}`;
+            }
+
             const response = await fetch(url);
             if (!response.ok) throw new Error('Fetch failed');
 
@@ -326,6 +332,7 @@ const HomeScreen = () => {
                     });
                 }
                 setOffset(nextOffset);
+                setCursor(result.next_cursor || null);
                 setHasMore(data.length === LIMIT || (result.has_more !== undefined ? result.has_more : data.length > 0));
             } else {
                 setHasMore(false);
@@ -0,0 +1,263 @@
+"""
+ingest_spool.py - Durable write-ahead spool for discord_messages ingestion
+
+The archiver enqueues scraped rows here instead of POSTing them inline:
+1. enqueue() is a single local SQLite insert - it never waits on Supabase
+2. A background flusher thread drains the spool in adaptively sized batches
+3. Failed batches are retried with exponential backoff; nothing is deleted until
+   Supabase acknowledged it, so rows pending at shutdown are replayed on restart
+4. Rows rejected on their own (400/409/422 at batch size 1) go to a dead-letter table;
+   other 4xx (auth, rate limits) are treated like outages and backed off
+5. Edited messages are spooled as upserts (merge, original scraped_at kept) - a batch never
+   mixes kinds, and a row is only sent once every older row it depends on (DEPENDS_ON) has been
+6. With a derive_fn, the products rows derived from each message batch are spooled right
+   behind it (kinds 'product' / 'product_upsert') and flushed to the products table
+"""
+
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List
+
+import supabase_utils
+
+MIN_BATCH_SIZE = 1
+MAX_BATCH_SIZE = 100
+INITIAL_BATCH_SIZE = 20
+SLOW_BATCH_SECONDS = 5.0      # Shrink batches when a POST takes longer than this
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 300.0
+MAX_ATTEMPTS = 8              # Per-row attempts before a rejected row is dead-lettered
+REJECTED_STATUSES = (400, 409, 422)  # The row itself is bad; anything else is retried with backoff
+IDLE_POLL_SECONDS = 2.0
+
+# Kinds that must be flushed before any younger row of the given kind: an edit or a product
+# row never overtakes the message insert it belongs to, and a products upsert never overtakes
+# the products insert. Unrelated kinds are batched straight across the interleaving.
+DEPENDS_ON = {
+    "insert": ("upsert",),
+    "upsert": ("insert",),
+    "product": ("insert", "upsert", "product_upsert"),
+    "product_upsert": ("insert", "upsert", "product"),
+}
+
+
+class IngestSpool:
+    """SQLite-backed spool with a background batch flusher"""
+
+    def __init__(self, path: str, post_fn=None, derive_fn=None, product_post_fn=None):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.post_fn = post_fn or supabase_utils.post_discord_messages
+        # Optional pipeline stage: cleaned message rows -> products rows
+        self.derive_fn = derive_fn
+        self.product_post_fn = product_post_fn or supabase_utils.post_product_rows
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, enqueued_at REAL NOT NULL)"
+        )
+        if "kind" not in [row[1] for row in self._conn.execute("PRAGMA table_info(spool)")]:
+            self._conn.execute("ALTER TABLE spool ADD COLUMN kind TEXT NOT NULL DEFAULT 'insert'")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letter ("
+            "seq INTEGER PRIMARY KEY, payload TEXT NOT NULL, status INTEGER, failed_at REAL NOT NULL)"
+        )
+        if "kind" not in [row[1] for row in self._conn.execute("PRAGMA table_info(dead_letter)")]:
+            self._conn.execute("ALTER TABLE dead_letter ADD COLUMN kind TEXT NOT NULL DEFAULT 'insert'")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS spool_kind_seq ON spool (kind, seq)")
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.batch_size = INITIAL_BATCH_SIZE
+        self.backoff_until = 0.0
+        self.consecutive_failures = 0
+        self.enqueued = 0
+        self.upserts_enqueued = 0
+        self.products_enqueued = 0
+        self.flushed = 0
+        self.failed_batches = 0
+        self.dead_lettered = 0
+        self.last_error = None
+        self.last_flush_at = None
+
+    # --- Producer side ---
+    def enqueue(self, messages: List[Dict[str, Any]], upsert: bool = False) -> int:
+        """
+        Persist rows to the spool and wake the flusher. Returns rows accepted.
+        upsert=True merges into existing rows (edits) and leaves their scraped_at untouched.
+        """
+        kind = "upsert" if upsert else "insert"
+        cleaned_rows = []
+        for msg in messages:
+            try:
+                cleaned = supabase_utils.clean_discord_message(msg)
+            except Exception as e:
+                print(f"[SPOOL] Skipped message: {e}")
+                continue
+            if cleaned:
+                cleaned_rows.append(cleaned)
+        if not cleaned_rows:
+            return 0
+
+        product_rows = []
+        if self.derive_fn:
+            try:
+                product_rows = self.derive_fn(cleaned_rows)
+            except Exception as e:
+                print(f"[SPOOL] Product derivation failed: {e}")
+
+        now = time.time()
+        rows = []
+        for batch, batch_kind in ((cleaned_rows, kind), (product_rows, "product_" + kind if upsert else "product")):
+            for row in batch:
+                if upsert:
+                    row.pop("scraped_at", None)
+                rows.append((json.dumps(row, ensure_ascii=True), now, batch_kind))
+        with self._lock:
+            self._conn.executemany("INSERT INTO spool (payload, enqueued_at, kind) VALUES (?, ?, ?)", rows)
+        self.enqueued += len(cleaned_rows)
+        self.products_enqueued += len(product_rows)
+        if upsert:
+            self.upserts_enqueued += len(cleaned_rows)
+        self._wake.set()
+        return len(cleaned_rows)
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+
+    # --- Flusher ---
+    def start(self):
+        """Start the background flusher (idempotent). Pending rows from a previous run are replayed."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="IngestSpoolFlusher")
+        self._thread.start()
+        pending = self.pending()
+        if pending:
+            print(f"[SPOOL] Replaying {pending} pending message(s) from {self.path}")
+
+    def stop(self, timeout: float = 10.0):
+        """Stop the flusher after one last drain attempt"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            wait = self.backoff_until - time.time()
+            if wait > 0:
+                self._stop.wait(wait)
+                continue
+            try:
+                flushed_any = self.flush_once()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"[SPOOL] Flusher error: {e}")
+                flushed_any = False
+            if not flushed_any:
+                self._wake.wait(IDLE_POLL_SECONDS)
+                self._wake.clear()
+        # Best-effort final drain on shutdown
+        try:
+            while self.flush_once():
+                pass
+        except Exception:
+            pass
+
+    def flush_once(self) -> bool:
+        """Send one batch. Returns True if rows were acknowledged by Supabase."""
+        with self._lock:
+            head = self._conn.execute("SELECT kind FROM spool ORDER BY seq LIMIT 1").fetchone()
+            if head is None:
+                return False
+            kind = head[0]
+            # A full batch of the oldest row's kind, stopping short of the first pending row
+            # it depends on, so M,P,M,P enqueues still flush as one M batch then one P batch
+            deps = DEPENDS_ON.get(kind, tuple(k for k in DEPENDS_ON if k != kind))
+            bound = self._conn.execute(
+                f"SELECT MIN(seq) FROM spool WHERE kind IN ({', '.join('?' * len(deps))})", deps
+            ).fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT seq, payload, attempts FROM spool WHERE kind = ? AND seq < ? ORDER BY seq LIMIT ?",
+                (kind, bound if bound is not None else float("inf"), self.batch_size),
+            ).fetchall()
+
+        batch = [json.loads(payload) for _, payload, _ in rows]
+        post_fn = self.product_post_fn if kind.startswith("product") else self.post_fn
+        started = time.time()
+        status = post_fn(batch, merge=True) if kind.endswith("upsert") else post_fn(batch)
+        elapsed = time.time() - started
+        seqs = [(seq,) for seq, _, _ in rows]
+
+        if status in (200, 201, 204):
+            with self._lock:
+                self._conn.executemany("DELETE FROM spool WHERE seq = ?", seqs)
+            self.flushed += len(rows)
+            self.consecutive_failures = 0
+            self.last_flush_at = time.time()
+            # Grow while Supabase keeps up, shrink if it is getting slow
+            if elapsed > SLOW_BATCH_SECONDS:
+                self.batch_size = max(MIN_BATCH_SIZE, self.batch_size // 2)
+            elif len(rows) == self.batch_size:
+                self.batch_size = min(MAX_BATCH_SIZE, self.batch_size * 2)
+            return True
+
+        self.failed_batches += 1
+        self.last_error = f"HTTP {status}" if status else "network error"
+        with self._lock:
+            self._conn.executemany("UPDATE spool SET attempts = attempts + 1 WHERE seq = ?", seqs)
+
+        rejected = status in REJECTED_STATUSES
+        if rejected and len(rows) == 1 and rows[0][2] + 1 >= MAX_ATTEMPTS:
+            # A single row Supabase keeps rejecting: park it instead of blocking the queue
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO dead_letter (seq, payload, status, failed_at, kind) VALUES (?, ?, ?, ?, ?)",
+                    (rows[0][0], rows[0][1], status, time.time(), kind)
+                )
+                self._conn.execute("DELETE FROM spool WHERE seq = ?", (rows[0][0],))
+            self.dead_lettered += 1
+            print(f"[SPOOL] Dead-lettered {kind} row {rows[0][0]} (HTTP {status})")
+            return False
+
+        if rejected:
+            # Bisect towards the offending row; no need to wait
+            self.batch_size = max(MIN_BATCH_SIZE, len(rows) // 2)
+            return False
+
+        self.batch_size = max(MIN_BATCH_SIZE, self.batch_size // 2)
+        self.consecutive_failures += 1
+        delay = min(BACKOFF_MAX, BACKOFF_BASE ** self.consecutive_failures) * random.uniform(0.8, 1.2)
+        self.backoff_until = time.time() + delay
+        print(f"[SPOOL] Flush failed ({self.last_error}), retrying in {delay:.0f}s")
+        return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            dead = self._conn.execute("SELECT COUNT(*) FROM dead_letter").fetchone()[0]
+            pending = self._conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+        return {
+            "pending": pending,
+            "enqueued": self.enqueued,
+            "upserts_enqueued": self.upserts_enqueued,
+            "products_enqueued": self.products_enqueued,
+            "flushed": self.flushed,
+            "failed_batches": self.failed_batches,
+            "dead_letter": dead,
+            "batch_size": self.batch_size,
+            "backoff_seconds": max(0, round(self.backoff_until - time.time(), 1)),
+            "last_error": self.last_error,
+            "last_flush_at": self.last_flush_at
+        }
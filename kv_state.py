@@ -0,0 +1,467 @@
+"""
+kv_state.py - Versioned key-value store for state shared by the bot, API and archiver
+
+Replaces whole-file rewrites of bot_users.json / active_codes.json / potential_users.json /
+channels.json, where concurrent writers overwrote each other's changes:
+1. Every entry (e.g. one bot user) is its own row with a version number
+2. Writes are compare-and-swap on that version; on a conflict the row is re-read and the
+   pending change replayed on top of it, so two writers touching different fields of the
+   same entry both land
+3. Changes are queued as operations (set / field merge / delete) in a local write-behind
+   cache and flushed by a background thread after a short debounce
+4. refresh() compares versions first and fetches only the rows that changed
+5. A namespace with a legacy Storage JSON blob imports it once; a marker row in the
+   __migrated__ namespace (written with the import) records that, so a namespace that
+   later empties out (e.g. every active code redeemed) is not imported again
+
+Backends:
+- SupabaseKVBackend: kv_state table via PostgREST (see schema.sql). A CAS is one
+  conditional PATCH / DELETE (version=eq.N) or an insert that ignores duplicates
+- SQLiteKVBackend: a local file - several processes on one host / development
+"""
+
+import atexit
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import supabase_utils
+
+KV_BACKEND = os.getenv("KV_BACKEND", "supabase")
+KV_STATE_DB = os.getenv("KV_STATE_DB", os.path.join("data", "kv_state.db"))
+FLUSH_DELAY_SECONDS = float(os.getenv("KV_FLUSH_DELAY", "2"))  # Debounce between a change and its write
+MAX_CAS_ATTEMPTS = 5
+RETRY_DELAY_SECONDS = 10        # After a failed flush (network / server error)
+FETCH_CHUNK = 100               # Keys per in.(...) filter
+MIGRATIONS_NAMESPACE = "__migrated__"  # key = namespace whose legacy blob was imported
+
+
+class SQLiteKVBackend:
+    """kv_state in a local SQLite file. Every CAS is a single conditional statement."""
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv_state ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "version INTEGER NOT NULL, updated_at REAL NOT NULL, PRIMARY KEY (namespace, key))"
+        )
+
+    def fetch_versions(self, namespace: str) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT key, version FROM kv_state WHERE namespace = ?", (namespace,)).fetchall()
+        return dict(rows)
+
+    def fetch(self, namespace: str, keys: Optional[List[str]] = None) -> Dict[str, Tuple[Any, int]]:
+        with self._lock:
+            if keys is None:
+                rows = self._conn.execute(
+                    "SELECT key, value, version FROM kv_state WHERE namespace = ?", (namespace,)
+                ).fetchall()
+            else:
+                rows = []
+                for i in range(0, len(keys), FETCH_CHUNK):
+                    chunk = keys[i:i + FETCH_CHUNK]
+                    rows += self._conn.execute(
+                        f"SELECT key, value, version FROM kv_state WHERE namespace = ? AND key IN ({','.join('?' * len(chunk))})",
+                        (namespace, *chunk)
+                    ).fetchall()
+        return {k: (json.loads(v), ver) for k, v, ver in rows}
+
+    def cas(self, namespace: str, key: str, value: Any, expected_version: int) -> Optional[int]:
+        with self._lock:
+            if value is None:
+                cur = self._conn.execute(
+                    "DELETE FROM kv_state WHERE namespace = ? AND key = ? AND version = ?",
+                    (namespace, key, expected_version)
+                )
+                return 0 if cur.rowcount == 1 else None
+            if expected_version == 0:
+                cur = self._conn.execute(
+                    "INSERT OR IGNORE INTO kv_state (namespace, key, value, version, updated_at) VALUES (?, ?, ?, 1, ?)",
+                    (namespace, key, json.dumps(value), time.time())
+                )
+                return 1 if cur.rowcount == 1 else None
+            cur = self._conn.execute(
+                "UPDATE kv_state SET value = ?, version = version + 1, updated_at = ? "
+                "WHERE namespace = ? AND key = ? AND version = ?",
+                (json.dumps(value), time.time(), namespace, key, expected_version)
+            )
+            return expected_version + 1 if cur.rowcount == 1 else None
+
+    def insert_many(self, rows: List[Tuple[str, str, Any]]):
+        """Create every missing (namespace, key) at version 1 in one transaction (existing keys are kept)"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO kv_state (namespace, key, value, version, updated_at) VALUES (?, ?, ?, 1, ?)",
+                [(namespace, key, json.dumps(value), time.time()) for namespace, key, value in rows]
+            )
+            self._conn.execute("COMMIT")
+
+
+class SupabaseKVBackend:
+    """kv_state via PostgREST. A conflict shows up as zero rows returned."""
+
+    def __init__(self, timeout: int = 15):
+        self.timeout = timeout
+
+    def _request(self, method: str, params: Dict[str, str], payload=None, prefer: str = "return=representation"):
+        url, key = supabase_utils.get_supabase_config()
+        headers = {
+            'apikey': key,
+            'Authorization': f'Bearer {key}',
+            'Content-Type': 'application/json',
+            'Prefer': prefer
+        }
+        response = supabase_utils.get_http_session().request(
+            method, f"{url}/rest/v1/kv_state",
+            headers=headers, params=params, json=payload, timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json() if response.content else []
+
+    def fetch_versions(self, namespace: str) -> Dict[str, int]:
+        rows = self._request("GET", {"namespace": f"eq.{namespace}", "select": "key,version"})
+        return {r["key"]: r["version"] for r in rows}
+
+    def fetch(self, namespace: str, keys: Optional[List[str]] = None) -> Dict[str, Tuple[Any, int]]:
+        params = {"namespace": f"eq.{namespace}", "select": "key,value,version"}
+        if keys is None:
+            rows = self._request("GET", params)
+        else:
+            rows = []
+            for i in range(0, len(keys), FETCH_CHUNK):
+                quoted = ",".join('"' + k.replace('\\', '\\\\').replace('"', '\\"') + '"' for k in keys[i:i + FETCH_CHUNK])
+                rows += self._request("GET", {**params, "key": f"in.({quoted})"})
+        return {r["key"]: (r["value"], r["version"]) for r in rows}
+
+    def cas(self, namespace: str, key: str, value: Any, expected_version: int) -> Optional[int]:
+        match = {"namespace": f"eq.{namespace}", "key": f"eq.{key}", "version": f"eq.{expected_version}"}
+        if value is None:
+            return 0 if self._request("DELETE", match) else None
+        if expected_version == 0:
+            rows = self._request(
+                "POST", {"on_conflict": "namespace,key"},
+                {"namespace": namespace, "key": key, "value": value, "version": 1},
+                prefer="resolution=ignore-duplicates,return=representation"
+            )
+            return 1 if rows else None
+        rows = self._request(
+            "PATCH", match,
+            {"value": value, "version": expected_version + 1, "updated_at": datetime.now(timezone.utc).isoformat()}
+        )
+        return expected_version + 1 if rows else None
+
+    def insert_many(self, rows: List[Tuple[str, str, Any]]):
+        """Create every missing (namespace, key) at version 1 in one request (one statement, so all or nothing)"""
+        self._request(
+            "POST", {"on_conflict": "namespace,key"},
+            [{"namespace": namespace, "key": key, "value": value, "version": 1} for namespace, key, value in rows],
+            prefer="resolution=ignore-duplicates,return=minimal"
+        )
+
+
+# --- Operations queued per key (replayed on top of the latest row after a conflict) ---
+def _apply(ops: Iterable[tuple], value: Any) -> Any:
+    for op in ops:
+        if op[0] == "set":
+            value = copy.deepcopy(op[1])
+        elif op[0] == "delete":
+            value = None
+        else:  # ("merge", fields, removed)
+            value = dict(value) if isinstance(value, dict) else {}
+            value.update(copy.deepcopy(op[1]))
+            for field in op[2]:
+                value.pop(field, None)
+    return value
+
+
+def diff_ops(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, tuple]:
+    """Per-key operation turning before into after: top-level field merges for dict values"""
+    ops = {}
+    for key, new in after.items():
+        old = before.get(key)
+        if key in before and old == new:
+            continue
+        if isinstance(old, dict) and isinstance(new, dict):
+            fields = {f: v for f, v in new.items() if f not in old or old[f] != v}
+            ops[key] = ("merge", fields, [f for f in old if f not in new])
+        else:
+            ops[key] = ("set", new)
+    for key in before:
+        if key not in after:
+            ops[key] = ("delete",)
+    return ops
+
+
+def list_to_kv(items: List[Dict], key_field: str = "id") -> Dict[str, Dict]:
+    """Ordered list of dicts -> {key: item + position} (e.g. channels.json)"""
+    return {str(item[key_field]): {**item, "position": i} for i, item in enumerate(items) if item.get(key_field)}
+
+
+def kv_to_list(mapping: Dict[str, Dict]) -> List[Dict]:
+    items = sorted(mapping.values(), key=lambda item: item.get("position", float("inf")))
+    return [{k: v for k, v in item.items() if k != "position"} for item in items]
+
+
+class KVStore:
+    """One namespace: remote rows + queued local operations, flushed with CAS in the background"""
+
+    def __init__(self, backend, namespace: str, flush_delay: float = FLUSH_DELAY_SECONDS,
+                 legacy_path: Optional[str] = None, legacy_transform: Optional[Callable] = None):
+        self.backend = backend
+        self.namespace = namespace
+        self.flush_delay = flush_delay
+        self.legacy_path = legacy_path
+        self.legacy_transform = legacy_transform
+        self._lock = threading.RLock()
+        self._remote: Dict[str, Tuple[Any, int]] = {}
+        self._pending: Dict[str, List[tuple]] = {}
+        self._view: Optional[Dict[str, Any]] = None
+        self._loaded = False
+        self._refreshed_at = 0.0
+        self._flush_due = 0.0
+        self._wake = threading.Event()
+        self._thread = None
+        self.stats = {"writes": 0, "conflicts": 0, "failed_flushes": 0, "refreshes": 0,
+                      "rows_fetched": 0, "ops_queued": 0, "last_error": None}
+
+    # --- Reads ---
+    def refresh(self, max_age: float = 0):
+        """Bring remote rows up to date, fetching only keys whose version moved"""
+        if self._loaded and max_age and time.time() - self._refreshed_at < max_age:
+            return
+        if not self._loaded:
+            rows = self.backend.fetch(self.namespace)
+            if self.legacy_path and not self.backend.fetch(MIGRATIONS_NAMESPACE, [self.namespace]):
+                rows = self._import_legacy(rows)
+            with self._lock:
+                self._remote = rows
+                self._loaded = True
+                self._view = None
+        else:
+            versions = self.backend.fetch_versions(self.namespace)
+            with self._lock:
+                changed = [k for k, v in versions.items() if self._remote.get(k, (None, 0))[1] != v]
+                removed = [k for k in self._remote if k not in versions]
+            rows = self.backend.fetch(self.namespace, changed) if changed else {}
+            with self._lock:
+                for key in removed:
+                    self._remote.pop(key, None)
+                self._remote.update(rows)
+                if changed or removed:
+                    self._view = None
+        self.stats["refreshes"] += 1
+        self.stats["rows_fetched"] += len(rows)
+        self._refreshed_at = time.time()
+
+    def _import_legacy(self, rows: Dict[str, Tuple[Any, int]]) -> Dict[str, Tuple[Any, int]]:
+        """
+        One-time import of the whole-file JSON blob this namespace replaces. The entries and
+        the migration marker go in one bulk insert, so the import is all or nothing. Rows
+        without a marker come from an import made before markers existed: only the marker
+        is written then, the (frozen) blob would bring back entries deleted since.
+        """
+        marker = {"source": self.legacy_path, "at": datetime.now(timezone.utc).isoformat()}
+        if rows:
+            self.backend.insert_many([(MIGRATIONS_NAMESPACE, self.namespace, {**marker, "entries": None})])
+            return rows
+        obj = supabase_utils.fetch_storage_object(self.legacy_path)
+        if obj is None:
+            # No blob, or Storage unreachable: no marker, so a later start can still import it
+            return {}
+        data = obj.json()
+        if self.legacy_transform:
+            data = self.legacy_transform(data)
+        items = [(self.namespace, str(key), value) for key, value in (data or {}).items() if value is not None]
+        self.backend.insert_many(items + [(MIGRATIONS_NAMESPACE, self.namespace, {**marker, "entries": len(items)})])
+        rows = self.backend.fetch(self.namespace)
+        print(f"[KV] Imported {len(rows)} '{self.namespace}' entries from {self.legacy_path}")
+        return rows
+
+    def _current_view(self) -> Dict[str, Any]:
+        with self._lock:
+            if self._view is None:
+                view = {k: v for k, (v, _) in self._remote.items()}
+                for key, ops in self._pending.items():
+                    value = _apply(ops, view.get(key))
+                    if value is None:
+                        view.pop(key, None)
+                    else:
+                        view[key] = value
+                self._view = view
+            return self._view
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self._current_view().get(str(key))
+        return copy.deepcopy(value) if value is not None else default
+
+    def snapshot(self, copy_values: bool = True) -> Dict[str, Any]:
+        """All entries (remote + pending local changes). copy_values=False returns a shared read-only dict."""
+        view = self._current_view()
+        return copy.deepcopy(view) if copy_values else view
+
+    # --- Writes (queued, flushed in the background) ---
+    def _queue(self, key: str, op: tuple):
+        with self._lock:
+            self._pending.setdefault(str(key), []).append(op)
+            self._view = None
+            self.stats["ops_queued"] += 1
+            if not self._flush_due:
+                self._flush_due = time.time() + self.flush_delay
+        self._ensure_flusher()
+        self._wake.set()
+
+    def set(self, key: str, value: Any):
+        self._queue(key, ("set", copy.deepcopy(value)))
+
+    def merge(self, key: str, fields: Dict[str, Any], removed: Iterable[str] = ()):
+        """Update some top-level fields of a dict entry; concurrent changes to other fields survive"""
+        self._queue(key, ("merge", copy.deepcopy(fields), list(removed)))
+
+    def delete(self, key: str):
+        self._queue(key, ("delete",))
+
+    def write_diff(self, before: Dict[str, Any], after: Dict[str, Any]) -> int:
+        """Queue only what changed between two snapshots of the whole namespace. Returns keys touched."""
+        ops = diff_ops(before, after)
+        for key, op in ops.items():
+            self._queue(key, op)
+        return len(ops)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self) -> bool:
+        """Write every pending key with CAS (re-read + replay on conflict). True if nothing is left pending."""
+        with self._lock:
+            keys = list(self._pending)
+            self._flush_due = 0.0
+        for key in keys:
+            try:
+                if self._flush_key(key):
+                    continue
+            except Exception as e:
+                self.stats["last_error"] = str(e)
+                print(f"[KV] Flush of {self.namespace}/{key} failed: {e}")
+            # Leave the rest queued and try again later
+            self.stats["failed_flushes"] += 1
+            with self._lock:
+                self._flush_due = time.time() + RETRY_DELAY_SECONDS
+            return False
+        return self.pending() == 0
+
+    def _flush_key(self, key: str) -> bool:
+        for _ in range(MAX_CAS_ATTEMPTS):
+            with self._lock:
+                ops = list(self._pending.get(key, ()))
+                base, version = self._remote.get(key, (None, 0))
+            if not ops:
+                return True
+            value = _apply(ops, base)
+            if value == base:
+                new_version = version
+            else:
+                new_version = self.backend.cas(self.namespace, key, value, version)
+            if new_version is not None:
+                with self._lock:
+                    if value is None:
+                        self._remote.pop(key, None)
+                    else:
+                        self._remote[key] = (value, new_version)
+                    remaining = self._pending.get(key, [])[len(ops):]
+                    if remaining:
+                        self._pending[key] = remaining
+                    else:
+                        self._pending.pop(key, None)
+                    self._view = None
+                self.stats["writes"] += 1
+                return True
+            # Someone else wrote this key first: re-read it and replay our operations on top
+            self.stats["conflicts"] += 1
+            row = self.backend.fetch(self.namespace, [key]).get(key)
+            with self._lock:
+                if row is None:
+                    self._remote.pop(key, None)
+                else:
+                    self._remote[key] = row
+                self._view = None
+        self.stats["last_error"] = f"CAS on {key} kept conflicting"
+        return False
+
+    # --- Debounced background flusher ---
+    def _ensure_flusher(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True, name=f"KVFlush-{self.namespace}")
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                due = self._flush_due
+            if not due:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            wait = due - time.time()
+            if wait > 0:
+                self._wake.wait(wait)
+                self._wake.clear()
+                continue
+            self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = len(self._remote)
+            pending = len(self._pending)
+        return {**self.stats, "namespace": self.namespace, "entries": entries, "pending_keys": pending}
+
+
+_backend = None
+_stores: Dict[str, KVStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = SQLiteKVBackend(KV_STATE_DB) if KV_BACKEND == "sqlite" else SupabaseKVBackend()
+    return _backend
+
+
+def open_store(namespace: str, legacy_path: Optional[str] = None,
+               legacy_transform: Optional[Callable] = None) -> KVStore:
+    """Process-wide store per namespace (pending writes are flushed at exit)"""
+    with _stores_lock:
+        store = _stores.get(namespace)
+        if store is None:
+            store = KVStore(get_backend(), namespace, legacy_path=legacy_path, legacy_transform=legacy_transform)
+            _stores[namespace] = store
+        return store
+
+
+def get_stats() -> Dict[str, Any]:
+    return {namespace: store.get_stats() for namespace, store in _stores.items()}
+
+
+@atexit.register
+def _flush_all():
+    for store in list(_stores.values()):
+        try:
+            store.flush()
+        except Exception:
+            pass
@@ -11,16 +11,16 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 import httpx
 import asyncio
-import re
-import time
 from collections import defaultdict
 
 import os
 import json
 import hashlib
+import base64
 import string
 import random
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
+from urllib.parse import quote
 from pydantic import BaseModel
 from datetime import datetime, timezone, timedelta
 from dotenv import load_dotenv
@@ -29,6 +29,10 @@ from functools import lru_cache
 from contextlib import asynccontextmanager
 
 from cache_utils import feed_cache, product_list_cache, user_cache, categories_cache
+from storage_cache import storage_cache
+import kv_state
+import products
+from products import DEFAULT_CHANNELS, extract_product
 from google_play_utils import verify_subscription
 
 
@@ -93,6 +97,11 @@ app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], all
 URL, KEY = get_supabase_config()
 HEADERS = {'apikey': KEY, 'Authorization': f'Bearer {KEY}', 'Content-Type': 'application/json', 'Prefer': 'return=representation'}
 SUPABASE_BUCKET = "monitor-data"
+CHANNELS_PATH = "discord_josh/channels.json"
+CHANNELS_MAX_AGE = 30  # Seconds between channel version checks
+# 'messages' (default): derive products from raw discord_messages rows per request;
+# 'products': read the materialized products table - opt in once backfill_products.py has run
+FEED_SOURCE = os.getenv("FEED_SOURCE", "messages").strip().lower()
 
 # Global storage for push tokens (Move to DB irl)
 # Push notification state management
@@ -109,40 +118,6 @@ def _log_push(msg):
 PENDING_READS: Dict[str, asyncio.Event] = {}
 
 
-DEFAULT_CHANNELS = [
-    {"id": "1367813504786108526", "name": "Collectors Amazon", "category": "UK Stores", "enabled": True},
-    {"id": "855164313006505994", "name": "Argos Instore", "category": "UK Stores", "enabled": True},
-    {"id": "864504557903937587", "name": "Restocks Online", "category": "UK Stores", "enabled": True},
-    {"id": "1394825979461111980", "name": "Chaos Cards", "category": "UK Stores", "enabled": True},
-    {"id": "1445485120231571730", "name": "Magic Madhouse", "category": "UK Stores", "enabled": True},
-    {"id": "1391616507406192701", "name": "Pokemon Center UK", "category": "UK Stores", "enabled": True},
-    {"id": "1445485873083711628", "name": "Smyths Toys", "category": "UK Stores", "enabled": True},
-    {"id": "1404906840118132928", "name": "Zaavi", "category": "UK Stores", "enabled": True},
-    {"id": "1404910797448286319", "name": "John Lewis", "category": "UK Stores", "enabled": True},
-    {"id": "1385348512681689118", "name": "Amazon", "category": "USA Stores", "enabled": True},
-    {"id": "1384205489679892540", "name": "Walmart", "category": "USA Stores", "enabled": True},
-    {"id": "1384205662023848018", "name": "Pokemon Center", "category": "USA Stores", "enabled": True},
-    {"id": "1391616295560155177", "name": "Pokemon Center", "category": "Canada Stores", "enabled": True},
-    {"id": "1406802285337776210", "name": "Hobbiesville", "category": "Canada Stores", "enabled": True}
-]
-
-@lru_cache(maxsize=1024)
-def optimize_image_url(url: str) -> str:
-    if not url: return url
-    try:
-        if "images-ext-" in url and "discordapp.net" in url:
-            if "/https/" in url: url = "https://" + url.split("/https/", 1)[1]
-            elif "/http/" in url: url = "http://" + url.split("/http/", 1)[1]
-        if any(domain in url for domain in ['media-amazon.com', 'images-amazon.com', 'ssl-images-amazon.com']):
-            url = re.sub(r'\._[A-Z_]+[0-9]+_\.', '.', url)
-            if "?" in url: url = url.split("?")[0]
-        if "ebayimg.com" in url:
-            if re.search(r's-l\d+\.', url): url = re.sub(r's-l\d+\.', 's-l1600.', url)
-            if "?" in url: url = url.split("?")[0]
-        if "discordapp.net" in url and "?" in url: url = url.split("?")[0]
-    except: pass
-    return url
-
 def db_retry(retries: int = 5, backoff: float = 1.0):
     """Decorator to retry DB operations on timeout or transient errors"""
     def decorator(func):
@@ -751,35 +726,20 @@ async def send_expo_push_notification(tokens: List[str], title: str, body: str,
 
 
 # --- BOT USERS CACHE ---
-bot_users_cache = {
-    "data": {},
-    "last_fetched": 0
-}
+BOT_USERS_PATH = "discord_josh/bot_users.json"
+BOT_USERS_MAX_AGE = 30  # Seconds between version checks (only changed users are re-fetched)
+
+# Shared with the Telegram bot through kv_state (one versioned row per user)
+bot_users_store = kv_state.open_store("bot_users", legacy_path=BOT_USERS_PATH)
+channels_store = kv_state.open_store("channels", legacy_path=CHANNELS_PATH, legacy_transform=kv_state.list_to_kv)
 
 async def get_bot_users_data():
-    """Fetch and cache bot users data from Supabase Storage with Auth"""
-    global bot_users_cache
-    now = time.time()
-    # Cache for 30 seconds (keep it fresh for "immediate" changes)
-    if now - bot_users_cache["last_fetched"] < 30 and bot_users_cache["data"]:
-        return bot_users_cache["data"]
-        
+    """Bot users from the KV store, refreshed at most every BOT_USERS_MAX_AGE seconds (read-only)"""
     try:
-        # Use authenticated URL and HEADERS for private access
-        response = await http_client.get(
-            f"{URL}/storage/v1/object/authenticated/{SUPABASE_BUCKET}/discord_josh/bot_users.json",
-            headers=HEADERS
-        )
-        if response.status_code == 200:
-            data = response.json()
-            bot_users_cache["data"] = data
-            bot_users_cache["last_fetched"] = now
-            return data
-        print(f"[BOT_USERS] Fetch failed: {response.status_code}")
+        await asyncio.to_thread(bot_users_store.refresh, BOT_USERS_MAX_AGE)
     except Exception as e:
         print(f"[BOT] Error fetching bot users: {e}")
-    
-    return bot_users_cache.get("data", {})
+    return bot_users_store.snapshot(copy_values=False)
 
 # --- USER STATUS ENDPOINT ---
 
@@ -1158,16 +1118,6 @@ async def unlink_telegram_endpoint(data: Dict = Body(...)):
         print(f"[LINK] Unlink error: {e}")
         return {"success": False, "message": str(e)}
 
-def _parse_price_to_float(price_str: any) -> float:
-    if not price_str: return 0.0
-    try:
-        # Remove currency symbols and commas, keep digits and dots
-        clean = re.sub(r'[^0-9.]', '', str(price_str))
-        if not clean or clean == '.' or clean == '..': return 0.0
-        return float(clean)
-    except:
-        return 0.0
-
 async def background_notification_worker():
     """Background task to poll for new products and notify users"""
     global LAST_PUSH_CHECK_TIME, RECENT_ALERTS_LOG
@@ -1189,11 +1139,11 @@ async def background_notification_worker():
             if not users_data: continue
             
             try:
-                response = await asyncio.wait_for(http_client.get(f"{URL}/rest/v1/discord_messages?order=scraped_at.desc&limit=20", headers=HEADERS), timeout=30.0)
-                if response.status_code != 200: continue
-                messages = response.json()
+                chunk = await asyncio.wait_for(_fetch_feed_rows(None, 20, None, None, []), timeout=30.0)
+                if chunk is None: continue
+                _, rows, _ = chunk
                 
-                new_messages = [m for m in messages if safe_parse_dt(m.get("scraped_at")) and safe_parse_dt(m.get("scraped_at")) > LAST_PUSH_CHECK_TIME]
+                new_messages = [r for r in rows if safe_parse_dt(r.get("scraped_at")) and safe_parse_dt(r.get("scraped_at")) > LAST_PUSH_CHECK_TIME]
                 
                 if new_messages:
                     print(f"[PUSH] {len(new_messages)} new products detected")
@@ -1202,49 +1152,36 @@ async def background_notification_worker():
                     try: product_list_cache.invalidate("feed_global")
                     except: pass
                     
-                    channels = await get_channels_data()
-                    channel_map = {c['id']: {'category': c.get('category', 'USA Stores').strip(), 'name': c.get('name', 'Unknown').strip()} for c in channels if c.get('enabled', True)}
-                    for c in DEFAULT_CHANNELS:
-                        if c['id'] not in channel_map: channel_map[c['id']] = {'category': c.get('category', 'USA Stores').strip(), 'name': c.get('name', 'Unknown').strip()}
-
                     # Clean up old signatures (older than 15 mins)
                     cutoff = datetime.now() - timedelta(minutes=15)
                     RECENT_ALERTS_LOG = [x for x in RECENT_ALERTS_LOG if x[1] > cutoff]
                     current_batch_signatures = set()
                     max_msg_time = LAST_PUSH_CHECK_TIME
 
-                    for msg in new_messages:
-                        msg_id = msg.get("id")
-                        m_time = safe_parse_dt(msg.get("scraped_at"))
+                    for row in new_messages:
+                        msg_id = row.get("id")
+                        m_time = safe_parse_dt(row.get("scraped_at"))
                         if m_time and m_time > max_msg_time: max_msg_time = m_time
                         
                         try:
                             # Content Deduplication
-                            sig = _get_content_signature(msg)
+                            sig = row["signature"]
                             if sig in current_batch_signatures or any(x[0] == sig for x in RECENT_ALERTS_LOG):
                                 _log_push(f"Skipping duplicate signature {sig} for message {msg_id}")
                                 continue
                             
-                            # TRANSFORM & QUALIFY
-                            product = extract_product(msg, channel_map)
-                            if not product: continue
-                            
-                            p_data = product.get("product_data", {})
-                            
-                            # QUALITY QUALIFICATION (Matches Home Feed)
-                            has_image = p_data.get("image") and "placeholder" not in p_data.get("image")
-                            has_links = bool(p_data.get("buy_url") or (p_data.get("links") and any(p_data["links"].values())))
-                            
-                            price_val = _parse_price_to_float(p_data.get("price"))
-                            was_val = _parse_price_to_float(p_data.get("was_price"))
-                            resell_val = _parse_price_to_float(p_data.get("resell"))
-                            
-                            has_any_price = price_val > 0 or resell_val > 0 or was_val > 0
-                            
-                            if not (has_image or has_any_price or has_links):
+                            # QUALITY QUALIFICATION (Matches Home Feed, flagged at ingest)
+                            if not row.get("is_quality"):
                                 _log_push(f"Skipping msg {msg_id} - Low quality")
                                 continue
 
+                            product = products.from_row(row)
+                            p_data = product.get("product_data", {})
+                            
+                            price_val = products.parse_price(p_data.get("price"))
+                            was_val = products.parse_price(p_data.get("was_price"))
+                            resell_val = products.parse_price(p_data.get("resell"))
+
                             # DISCOUNT CALCULATION
                             current_discount = 0
                             if resell_val > price_val and price_val > 0:
@@ -1395,207 +1332,6 @@ async def apple_signin(data: Dict = Body(...)):
         print(f"[AUTH] Apple signin error: {e}")
         raise HTTPException(status_code=500, detail=f"Error with Apple sign-in: {str(e)}")
 
-def _clean_text_for_sig(text: str) -> str:
-    if not text: return ""
-    text = re.sub(r'<@&?\d+>|<#\d+>', '', text)
-    text = re.sub(r'@[A-Za-z0-9_]+\b', '', text)
-    text = text.replace('|', '').replace('[', '').replace(']', '')
-    return " ".join(text.lower().split()).strip()
-
-def _get_content_signature(msg: Dict) -> str:
-    try:
-        raw = msg.get("raw_data", {})
-        embed = raw.get("embed") or {}
-        content = msg.get("content", "")
-        retailer = embed.get("author", {}).get("name", "") if embed.get("author") else ""
-        title = embed.get("title", "")
-        price = ""
-        for field in embed.get("fields", []):
-            name = (field.get("name") or "").lower()
-            if "price" in name:
-                price = field.get("value", "")
-                break
-        if not retailer or not title or not price:
-            if content and "|" in content:
-                parts = [p.strip() for p in content.split("|")]
-                if len(parts) >= 2:
-                    price_match = re.search(r'[£$€]\s*[\d,]+\.?\d*', content)
-                    if price_match: price = price_match.group(0)
-                    if not title: title = parts[0]
-                    if not retailer and len(parts) > 1: retailer = parts[1]
-        if not retailer and "Argos" in content: retailer = "Argos Instore"
-        c_retailer = _clean_text_for_sig(retailer)
-        c_title = _clean_text_for_sig(title)
-        # Increase length to 60 and add a snippet of description for better uniqueness
-        f_title = c_title[:60].strip()
-        desc_snippet = _clean_text_for_sig(embed.get("description", ""))[:15]
-        
-        num_match = re.search(r'[\d,]+\.?\d*', price)
-        c_price = num_match.group(0).replace(',', '') if num_match else price.strip()
-        
-        raw_sig = f"{c_retailer}|{f_title}|{c_price}|{desc_snippet}"
-        if len(raw_sig) < 8: return hashlib.md5(content.encode()).hexdigest() if content else str(msg.get("id"))
-        return hashlib.md5(raw_sig.encode()).hexdigest()
-    except: return str(msg.get("id"))
-
-def _clean_display_text(text: str) -> str:
-    if not text: return ""
-    text = re.sub(r'<@&?\d+>|<#\d+>', '', text)
-    text = re.sub(r'^[ \t]*@[A-Za-z0-9_ ]+([|:-]|$)', '', text)
-    text = re.sub(r'@[A-Za-z0-9_]+\b', '', text)
-    text = text.strip().strip('|').strip(':').strip('-').strip()
-    return text
-
-def extract_product(msg, channel_map):
-    raw = msg.get("raw_data", {})
-    embeds = raw.get("embeds", [])
-    embed = raw.get("embed") or (embeds[0] if embeds else {})
-    ch_id = str(msg.get("channel_id", ""))
-    ch_info = channel_map.get(ch_id)
-    if not ch_info:
-        # Fallback: Try to guess or use default instead of returning None
-        ch_info = {"name": "HollowScan Deal", "category": "USA Stores"}
-        # If it's a known UK ID prefix or content has £, suggest UK
-        content = msg.get("content", "")
-        if "£" in content or "chaos" in content.lower():
-            ch_info["category"] = "UK Stores"
-
-    raw_region = ch_info.get('category', 'USA Stores').strip()
-    upper_reg = raw_region.upper()
-    if 'UK' in upper_reg: msg_region = 'UK Stores'
-    elif 'CANADA' in upper_reg: msg_region = 'Canada Stores'
-    else: msg_region = 'USA Stores'
-
-    subcategory = ch_info.get('name', 'Unknown')
-    raw_title = embed.get("title") or msg.get("content", "")[:100] or "HollowScan Product"
-    title = _clean_display_text(raw_title)
-    if not title: title = "HollowScan Product"
-
-    description = embed.get("description") or ""
-    if not description and msg.get("content"):
-        description = re.sub(r'<@&?\d+>', '', msg.get("content", "")).strip()
-        description = re.sub(r'\[([^\]]+)\]\((https?://[^\)]+)\)', r'\1', description)
-
-    image = None
-    if embed.get("images"): image = optimize_image_url(embed["images"][0])
-    elif embed.get("image") and isinstance(embed["image"], dict): image = optimize_image_url(embed["image"].get("url"))
-    elif embed.get("thumbnail") and isinstance(embed["thumbnail"], dict): image = optimize_image_url(embed["thumbnail"].get("url"))
-
-    if not image and embeds:
-        for extra_embed in embeds:
-            if extra_embed.get("images"): image = optimize_image_url(extra_embed["images"][0]); break
-            elif extra_embed.get("image") and isinstance(extra_embed["image"], dict): image = optimize_image_url(extra_embed["image"].get("url")); break
-            elif extra_embed.get("thumbnail") and isinstance(extra_embed["thumbnail"], dict): image = optimize_image_url(extra_embed["thumbnail"].get("url")); break
-
-    if not image and raw.get("attachments"):
-        for att in raw["attachments"]:
-            if any(att.get("filename", "").lower().endswith(ext) for ext in ['.png', '.jpg', '.jpeg', '.webp']): image = att.get("url"); break
-
-    if not image and msg.get("content"):
-        img_match = re.search(r'(https?://[^\s]+(?:\.png|\.jpg|\.jpeg|\.webp))', msg["content"], re.IGNORECASE)
-        if img_match: image = img_match.group(1)
-
-    price, resell, roi, was_price = None, None, None, None
-    details = []
-    product_data_updates = {}
-
-    if embed.get("fields"):
-        for field in embed["fields"]:
-            name = (field.get("name") or "").strip()
-            val = (field.get("value") or "").strip()
-            if not name or not val: continue
-            if "[" in val and "](" in val: continue
-
-            name_lower = name.lower()
-            matches = re.findall(r'[\d,.]+', val)
-            # Use the FIRST match as the primary price (e.g. "39.95 CAD (29.29 USD)" -> 39.95)
-            num = matches[0].replace(',', '') if matches else None
-
-            is_redundant = False
-            if num:
-                if any(k in name_lower for k in ["price", "retail", "cost"]):
-                    if not price:
-                        price = num
-                        if "~~" in val or "(" in val: product_data_updates["price_display"] = val
-                    is_redundant = True
-                elif any(k in name_lower for k in ["resell", "resale", "sell"]):
-                    if not resell: resell = num
-                    is_redundant = True
-                elif "roi" in name_lower or "profit" in name_lower:
-                    if not roi: roi = num
-                    is_redundant = True
-                elif any(k in name_lower for k in ["was", "before", "original"]):
-                    if not was_price: was_price = num
-                    is_redundant = True
-
-            if not is_redundant: details.append({"label": name, "value": val})
-
-    all_links = []
-    # 1. Title URL
-    if embed.get("title_url"): all_links.append({"url": embed["title_url"], "text": "Link"})
-    
-    # 2. Field Markdown Links
-    if embed.get("fields"):
-        for field in embed["fields"]:
-            val = field.get("value", "")
-            matches = re.findall(r'\[([^\]]+)\]\((https?://[^\)]+)\)', val)
-            for text, url in matches: all_links.append({"url": url, "text": text})
-
-    # 3. Dedicated Links Array (from archiver)
-    if embed.get("links"):
-        for link in embed["links"]:
-            l_url = link.get("url")
-            l_text = link.get("text") or "Link"
-            if l_url and l_url.startswith("http") and not any(x["url"] == l_url for x in all_links):
-                all_links.append({"url": l_url, "text": l_text})
-
-    categorized_links = {"buy": [], "ebay": [], "fba": [], "other": []}
-    primary_buy_url = None
-
-    for link in all_links:
-        url, text = link.get('url', ''), (link.get('text') or 'Link').strip()
-        if not url: continue
-        link_obj = {"text": text, "url": url}
-        u_low, t_low = url.lower(), text.lower()
-
-        if any(k in t_low or k in u_low for k in ['buy', 'shop', 'purchase', 'checkout', 'cart', 'link']):
-            categorized_links["buy"].append(link_obj)
-            if not primary_buy_url: primary_buy_url = url
-        elif any(k in t_low or k in u_low for k in ['sold', 'active', 'google', 'ebay']): categorized_links["ebay"].append(link_obj)
-        elif any(k in t_low or k in u_low for k in ['keepa', 'amazon', 'selleramp', 'fba', 'camel']): categorized_links["fba"].append(link_obj)
-        else: categorized_links["other"].append(link_obj)
-
-    components = raw.get("components", [])
-    for comp_row in components:
-        sub_comps = comp_row.get("components", [])
-        for comp in sub_comps:
-            url = comp.get("url")
-            label = comp.get("label") or "Link"
-            if url and url.startswith("http"):
-                link_obj = {"text": label, "url": url}
-                u_low, t_low = url.lower(), label.lower()
-                if any(ext['url'] == url for sub in categorized_links.values() for ext in sub): continue
-                if any(k in t_low or k in u_low for k in ['buy', 'shop', 'purchase', 'checkout', 'cart', 'link']):
-                    categorized_links["buy"].append(link_obj)
-                    if not primary_buy_url: primary_buy_url = url
-                elif any(k in t_low or k in u_low for k in ['sold', 'active', 'google', 'ebay']): categorized_links["ebay"].append(link_obj)
-                elif any(k in t_low or k in u_low for k in ['keepa', 'amazon', 'selleramp', 'fba', 'camel']): categorized_links["fba"].append(link_obj)
-                else: categorized_links["other"].append(link_obj)
-
-    if not primary_buy_url and embed.get("fields"):
-         for field in embed["fields"]:
-             link_match = re.search(r'\[([^\]]+)\]\((https?://[^\)]+)\)', field.get("value", ""))
-             if link_match: primary_buy_url = link_match.group(2); break
-
-    product_data = {
-        "title": title[:100], "description": description[:500],
-        "image": image or "https://via.placeholder.com/400",
-        "price": price, "was_price": was_price, "resell": resell, "roi": roi,
-        "buy_url": primary_buy_url or (all_links[0].get('url') if all_links else None),
-        "links": categorized_links, "details": details
-    }
-    product_data.update(product_data_updates)
-    return {"id": str(msg.get("id")), "region": msg_region, "category_name": subcategory, "product_data": product_data, "created_at": msg.get("scraped_at"), "is_locked": False}
 
 
 # Root route handled by SPA dashboard below
@@ -1615,10 +1351,9 @@ async def get_categories():
     channels = []
     source = "none"
     try:
-        storage_url = f"{URL}/storage/v1/object/authenticated/monitor-data/discord_josh/channels.json"
-        channels_response = await http_client.get(storage_url, headers=HEADERS)
-        if channels_response.status_code == 200:
-            channels = channels_response.json() or []
+        await asyncio.to_thread(channels_store.refresh, CHANNELS_MAX_AGE)
+        channels = kv_state.kv_to_list(channels_store.snapshot(copy_values=False))
+        if channels:
             source = "remote"
             print(f"[CATEGORIES] OK Loaded {len(channels)} channels from remote")
     except Exception as e: print(f"[CATEGORIES] MISS Remote channels fetch failed: {type(e).__name__}: {e}")
@@ -1658,12 +1393,11 @@ async def get_categories():
     return result_data
 
 async def get_channels_data():
-    """Helper to fetch channels from storage or local fallback"""
+    """Helper to fetch channels from the KV store (version check, changed rows only) or local fallback"""
     channels = []
     try:
-        storage_url = f"{URL}/storage/v1/object/authenticated/monitor-data/discord_josh/channels.json"
-        channels_response = await http_client.get(storage_url, headers=HEADERS)
-        if channels_response.status_code == 200: channels = channels_response.json() or []
+        await asyncio.to_thread(channels_store.refresh, CHANNELS_MAX_AGE)
+        channels = kv_state.kv_to_list(channels_store.snapshot(copy_values=False))
     except: pass
     
     if not channels:
@@ -1676,6 +1410,166 @@ async def get_channels_data():
                 except: continue
     return channels or DEFAULT_CHANNELS
 
+def _feed_row_matches(row: Dict, region: Optional[str], category: Optional[str], search_keywords: List[str]) -> bool:
+    """Feed filters on a products row: quality, then search keywords or region / store"""
+    if not row.get("is_quality"): return False
+    if search_keywords:
+        return any(kw in (row.get("search_text") or "") for kw in search_keywords)
+    if region and region.strip().upper() != "ALL" and row["region"].strip() != region.strip(): return False
+    if category and category.strip().upper() != "ALL" and row["store"].upper().strip() != category.upper().strip(): return False
+    return True
+
+def _keyset_filter(after: Optional[Tuple[str, str]]) -> str:
+    """PostgREST filter for rows strictly after (scraped_at, id) in newest-first order"""
+    if not after: return ""
+    scraped_at, row_id = after
+    expr = f'(or(scraped_at.lt."{scraped_at}",and(scraped_at.eq."{scraped_at}",id.lt.{row_id})))'
+    return f"&and={quote(expr, safe='(),.')}"
+
+FEED_CURSOR_SIGNATURES = 50  # Recent content signatures carried in a cursor for de-duplication
+
+def _signature_digest(signature: str) -> str:
+    """Short stand-in for a content signature inside a cursor"""
+    return hashlib.md5(signature.encode()).hexdigest()[:8]
+
+def _encode_feed_cursor(product: Dict, recent_digests: List[str]) -> str:
+    raw = json.dumps([product.get("created_at"), product.get("id"), recent_digests], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_feed_cursor(cursor: str) -> Tuple[Tuple[str, str], List[str]]:
+    """
+    Opaque feed cursor -> ((scraped_at, id) of the last product the client received, digests
+    of the signatures it was shown last). Cursors without digests are still accepted.
+    """
+    try:
+        scraped_at, row_id, *rest = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if safe_parse_dt(scraped_at) is None or not str(row_id).isdigit(): raise ValueError(cursor)
+        digests = [str(d) for d in rest[0]][-FEED_CURSOR_SIGNATURES:] if rest and isinstance(rest[0], list) else []
+        return (scraped_at, str(row_id)), digests
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def _fetch_feed_rows(after: Optional[Tuple[str, str]], limit: int, region: Optional[str], category: Optional[str],
+                           search_keywords: List[str]) -> Optional[Tuple[int, List[Dict], Optional[Tuple[str, str]]]]:
+    """
+    One newest-first chunk of products rows for the feed, strictly after the (scraped_at, id)
+    keyset `after`: (rows scanned, rows, keyset of the last scanned row), None on an HTTP
+    error. Seeking on the keyset costs the same at any depth, unlike offset=N. Filters run
+    in SQL against the products table; with FEED_SOURCE=messages the raw discord_messages
+    rows are fetched and derived here instead.
+    """
+    if FEED_SOURCE == "products":
+        query = (f"select={products.ROW_SELECT}&is_quality=is.true&scraped_at=not.is.null"
+                 f"&order=scraped_at.desc,id.desc&limit={limit}{_keyset_filter(after)}")
+        if search_keywords:
+            query += f"&or=({','.join(f'search_text.ilike.*{quote(k)}*' for k in search_keywords)})"
+        else:
+            if region and region.strip().upper() != "ALL": query += f"&region=eq.{quote(region.strip())}"
+            if category and category.strip().upper() != "ALL": query += f"&store=ilike.{quote(category.strip())}"
+        response = await http_client.get(f"{URL}/rest/v1/products?{query}", headers=HEADERS)
+        if response.status_code != 200: return None
+        rows = response.json()
+        return len(rows), rows, (rows[-1]["scraped_at"], str(rows[-1]["id"])) if rows else after
+
+    channels = await get_channels_data()
+    channel_map = products.build_channel_map(channels)
+    # NULLs sort first in a DESC order and can't be keyset-compared, so they are left out
+    query = f"scraped_at=not.is.null&order=scraped_at.desc,id.desc&limit={limit}{_keyset_filter(after)}"
+    if search_keywords:
+        or_parts = []
+        for k in search_keywords:
+            or_parts.append(f"content.ilike.*{k}*")
+            or_parts.append(f"raw_data->embeds->0->>title.ilike.*{k}*")
+            or_parts.append(f"raw_data->embeds->0->>description.ilike.*{k}*")
+            or_parts.append(f"raw_data->embed->>title.ilike.*{k}*")
+            or_parts.append(f"raw_data->embed->>description.ilike.*{k}*")
+            or_parts.append(f"raw_data->embeds->0->fields->0->>value.ilike.*{k}*")
+            or_parts.append(f"raw_data->embeds->0->fields->1->>value.ilike.*{k}*")
+            or_parts.append(f"raw_data->embeds->0->author->>name.ilike.*{k}*")
+        query += f"&or=({','.join(or_parts)})"
+    elif region and region.strip().upper() != "ALL":
+        req_reg = region.strip().upper()
+        if 'UK' in req_reg: norm_reg = 'UK'
+        elif 'CANADA' in req_reg or 'CA' in req_reg: norm_reg = 'CANADA'
+        else: norm_reg = 'USA'
+        target_ids = []
+        for c in channels:
+            c_cat = (c.get('category') or '').upper()
+            c_name = (c.get('name') or '').upper()
+            is_region_match = norm_reg in c_cat or (norm_reg == 'USA' and 'US' in c_cat)
+            if category and category.strip().upper() != "ALL":
+                if is_region_match and c_name == category.strip().upper(): target_ids.append(c['id'])
+            elif is_region_match: target_ids.append(c['id'])
+        if target_ids: query += f"&channel_id=in.({','.join(target_ids)})"
+    response = await http_client.get(f"{URL}/rest/v1/discord_messages?{query}", headers=HEADERS)
+    if response.status_code != 200: return None
+    messages = response.json()
+    last = (messages[-1]["scraped_at"], str(messages[-1]["id"])) if messages else after
+    return len(messages), products.derive_rows(messages, channel_map), last
+
+async def _scan_feed(found: List[Dict], seen_signatures: set, after: Optional[Tuple[str, str]], fill_target: int,
+                     max_chunks: int, region: Optional[str], category: Optional[str],
+                     search_keywords: List[str], seen_digests: frozenset = frozenset()) -> Tuple[Optional[Tuple[str, str]], bool]:
+    """
+    Append matching, de-duplicated products to found until fill_target. seen_digests holds
+    signature digests from a cursor (products shown on earlier pages).
+    Returns (scan position, db_end_reached)
+    """
+    # Products rows arrive pre-filtered; raw messages need wide scans to fill a page
+    batch_limit = 100 if FEED_SOURCE == "products" else (1000 if search_keywords else 50)
+    chunks_scanned = 0
+    while len(found) < fill_target and chunks_scanned < max_chunks:
+        try:
+            chunk = await _fetch_feed_rows(after, batch_limit, region, category, search_keywords)
+            if chunk is None: break
+            scanned, rows, after = chunk
+            if not scanned: return after, True
+                
+            for row in rows:
+                if row["signature"] in seen_signatures: continue
+                if seen_digests and _signature_digest(row["signature"]) in seen_digests: continue
+                if not _feed_row_matches(row, region, category, search_keywords): continue
+                found.append(products.from_row(row))
+                seen_signatures.add(row["signature"])
+            
+            chunks_scanned += 1
+            if scanned < batch_limit: return after, True
+        except Exception as e:
+            print(f"[FEED] Error in batch fetch: {e}")
+            break
+    return after, False
+
+def _feed_page(all_products: List[Dict], offset: int, limit: int, db_end_reached: bool, premium_user: bool,
+               carried_digests: List[str] = ()) -> Dict:
+    """
+    Slice one page (free users get at most 4 products) with next_offset / next_cursor.
+    The cursor carries the signatures of the last products shown (carried_digests came in
+    with the request's cursor and precede all_products).
+    """
+    page_products = all_products[offset:offset+limit]
+    has_more = (offset + limit) < len(all_products) or (not db_end_reached)
+    
+    if not premium_user:
+        if len(page_products) > 4:
+            page_products = page_products[:4]
+            has_more = False
+        for product in page_products: product["is_locked"] = False
+    
+    end = offset + len(page_products)
+    recent_digests = (list(carried_digests) + [
+        _signature_digest(p["content_signature"])
+        for p in all_products[max(0, end - FEED_CURSOR_SIGNATURES):end] if p.get("content_signature")
+    ])[-FEED_CURSOR_SIGNATURES:]
+
+    return {
+        "products": page_products, 
+        "next_offset": offset + limit if has_more else offset + len(page_products), 
+        "next_cursor": _encode_feed_cursor(page_products[-1], recent_digests) if has_more and page_products else None,
+        "has_more": has_more, 
+        "is_premium": premium_user, 
+        "total_count": len(all_products) if db_end_reached else len(all_products) + 100
+    }
+
 @app.get("/v1/feed")
 async def get_feed(
     user_id: str, 
@@ -1686,10 +1580,13 @@ async def get_feed(
     limit: int = 20, 
     country: Optional[str] = None, 
     search: Optional[str] = None,
-    force_refresh: bool = False  # NEW: Allow manual cache bypass
+    force_refresh: bool = False,  # NEW: Allow manual cache bypass
+    cursor: Optional[str] = None  # next_cursor of the previous page (preferred over offset)
 ):
     # Normalize inputs
     if country and (not region or region == "ALL"): region = country
+    after, cursor_digests = _decode_feed_cursor(cursor) if cursor else (None, [])
+    search_keywords = [k.lower().strip() for k in search.split() if k.strip()] if search else []
     
     # Generate base cache key (GLOBAL - shared across all users with same filters)
     base_cache_key = product_list_cache.get_base_cache_key(region, category, search or "")
@@ -1698,6 +1595,26 @@ async def get_feed(
     cached_data = None
     if not force_refresh:
         cached_data = product_list_cache.get(base_cache_key)
+
+    # CURSOR: continue right behind the last product the client received. New products at
+    # the top cannot shift the page; when that product is not in the cached list, seek to
+    # it in the DB instead of rescanning from the top.
+    if after:
+        start = None
+        if cached_data is not None:
+            start = next((i + 1 for i, p in enumerate(cached_data[0]) if p.get("id") == after[1]), None)
+        if start is None:
+            premium_user = await verify_premium_status(user_id, background_tasks=background_tasks)
+            found = []
+            max_chunks = (100 if premium_user else 30) * (20 if search else 1)
+            # Signatures shown on earlier pages come with the cursor, so a repost of one of
+            # them is still filtered out although the scan starts at the cursor
+            _, db_end_reached = await _scan_feed(
+                found, set(), after, limit, max_chunks, region, category, search_keywords, frozenset(cursor_digests)
+            )
+            print(f"[FEED] Cursor page: {len(found)} products after {after[0]}")
+            return _feed_page(found, 0, limit, db_end_reached, premium_user, cursor_digests)
+        offset = start
     
     # SINGLEFLIGHT: Protect against Cache Stampede
     if cached_data is None and not force_refresh:
@@ -1718,12 +1635,12 @@ async def get_feed(
 
     try:
         all_products = []
-        current_sql_offset = offset
+        scan_position = None
         db_end_reached = False
         cache_refill_mode = False
         
         if cached_data is not None:
-            all_products, next_sql_offset, db_end_reached = cached_data
+            all_products, scan_position, db_end_reached = cached_data
             
             # Check if requested page is already in research OR if DB is fully exhausted
             # If we have enough products to satisfy the offset+limit, OR we know there's no more in DB, return hit
@@ -1732,64 +1649,18 @@ async def get_feed(
                 
                 # Check premium status
                 premium_user = await verify_premium_status(user_id, background_tasks=background_tasks)
-                
-                # Slice for requested page
-                page_products = all_products[offset:offset+limit]
-                has_more = (offset + limit) < len(all_products) or (not db_end_reached)
-                
-                # Apply free user limits
-                if not premium_user:
-                    if len(page_products) > 4:
-                        page_products = page_products[:4]
-                        has_more = False
-                    for product in page_products:
-                        product["is_locked"] = False
-                
-                return {
-                    "products": page_products,
-                    "next_offset": offset + limit if has_more else offset + len(page_products),
-                    "has_more": has_more,
-                    "is_premium": premium_user,
-                    "total_count": len(all_products) if db_end_reached else len(all_products) + 100
-                }
+                return _feed_page(all_products, offset, limit, db_end_reached, premium_user)
             else:
                 # AUTO-REFILL: We have some products, but user scrolled past them.
-                # Continue from the last scanned SQL offset.
-                print(f"[FEED CACHE] PARTIAL HIT - Refilling cache from SQL offset {next_sql_offset}...")
-                current_sql_offset = next_sql_offset
+                # Continue from the keyset of the last scanned row.
+                print(f"[FEED CACHE] PARTIAL HIT - Refilling cache from scan position {scan_position}...")
                 cache_refill_mode = True
         else:
             # Cache miss - fetch from scratch
             print(f"[FEED CACHE] MISS - Fetching from DB for user {user_id[:8]}...")
             all_products = []
-            current_sql_offset = offset
 
         # ======= DB FETCHING LOGIC =======
-        search_is_active = bool(search and search.strip())
-        channels = await get_channels_data()
-        
-        channel_map = {}
-        for c in channels:
-            if c.get('enabled', True): channel_map[c['id']] = {'category': c.get('category', 'USA Stores').strip(), 'name': c.get('name', 'Unknown').strip()}
-        for c in DEFAULT_CHANNELS:
-            if c['id'] not in channel_map: channel_map[c['id']] = {'category': c.get('category', 'USA Stores').strip(), 'name': c.get('name', 'Unknown').strip()}
-        
-        target_ids = []
-        if region and region.strip().upper() != "ALL":
-            req_reg = region.strip().upper()
-            if 'UK' in req_reg: norm_reg = 'UK'
-            elif 'CANADA' in req_reg or 'CA' in req_reg: norm_reg = 'CANADA'
-            else: norm_reg = 'USA'
-            for c in channels:
-                c_cat = (c.get('category') or '').upper()
-                c_name = (c.get('name') or '').upper()
-                is_region_match = norm_reg in c_cat or (norm_reg == 'USA' and 'US' in c_cat)
-                if category and category.strip().upper() != "ALL":
-                    if is_region_match and c_name == category.strip().upper(): target_ids.append(c['id'])
-                elif is_region_match: target_ids.append(c['id'])
-        id_filter = ""
-        if target_ids: id_filter = f"&channel_id=in.({','.join(target_ids)})"
-        
         premium_user = await verify_premium_status(user_id, background_tasks=background_tasks)
         
         # Population seen_signatures for deduplication (especially important for refill)
@@ -1799,110 +1670,26 @@ async def get_feed(
                 if "content_signature" in p:
                     seen_signatures.add(p["content_signature"])
         
-        chunks_scanned = 0
         base_max = 100 if premium_user else 30
         search_multiplier = 20 if search else 1
         max_chunks = base_max * search_multiplier
-        batch_limit = 1000 if search else 50
         
-        # Target size for the cache fill
+        # Target size for the cache fill (at least up to the requested page)
         if cache_refill_mode:
             cache_fill_target = len(all_products) + 50 # Add a small batch on refill
         else:
-            cache_fill_target = 300 if search_is_active else 100
+            cache_fill_target = 300 if search_keywords else 100
+        cache_fill_target = max(cache_fill_target, offset + limit)
         
-        db_end_reached = False
-        while len(all_products) < cache_fill_target and chunks_scanned < max_chunks:
-            query = f"order=scraped_at.desc&offset={current_sql_offset}&limit={batch_limit}"
-            if id_filter and not search_is_active: query += id_filter
-                 
-            if search_is_active:
-                keywords = [k.strip() for k in search.split() if len(k.strip()) >= 1]
-                if keywords:
-                    or_parts = []
-                    for k in keywords:
-                        or_parts.append(f"content.ilike.*{k}*")
-                        or_parts.append(f"raw_data->embeds->0->>title.ilike.*{k}*")
-                        or_parts.append(f"raw_data->embeds->0->>description.ilike.*{k}*")
-                        or_parts.append(f"raw_data->embed->>title.ilike.*{k}*")
-                        or_parts.append(f"raw_data->embed->>description.ilike.*{k}*")
-                        or_parts.append(f"raw_data->embeds->0->fields->0->>value.ilike.*{k}*")
-                        or_parts.append(f"raw_data->embeds->0->fields->1->>value.ilike.*{k}*")
-                        or_parts.append(f"raw_data->embeds->0->author->>name.ilike.*{k}*")
-                    query += f"&or=({','.join(or_parts)})"
-                    
-            try:
-                response = await http_client.get(f"{URL}/rest/v1/discord_messages?{query}", headers=HEADERS)
-                if response.status_code != 200: break
-                messages = response.json()
-                if not messages: 
-                    db_end_reached = True
-                    break
-                    
-                for msg in messages:
-                    sig = _get_content_signature(msg)
-                    if sig in seen_signatures: continue
-                    prod = extract_product(msg, channel_map)
-                    if not prod: continue
-                    
-                    # Filtering logic
-                    p_data = prod.get("product_data", {})
-                    has_image = p_data.get("image") and "placeholder" not in p_data.get("image")
-                    has_links = bool(p_data.get("buy_url") or (p_data.get("links") and any(p_data["links"].values())))
-                    try:
-                        p_num = float(str(p_data.get("price") or 0).replace(',', ''))
-                        r_num = float(str(p_data.get("resell") or 0).replace(',', ''))
-                        w_num = float(str(p_data.get("was_price") or 0).replace(',', ''))
-                        has_any_price = p_num > 0 or r_num > 0 or w_num > 0
-                    except: has_any_price = False
-                    
-                    if not (has_image or has_any_price or has_links): continue
-                    
-                    if search_is_active:
-                        search_keywords = [k.lower().strip() for k in search.split() if k.strip()]
-                        search_blob = f"{p_data.get('title','')}\n{p_data.get('description','')}\n{prod.get('category_name','')}".lower()
-                        if not any(kw in search_blob for kw in search_keywords): continue
-    
-                    if not search_is_active:
-                        if region and region.strip().upper() != "ALL" and prod["region"].strip() != region.strip(): continue
-                        if category and category.strip().upper() != "ALL" and prod["category_name"].upper().strip() != category.upper().strip(): continue
-                    
-                    prod["content_signature"] = sig # Ensure sig is stored for deduplication
-                    all_products.append(prod)
-                    seen_signatures.add(sig)
-                
-                current_sql_offset += len(messages)
-                chunks_scanned += 1
-                if len(messages) < batch_limit: 
-                    db_end_reached = True
-                    break
-            except Exception as e:
-                print(f"[FEED] Error in batch fetch: {e}")
-                break
+        scan_position, db_end_reached = await _scan_feed(
+            all_products, seen_signatures, scan_position, cache_fill_target, max_chunks, region, category, search_keywords
+        )
     
         # Update cache with the potentially larger list
-        product_list_cache.set(base_cache_key, all_products, current_sql_offset, db_end_reached)
-        
-        # Slice and return
-        total_found = len(all_products)
-        page_products = all_products[offset:offset+limit]
-        has_more = (offset + limit) < total_found or (not db_end_reached)
-        
-        if not premium_user:
-            if len(page_products) > 4:
-                page_products = page_products[:4]
-                has_more = False
-            for product in page_products: product["is_locked"] = False
-        
-        result = {
-            "products": page_products, 
-            "next_offset": offset + limit if has_more else offset + len(page_products), 
-            "has_more": has_more, 
-            "is_premium": premium_user, 
-            "total_count": total_found if db_end_reached else total_found + 100
-        }
+        product_list_cache.set(base_cache_key, all_products, scan_position, db_end_reached)
         
-        print(f"[FEED] Complete. Found {total_found} products (scanned up to SQL offset {current_sql_offset}). Returning {len(page_products)} @ offset {offset}.")
+        result = _feed_page(all_products, offset, limit, db_end_reached, premium_user)
+        print(f"[FEED] Complete. Found {len(all_products)} products (scanned up to {scan_position}). Returning {len(result['products'])} @ offset {offset}.")
         return result
     finally:
         # Cleanup Singleflight event
@@ -1978,7 +1765,16 @@ async def delete_saved_deal(user_id: str = Query(...), alert_id: str = Query(...
 async def get_product_detail(product_id: str = Query(...)):
     """Fetch a single product by its ID for deep linking"""
     try:
-        # 1. Fetch from discord_messages
+        # 1. Materialized product row
+        if FEED_SOURCE == "products":
+            response = await http_client.get(
+                f"{URL}/rest/v1/products?id=eq.{product_id}&select={products.ROW_SELECT}",
+                headers=HEADERS
+            )
+            if response.status_code == 200 and response.json():
+                return {"success": True, "product": products.from_row(response.json()[0])}
+
+        # 2. Not derived yet (or FEED_SOURCE=messages): extract from discord_messages
         response = await http_client.get(
             f"{URL}/rest/v1/discord_messages?id=eq.{product_id}&select=*",
             headers=HEADERS
@@ -1986,7 +1782,6 @@ async def get_product_detail(product_id: str = Query(...)):
         if response.status_code == 200 and response.json():
             msg = response.json()[0]
             
-            # 2. Extract using existing logic
             channels = await get_channels_data()
             channel_map = {}
             for c in channels:
@@ -2297,7 +2092,9 @@ async def get_cache_stats():
         "feed_cache": feed_cache.get_stats(),
         "product_list_cache": product_list_cache.get_stats(),  # NEW
         "user_cache": user_cache.get_stats(),
-        "categories_cache": categories_cache.get_stats()
+        "categories_cache": categories_cache.get_stats(),
+        "storage_cache": storage_cache.get_stats(),
+        "kv_state": kv_state.get_stats()
     }
 
 
@@ -2471,37 +2268,20 @@ async def health_check():
 
 async def update_bot_user_premium(telegram_id: str, expiry_iso: str):
     """
-    Syncs premium status to the Telegram bot by updating bot_users.json in Supabase Storage.
+    Syncs premium status to the Telegram bot by updating its entry in the bot_users KV namespace.
     """
     try:
-        # 1. Fetch current data
-        bot_users = await get_bot_users_data()
-        if not isinstance(bot_users, dict): bot_users = {}
-        
-        # 2. Update entry
-        bot_users[str(telegram_id)] = {
+        # Field-level merge: the bot's own fields for this user (username, categories...) are kept
+        bot_users_store.merge(str(telegram_id), {
             "expiry": expiry_iso,
             "updated_at": datetime.now(timezone.utc).isoformat(),
             "source": "google_play"
-        }
-        
-        # 3. Upload back to Storage
-        file_content = json.dumps(bot_users, indent=2)
-        storage_url = f"{URL}/storage/v1/object/authenticated/{SUPABASE_BUCKET}/discord_josh/bot_users.json"
-        
-        # Include 'x-upsert' header for existing files
-        upload_headers = {**HEADERS, "x-upsert": "true"}
-        
-        resp = await http_client.post(storage_url, headers=upload_headers, content=file_content)
-        if resp.status_code in [200, 201]:
-            print(f"[SYNC] Successfully updated bot_users.json for telegram_id {telegram_id}")
-            # Refresh local cache
-            bot_users_cache["data"] = bot_users
-            bot_users_cache["last_fetched"] = time.time()
+        })
+        if await asyncio.to_thread(bot_users_store.flush):
+            print(f"[SYNC] Successfully updated bot user {telegram_id}")
             return True
-        else:
-            print(f"[SYNC] Failed to upload bot_users.json: {resp.status_code} {resp.text}")
-            return False
+        print(f"[SYNC] Bot user {telegram_id} update queued, flush will be retried: {bot_users_store.stats['last_error']}")
+        return False
     except Exception as e:
         print(f"[SYNC] Error updating bot users: {e}")
         return False
@@ -0,0 +1,669 @@
+"""
+message_extraction.py - Discord message rows from the rendered channel or its API payloads
+
+Everything that turns a channel page (or Discord's own REST/gateway JSON) into
+discord_messages rows lives here, apart from the archiver's globals (Flask app, ingest
+spool, Telegram channel map), so offline tools like bench_extraction.py can import it
+without starting any of them:
+1. SelectorRegistry remembers the fallback selector that worked last per page type
+2. extract_new_messages reads every message element in one in-page call, with the
+   per-element Playwright path (extract_message_author / extract_embed_data) as fallback
+3. build_message_data / build_message_data_from_payload produce the same row shape
+   from the DOM and from network payloads
+
+log() prints until app.py points it at the archiver's structured log.
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import re
+from datetime import datetime
+
+import text_normalize
+
+
+clean_text = text_normalize.ascii_text
+
+
+def log(message, level=None):
+    print(message)
+
+
+async def smart_delay(base_min, base_max, variance=0.3):
+    """Intelligent delay with Gaussian distribution for more natural randomness"""
+    mid = (base_min + base_max) / 2
+    sigma = (base_max - base_min) * variance
+    delay = random.gauss(mid, sigma)
+    delay = max(base_min, min(base_max, delay))
+    await asyncio.sleep(delay)
+
+
+class SelectorRegistry:
+    """
+    Remembers which fallback selector worked last, per page type, and tries it first.
+    Selectors are templates (e.g. 'a[href$="/{channel_id}"]') so one winner covers every
+    channel. Discord's DOM rarely changes within a session, so after the first visit
+    lookups are usually a single hit instead of a walk through the whole list.
+    """
+
+    def __init__(self):
+        self.winners = {}  # {page_type: template}
+        self.stats = {}    # {page_type: {"hits", "misses", "not_found"}}
+
+    def ordered(self, page_type, templates):
+        """Candidates with the cached winner first (original priority otherwise)"""
+        winner = self.winners.get(page_type)
+        if winner in templates:
+            return [winner] + [t for t in templates if t != winner]
+        return list(templates)
+
+    def record(self, page_type, template):
+        """Report the template that matched (None if none did)"""
+        stats = self.stats.setdefault(page_type, {"hits": 0, "misses": 0, "not_found": 0})
+        if template is None:
+            stats["not_found"] += 1
+        elif self.winners.get(page_type) == template:
+            stats["hits"] += 1
+        else:
+            stats["misses"] += 1
+            self.winners[page_type] = template
+
+    def get_stats(self):
+        return {
+            page_type: {**stats, "winner": self.winners.get(page_type)}
+            for page_type, stats in self.stats.items()
+        }
+
+
+selector_registry = SelectorRegistry()
+
+
+MESSAGE_LIST_SELECTORS = [
+    'li[id^="chat-messages-"]',
+    '[class*="message-"][class*="cozy"]',
+    '[id^="message-content-"]',
+    'div[class*="messageContent-"]',
+    '[data-list-item-id^="chat-messages"]',
+    'article[class*="message-"]',
+    '[role="listitem"]',
+]
+
+
+EMBED_SELECTORS = ['article[class*="embedFull"]', 'article[class*="embed"]']
+
+
+def synthetic_message_id(msg_id):
+    """Stable numeric id for a non-snowflake element id (hash() is salted per process)"""
+    return int(hashlib.sha1(msg_id.encode()).hexdigest(), 16) % (10 ** 15)
+
+
+# Discord renders <t:...:R> / calendar timestamps as text that changes on its own
+# ("in 5 minutes", "2 hours ago", "Today at 10:42 PM"); hashing it would report edits
+RELATIVE_TIME_RE = re.compile(
+    r'\b(?:in (?:a few|an?|\d+) (?:second|minute|hour|day|week|month|year)s?'
+    r'|(?:a few|an?|\d+) (?:second|minute|hour|day|week|month|year)s? ago'
+    r'|(?:today|yesterday|tomorrow) at \d{1,2}:\d{2}(?:\s*[AP]M)?)\b',
+    re.IGNORECASE
+)
+
+
+def hash_text(text):
+    """Text as it goes into content_hash: relative times removed, whitespace collapsed"""
+    if not text:
+        return text
+    return ' '.join(RELATIVE_TIME_RE.sub('', text).split())
+
+
+def generate_content_hash(content_dict, source="dom"):
+    """
+    '<source>:<md5>'. The DOM renders markdown that the API payload carries raw, so hashes
+    are only comparable between rows extracted the same way (see content_hash_source).
+    """
+    content_str = json.dumps(content_dict, sort_keys=True)
+    return f"{source}:{hashlib.md5(content_str.encode()).hexdigest()}"
+
+
+def content_hash_source(content_hash):
+    """Extraction path a content_hash came from (None for hashes from before the tag)"""
+    return content_hash.split(':', 1)[0] if content_hash and ':' in content_hash else None
+
+
+def extract_markdown_links(text):
+    if not text:
+        return []
+    pattern = r'\[([^\]]+)\]\(([^\)]+)\)'
+    links = []
+    for match in re.finditer(pattern, text):
+        link_text = match.group(1).strip()
+        link_url = match.group(2).strip()
+        if link_url.startswith('http'):
+            links.append({'text': link_text, 'url': link_url})
+    return links
+
+
+async def extract_embed_data(message_element):
+    """Extract embed data from Discord message"""
+    embed_data = {
+        "title": None,
+        "description": None,
+        "fields": [],
+        "images": [],
+        "thumbnail": None,
+        "color": None,
+        "author": None,
+        "footer": None,
+        "timestamp": None,
+        "links": []
+    }
+    
+    try:
+        embed = None
+        for template in selector_registry.ordered("embed", EMBED_SELECTORS):
+            candidate = message_element.locator(template).first
+            if await candidate.count() > 0:
+                embed = candidate
+                selector_registry.record("embed", template)
+                break
+        if embed is None:
+            # Most messages have no embed - not a selector miss
+            return None
+        
+        try:
+            color_style = await embed.get_attribute('style')
+            if color_style and 'border-left-color' in color_style:
+                embed_data["color"] = color_style
+        except: pass
+        
+        try:
+            author_elem = embed.locator('[class*="embedAuthor"] a, [class*="embedAuthor"] span, [class*="embedAuthorName"]').first
+            if await author_elem.count() > 0:
+                author_name = await author_elem.inner_text()
+                author_url = await author_elem.get_attribute('href')
+                embed_data["author"] = {"name": clean_text(author_name), "url": author_url}
+                if author_url and author_url not in [l.get("url") for l in embed_data["links"]]:
+                    embed_data["links"].append({"type": "author", "text": clean_text(author_name), "url": author_url})
+        except: pass
+        
+        try:
+            title_elem = embed.locator('[class*="embedTitle"] a, [class*="embedTitle"]').first
+            if await title_elem.count() > 0:
+                title_text = await title_elem.inner_text()
+                title_url = await title_elem.get_attribute('href')
+                embed_data["title"] = clean_text(title_text)
+                if title_url and title_url not in [l.get("url") for l in embed_data["links"]]:
+                    embed_data["links"].append({"type": "title", "text": embed_data["title"], "url": title_url})
+        except: pass
+        
+        try:
+            field_containers = embed.locator('[class*="embedField"]')
+            field_count = await field_containers.count()
+            
+            for i in range(field_count):
+                field = field_containers.nth(i)
+                field_name_elem = field.locator('[class*="embedFieldName"]').first
+                field_name = ""
+                if await field_name_elem.count() > 0:
+                    field_name = clean_text(await field_name_elem.inner_text())
+                
+                field_value = ""
+                field_value_elem = field.locator('[class*="embedFieldValue"]').first
+                if await field_value_elem.count() > 0:
+                    # Try to preserve links as Markdown [Text](URL)
+                    # We execute JS to replace <a> tags with markdown text
+                    try:
+                        field_value = await field_value_elem.evaluate("""element => {
+                            let clone = element.cloneNode(true);
+                            
+                            // Replace <s> and <strike> with ~~text~~
+                            clone.querySelectorAll('s, strike').forEach(s => {
+                                s.textContent = `~~${s.textContent}~~`;
+                            });
+                            
+                            // Check for elements with line-through style
+                            clone.querySelectorAll('*').forEach(el => {
+                                let style = window.getComputedStyle(el);
+                                if (style.textDecoration && style.textDecoration.includes('line-through') && !el.textContent.includes('~~')) {
+                                    el.textContent = `~~${el.textContent}~~`;
+                                }
+                            });
+
+                            // Replace <a> tags with markdown [Text](URL)
+                            clone.querySelectorAll('a').forEach(a => {
+                                if (a.href) {
+                                    a.textContent = `[${a.textContent}](${a.href})`;
+                                }
+                            });
+                            return clone.innerText;
+                        }""")
+                    except:
+                        field_value = await field_value_elem.inner_text()
+                    
+                    field_value = clean_text(field_value)
+                
+                if field_name or field_value:
+                    embed_data["fields"].append({"name": field_name, "value": field_value})
+                    
+                    # (Optional: we still keep the separate links list for fallback/buttons if needed)
+                    try:
+                        value_links = field_value_elem.locator('a[href]')
+                        link_count = await value_links.count()
+                        for j in range(link_count):
+                            link_elem = value_links.nth(j)
+                            href = await link_elem.get_attribute('href')
+                            text = await link_elem.inner_text()
+                            if href and href not in [l.get("url") for l in embed_data["links"]]:
+                                embed_data["links"].append({
+                                    "field": field_name,
+                                    "text": clean_text(text),
+                                    "url": href
+                                })
+                    except: pass
+        except: pass
+        
+        try:
+            thumb_elem = embed.locator('img[class*="embedThumbnail"]').first
+            if await thumb_elem.count() == 0:
+                thumb_elem = embed.locator('[class*="embedThumbnail"] img').first
+            
+            if await thumb_elem.count() > 0:
+                thumb_src = await thumb_elem.get_attribute('src')
+                if thumb_src:
+                    embed_data["images"].append(thumb_src)
+        except: pass
+        
+        try:
+            footer_elem = embed.locator('[class*="embedFooter"]').first
+            if await footer_elem.count() > 0:
+                embed_data["footer"] = clean_text(await footer_elem.inner_text())
+        except: pass
+        
+        return embed_data if any([embed_data["title"], embed_data["fields"], embed_data["links"]]) else None
+    except Exception as e:
+        log(f"   ⚠️ Embed error: {e}")
+        return None
+
+
+async def extract_message_author(message_element):
+    """Extract author info with robust fallbacks"""
+    try:
+        # Priority 1: ID-based (Most specific, confirmed in inspection)
+        author_elem = message_element.locator('[id^="message-username-"]').first
+        
+        # Priority 2: Standard Class-based
+        if await author_elem.count() == 0:
+            author_elem = message_element.locator('span[class*="username"]').first
+            
+        # Priority 3: Header-based
+        if await author_elem.count() == 0:
+            author_elem = message_element.locator('h3 span').first
+
+        if await author_elem.count() > 0:
+            # Get text from the first visible part (often the username span inside the wrapper)
+            author_name = await author_elem.inner_text()
+            
+            is_bot = await message_element.locator('[class*="botTag"]').count() > 0
+            
+            # Avatar fallback
+            avatar_elem = message_element.locator('img[class*="avatar"]').first
+            avatar_url = None
+            if await avatar_elem.count() > 0:
+                avatar_url = await avatar_elem.get_attribute('src')
+                
+            return {"name": clean_text(author_name), "is_bot": is_bot, "avatar": avatar_url}
+    except: pass
+    return {"name": "Unknown", "is_bot": False, "avatar": None}
+
+
+# --- SINGLE ROUND-TRIP EXTRACTION ---
+# Mirrors extract_message_author / extract_embed_data selector-for-selector, but runs
+# inside the page over every message element at once (one CDP call per channel visit).
+# Returns raw strings; clean_text() and link de-duplication happen in Python so both
+# paths produce identical message_data.
+EXTRACT_MESSAGES_JS = """(elements, opts) => {
+    const knownIds = new Set(opts.knownIds || []);
+    const highWaterMark = opts.highWaterMark ? BigInt(opts.highWaterMark) : null;
+    // limit === null scans every rendered message (used by gap fill)
+    const start = opts.limit === null ? 0 : Math.max(0, elements.length - (opts.limit || 10));
+    const text = el => el ? (el.innerText || '') : '';
+    const out = [];
+    let oldestId = null;
+
+    const fieldValueMarkdown = element => {
+        let clone = element.cloneNode(true);
+        clone.querySelectorAll('s, strike').forEach(s => {
+            s.textContent = `~~${s.textContent}~~`;
+        });
+        clone.querySelectorAll('*').forEach(el => {
+            let style = window.getComputedStyle(el);
+            if (style.textDecoration && style.textDecoration.includes('line-through') && !el.textContent.includes('~~')) {
+                el.textContent = `~~${el.textContent}~~`;
+            }
+        });
+        clone.querySelectorAll('a').forEach(a => {
+            if (a.href) {
+                a.textContent = `[${a.textContent}](${a.href})`;
+            }
+        });
+        return clone.innerText;
+    };
+
+    const extractEmbed = msg => {
+        const embed = msg.querySelector('article[class*="embedFull"]') || msg.querySelector('article[class*="embed"]');
+        if (!embed) return null;
+        const data = {color: null, author: null, title: null, fields: [], thumbnail: null, footer: null};
+
+        const style = embed.getAttribute('style');
+        if (style && style.includes('border-left-color')) data.color = style;
+
+        const author = embed.querySelector('[class*="embedAuthor"] a, [class*="embedAuthor"] span, [class*="embedAuthorName"]');
+        if (author) data.author = {name: text(author), url: author.getAttribute('href')};
+
+        const title = embed.querySelector('[class*="embedTitle"] a, [class*="embedTitle"]');
+        if (title) data.title = {text: text(title), url: title.getAttribute('href')};
+
+        embed.querySelectorAll('[class*="embedField"]').forEach(field => {
+            const nameEl = field.querySelector('[class*="embedFieldName"]');
+            const valueEl = field.querySelector('[class*="embedFieldValue"]');
+            let value = null;
+            const links = [];
+            if (valueEl) {
+                try { value = fieldValueMarkdown(valueEl); } catch (e) { value = text(valueEl); }
+                valueEl.querySelectorAll('a[href]').forEach(a => {
+                    links.push({text: text(a), url: a.getAttribute('href')});
+                });
+            }
+            data.fields.push({name: nameEl ? text(nameEl) : null, value: value, links: links});
+        });
+
+        const thumb = embed.querySelector('img[class*="embedThumbnail"]') || embed.querySelector('[class*="embedThumbnail"] img');
+        if (thumb) data.thumbnail = thumb.getAttribute('src');
+
+        const footer = embed.querySelector('[class*="embedFooter"]');
+        if (footer) data.footer = text(footer);
+        return data;
+    };
+
+    for (let i = start; i < elements.length; i++) {
+        const msg = elements[i];
+        const rawId = msg.getAttribute('id') || msg.getAttribute('data-list-item-id') || '';
+        const match = rawId.match(/(\\d{17,19})$/);
+        const msgId = match ? match[1] : rawId.split('chat-messages-').join('').split('message-').join('');
+        if (/^\\d+$/.test(msgId) && (oldestId === null || BigInt(msgId) < BigInt(oldestId))) oldestId = msgId;
+        if (!msgId) continue;
+        const known = knownIds.has(msgId) || (highWaterMark !== null && /^\\d+$/.test(msgId) && BigInt(msgId) <= highWaterMark);
+        // Known messages are only re-read when the caller rehashes them for edits
+        if (known && !opts.includeKnown) continue;
+
+        const authorEl = msg.querySelector('[id^="message-username-"]') || msg.querySelector('span[class*="username"]') || msg.querySelector('h3 span');
+        let author = null;
+        if (authorEl) {
+            const avatar = msg.querySelector('img[class*="avatar"]');
+            author = {
+                name: text(authorEl),
+                is_bot: !!msg.querySelector('[class*="botTag"]'),
+                avatar: avatar ? avatar.getAttribute('src') : null
+            };
+        }
+
+        out.push({
+            index: i,
+            id: msgId,
+            author: author,
+            content: text(msg.querySelector('[id^="message-content-"]')),
+            embed: extractEmbed(msg),
+            known: known
+        });
+    }
+    return {messages: out, oldestId: oldestId};
+}"""
+
+
+def build_embed_data(raw_embed):
+    """Turn the in-page embed payload into the embed_data dict extract_embed_data returns"""
+    if not raw_embed:
+        return None
+    embed_data = {
+        "title": None,
+        "description": None,
+        "fields": [],
+        "images": [],
+        "thumbnail": None,
+        "color": raw_embed.get("color"),
+        "author": None,
+        "footer": None,
+        "timestamp": None,
+        "links": []
+    }
+
+    author = raw_embed.get("author")
+    if author:
+        embed_data["author"] = {"name": clean_text(author.get("name")), "url": author.get("url")}
+        if author.get("url") and author["url"] not in [l.get("url") for l in embed_data["links"]]:
+            embed_data["links"].append({"type": "author", "text": clean_text(author.get("name")), "url": author["url"]})
+
+    title = raw_embed.get("title")
+    if title:
+        embed_data["title"] = clean_text(title.get("text"))
+        if title.get("url") and title["url"] not in [l.get("url") for l in embed_data["links"]]:
+            embed_data["links"].append({"type": "title", "text": embed_data["title"], "url": title["url"]})
+
+    for field in raw_embed.get("fields") or []:
+        field_name = clean_text(field.get("name"))
+        field_value = clean_text(field.get("value"))
+        if not (field_name or field_value):
+            continue
+        embed_data["fields"].append({"name": field_name, "value": field_value})
+        for link in field.get("links") or []:
+            href = link.get("url")
+            if href and href not in [l.get("url") for l in embed_data["links"]]:
+                embed_data["links"].append({"field": field_name, "text": clean_text(link.get("text")), "url": href})
+
+    if raw_embed.get("thumbnail"):
+        embed_data["images"].append(raw_embed["thumbnail"])
+
+    if raw_embed.get("footer") is not None:
+        embed_data["footer"] = clean_text(raw_embed["footer"])
+
+    return embed_data if any([embed_data["title"], embed_data["fields"], embed_data["links"]]) else None
+
+
+def build_message_data(channel_url, msg_id, plain_content, author_data, embed_data, source="dom"):
+    """Build the discord_messages row consumed by supabase_utils.insert_discord_messages"""
+    message_data = {
+        "id": int(msg_id) if msg_id.isdigit() else synthetic_message_id(msg_id),
+        "channel_id": channel_url.split('/')[-1],
+        "content": clean_text(plain_content),
+        "scraped_at": datetime.utcnow().isoformat(),
+        "raw_data": {
+            "author": author_data,
+            "channel_url": channel_url,
+            "embed": embed_data,
+            "has_embed": embed_data is not None
+        }
+    }
+
+    # Fields are included so embed price edits change the hash (footer holds relative times, so it is not)
+    hash_content = {
+        "content": hash_text(plain_content),
+        "embed_title": hash_text(embed_data.get("title")) if embed_data else None,
+        "embed_desc": hash_text(embed_data.get("description")) if embed_data else None,
+        "embed_fields": [[hash_text(f.get("name")), hash_text(f.get("value"))] for f in embed_data.get("fields", [])] if embed_data else None
+    }
+    message_data["raw_data"]["content_hash"] = generate_content_hash(hash_content, source)
+    return message_data
+
+
+async def extract_new_messages(messages, channel_url, known_ids, limit=10, high_water_mark=None, known_out=None):
+    """
+    Extract every unseen message among the last `limit` elements in ONE page round trip.
+    A message is unseen if it is not in known_ids and newer than high_water_mark.
+    Returns ([(element_index, msg_id, message_data), ...], oldest_scanned_id) where
+    oldest_scanned_id is the oldest numeric snowflake in the scanned window (for gap
+    detection). Falls back to the per-element locator path if the in-page script fails.
+    If known_out is a list, already-archived messages in the window are extracted in the
+    same round trip and appended to it (edit detection).
+    """
+    try:
+        extraction = await messages.evaluate_all(
+            EXTRACT_MESSAGES_JS,
+            {
+                "knownIds": list(known_ids), "limit": limit,
+                "highWaterMark": str(high_water_mark) if high_water_mark else None,
+                "includeKnown": known_out is not None
+            }
+        )
+    except Exception as e:
+        log(f"   ⚠️ Bulk extraction failed ({str(e)[:80]}), using per-message fallback")
+        return await extract_new_messages_per_element(messages, channel_url, known_ids, limit, high_water_mark, known_out)
+
+    results = []
+    for raw in extraction["messages"]:
+        author = raw.get("author")
+        author_data = (
+            {"name": clean_text(author.get("name")), "is_bot": bool(author.get("is_bot")), "avatar": author.get("avatar")}
+            if author else {"name": "Unknown", "is_bot": False, "avatar": None}
+        )
+        embed_data = build_embed_data(raw.get("embed"))
+        message_data = build_message_data(channel_url, raw["id"], raw.get("content") or "", author_data, embed_data)
+        (known_out if raw.get("known") else results).append((raw["index"], raw["id"], message_data))
+    oldest_id = int(extraction["oldestId"]) if extraction.get("oldestId") else None
+    return results, oldest_id
+
+
+async def extract_new_messages_per_element(messages, channel_url, known_ids, limit=10, high_water_mark=None, known_out=None):
+    """Legacy extraction path: several locator calls per message (same contract as extract_new_messages)"""
+    results = []
+    oldest_id = None
+    count = await messages.count()
+    for i in range(0 if limit is None else max(0, count - limit), count):
+        msg = messages.nth(i)
+        raw_id = await msg.get_attribute('id') or await msg.get_attribute('data-list-item-id') or ""
+        # Discord snowflake IDs are 17-19 digits. Extract the final numeric segment.
+        match = re.search(r'(\d{17,19})$', raw_id)
+        msg_id = match.group(1) if match else raw_id.replace('chat-messages-', '').replace('message-', '')
+        if msg_id.isdigit() and (oldest_id is None or int(msg_id) < oldest_id):
+            oldest_id = int(msg_id)
+
+        if not msg_id: continue
+        known = msg_id in known_ids or (high_water_mark and msg_id.isdigit() and int(msg_id) <= high_water_mark)
+        if known and known_out is None: continue
+
+        author_data = await extract_message_author(msg)
+        embed_data = await extract_embed_data(msg)
+
+        content_loc = msg.locator('[id^="message-content-"]').first
+        plain_content = await content_loc.inner_text() if await content_loc.count() else ""
+
+        (known_out if known else results).append((i, msg_id, build_message_data(channel_url, msg_id, plain_content, author_data, embed_data)))
+    return results, oldest_id
+
+
+def build_embed_data_from_payload(embed):
+    """Map a Discord API embed object onto the embed_data shape the DOM extractor produces"""
+    if not embed:
+        return None
+    embed_data = {
+        "title": clean_text(embed.get("title")) or None,
+        "description": embed.get("description"),
+        "fields": [],
+        "images": [],
+        "thumbnail": None,
+        "color": f"border-left-color: #{embed['color']:06x}" if isinstance(embed.get("color"), int) else None,
+        "author": None,
+        "footer": clean_text((embed.get("footer") or {}).get("text")) or None,
+        "timestamp": embed.get("timestamp"),
+        "links": []
+    }
+
+    author = embed.get("author")
+    if author:
+        embed_data["author"] = {"name": clean_text(author.get("name")), "url": author.get("url")}
+        if author.get("url"):
+            embed_data["links"].append({"type": "author", "text": clean_text(author.get("name")), "url": author["url"]})
+
+    if embed.get("url") and embed["url"] not in [l.get("url") for l in embed_data["links"]]:
+        embed_data["links"].append({"type": "title", "text": embed_data["title"], "url": embed["url"]})
+
+    for field in embed.get("fields") or []:
+        field_name = clean_text(field.get("name"))
+        field_value = clean_text(field.get("value"))
+        if not (field_name or field_value):
+            continue
+        embed_data["fields"].append({"name": field_name, "value": field_value})
+        for link in extract_markdown_links(field_value):
+            if link["url"] not in [l.get("url") for l in embed_data["links"]]:
+                embed_data["links"].append({"field": field_name, "text": link["text"], "url": link["url"]})
+
+    for media_key in ("thumbnail", "image"):
+        media = embed.get(media_key) or {}
+        src = media.get("proxy_url") or media.get("url")
+        if src:
+            embed_data["images"].append(src)
+
+    return embed_data if any([embed_data["title"], embed_data["fields"], embed_data["links"]]) else None
+
+
+def build_message_data_from_payload(channel_url, payload):
+    """Build a discord_messages row from a captured Discord API message object"""
+    author = payload.get("author") or {}
+    avatar = None
+    if author.get("id") and author.get("avatar"):
+        avatar = f"https://cdn.discordapp.com/avatars/{author['id']}/{author['avatar']}.webp?size=80"
+    author_data = {
+        "name": clean_text(author.get("global_name") or author.get("username")) or "Unknown",
+        "is_bot": bool(author.get("bot")),
+        "avatar": avatar
+    }
+
+    embeds = payload.get("embeds") or []
+    embed_data = build_embed_data_from_payload(embeds[0]) if embeds else None
+
+    message_data = build_message_data(channel_url, str(payload["id"]), payload.get("content") or "", author_data, embed_data, source="network")
+    message_data["raw_data"].update({
+        "embeds": embeds,
+        "components": payload.get("components") or [],
+        "attachments": payload.get("attachments") or [],
+        "source": "network"
+    })
+    return message_data
+
+
+async def wait_for_messages_to_load(page):
+    log("   🔍 Loading messages...")
+    try:
+        # Increase timeout and wait for a more generic chat container
+        await page.wait_for_selector('main[class*="chatContent"], div[class*="chat-"], [class*="messagesWrapper-"]', timeout=30000)
+    except: pass
+
+    # Fast path, without scrolls or delays: the selector that found messages last time. A
+    # fallback winner (e.g. '[role="listitem"]' while the list was still rendering) must not
+    # shadow the better selectors, so those are tried first, in priority order.
+    winner = selector_registry.winners.get("message_list")
+    if winner in MESSAGE_LIST_SELECTORS:
+        for selector in MESSAGE_LIST_SELECTORS[:MESSAGE_LIST_SELECTORS.index(winner) + 1]:
+            try:
+                elements = page.locator(selector)
+                if await elements.count() > 0:
+                    selector_registry.record("message_list", selector)
+                    return selector, elements
+            except: continue
+    
+    for attempt in range(5): # Increase attempts
+        await page.evaluate("window.scrollTo(0, 0)")
+        await smart_delay(0.5, 1.5)
+        for selector in MESSAGE_LIST_SELECTORS:
+            try:
+                elements = page.locator(selector)
+                if await elements.count() > 0:
+                    selector_registry.record("message_list", selector)
+                    return selector, elements
+            except: continue
+        
+        # If not found, scroll to bottom and wait a bit longer
+        await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+        await smart_delay(1.0, 2.0)
+    
+    selector_registry.record("message_list", None)
+    return None, None
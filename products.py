@@ -0,0 +1,345 @@
+"""
+products.py - Product records derived from discord_messages rows
+
+extract_product() turns one raw archived message into the product the app shows. It used
+to run on every feed page, product detail, share page and push check; the archiver now
+runs it once at ingest (ingest_spool) and stores the result in the indexed products table,
+and backfill_products.py derives rows for messages archived before that:
+1. to_row(): product + region, store, numeric prices, signature, image, links, quality flag
+2. from_row(): the API shape of a stored row (what extract_product() returns)
+3. EXTRACT_VERSION is stored per row; bump it when extraction changes and re-run the backfill
+
+Pure functions only (no FastAPI / network), so the archiver, the API and scripts share them.
+"""
+
+import hashlib
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+import text_normalize
+
+EXTRACT_VERSION = 1
+
+DEFAULT_CHANNELS = [
+    {"id": "1367813504786108526", "name": "Collectors Amazon", "category": "UK Stores", "enabled": True},
+    {"id": "855164313006505994", "name": "Argos Instore", "category": "UK Stores", "enabled": True},
+    {"id": "864504557903937587", "name": "Restocks Online", "category": "UK Stores", "enabled": True},
+    {"id": "1394825979461111980", "name": "Chaos Cards", "category": "UK Stores", "enabled": True},
+    {"id": "1445485120231571730", "name": "Magic Madhouse", "category": "UK Stores", "enabled": True},
+    {"id": "1391616507406192701", "name": "Pokemon Center UK", "category": "UK Stores", "enabled": True},
+    {"id": "1445485873083711628", "name": "Smyths Toys", "category": "UK Stores", "enabled": True},
+    {"id": "1404906840118132928", "name": "Zaavi", "category": "UK Stores", "enabled": True},
+    {"id": "1404910797448286319", "name": "John Lewis", "category": "UK Stores", "enabled": True},
+    {"id": "1385348512681689118", "name": "Amazon", "category": "USA Stores", "enabled": True},
+    {"id": "1384205489679892540", "name": "Walmart", "category": "USA Stores", "enabled": True},
+    {"id": "1384205662023848018", "name": "Pokemon Center", "category": "USA Stores", "enabled": True},
+    {"id": "1391616295560155177", "name": "Pokemon Center", "category": "Canada Stores", "enabled": True},
+    {"id": "1406802285337776210", "name": "Hobbiesville", "category": "Canada Stores", "enabled": True}
+]
+
+
+@lru_cache(maxsize=1024)
+def optimize_image_url(url: str) -> str:
+    if not url: return url
+    try:
+        if "images-ext-" in url and "discordapp.net" in url:
+            if "/https/" in url: url = "https://" + url.split("/https/", 1)[1]
+            elif "/http/" in url: url = "http://" + url.split("/http/", 1)[1]
+        if any(domain in url for domain in ['media-amazon.com', 'images-amazon.com', 'ssl-images-amazon.com']):
+            url = re.sub(r'\._[A-Z_]+[0-9]+_\.', '.', url)
+            if "?" in url: url = url.split("?")[0]
+        if "ebayimg.com" in url:
+            if re.search(r's-l\d+\.', url): url = re.sub(r's-l\d+\.', 's-l1600.', url)
+            if "?" in url: url = url.split("?")[0]
+        if "discordapp.net" in url and "?" in url: url = url.split("?")[0]
+    except: pass
+    return url
+
+
+def parse_price(price_str: Any) -> float:
+    if not price_str: return 0.0
+    try:
+        # Remove currency symbols and commas, keep digits and dots
+        clean = re.sub(r'[^0-9.]', '', str(price_str))
+        if not clean or clean == '.' or clean == '..': return 0.0
+        return float(clean)
+    except:
+        return 0.0
+
+
+def content_signature(msg: Dict) -> str:
+    try:
+        raw = msg.get("raw_data", {})
+        embed = raw.get("embed") or {}
+        content = msg.get("content", "")
+        retailer = embed.get("author", {}).get("name", "") if embed.get("author") else ""
+        title = embed.get("title", "")
+        price = ""
+        for field in embed.get("fields", []):
+            name = (field.get("name") or "").lower()
+            if "price" in name:
+                price = field.get("value", "")
+                break
+        if not retailer or not title or not price:
+            if content and "|" in content:
+                parts = [p.strip() for p in content.split("|")]
+                if len(parts) >= 2:
+                    price_match = re.search(r'[£$€]\s*[\d,]+\.?\d*', content)
+                    if price_match: price = price_match.group(0)
+                    if not title: title = parts[0]
+                    if not retailer and len(parts) > 1: retailer = parts[1]
+        if not retailer and "Argos" in content: retailer = "Argos Instore"
+        c_retailer = text_normalize.signature_text(retailer)
+        c_title = text_normalize.signature_text(title)
+        # Increase length to 60 and add a snippet of description for better uniqueness
+        f_title = c_title[:60].strip()
+        desc_snippet = text_normalize.signature_text(embed.get("description", ""))[:15]
+        
+        num_match = re.search(r'[\d,]+\.?\d*', price)
+        c_price = num_match.group(0).replace(',', '') if num_match else price.strip()
+        
+        raw_sig = f"{c_retailer}|{f_title}|{c_price}|{desc_snippet}"
+        if len(raw_sig) < 8: return hashlib.md5(content.encode()).hexdigest() if content else str(msg.get("id"))
+        return hashlib.md5(raw_sig.encode()).hexdigest()
+    except: return str(msg.get("id"))
+
+
+def extract_product(msg, channel_map):
+    raw = msg.get("raw_data", {})
+    embeds = raw.get("embeds", [])
+    embed = raw.get("embed") or (embeds[0] if embeds else {})
+    ch_id = str(msg.get("channel_id", ""))
+    ch_info = channel_map.get(ch_id)
+    if not ch_info:
+        # Fallback: Try to guess or use default instead of returning None
+        ch_info = {"name": "HollowScan Deal", "category": "USA Stores"}
+        # If it's a known UK ID prefix or content has £, suggest UK
+        content = msg.get("content", "")
+        if "£" in content or "chaos" in content.lower():
+            ch_info["category"] = "UK Stores"
+
+    raw_region = ch_info.get('category', 'USA Stores').strip()
+    upper_reg = raw_region.upper()
+    if 'UK' in upper_reg: msg_region = 'UK Stores'
+    elif 'CANADA' in upper_reg: msg_region = 'Canada Stores'
+    else: msg_region = 'USA Stores'
+
+    subcategory = ch_info.get('name', 'Unknown')
+    raw_title = embed.get("title") or msg.get("content", "")[:100] or "HollowScan Product"
+    title = text_normalize.display_text(raw_title)
+    if not title: title = "HollowScan Product"
+
+    description = embed.get("description") or ""
+    if not description and msg.get("content"):
+        description = re.sub(r'<@&?\d+>', '', msg.get("content", "")).strip()
+        description = text_normalize.strip_markdown_links(description)
+
+    image = None
+    if embed.get("images"): image = optimize_image_url(embed["images"][0])
+    elif embed.get("image") and isinstance(embed["image"], dict): image = optimize_image_url(embed["image"].get("url"))
+    elif embed.get("thumbnail") and isinstance(embed["thumbnail"], dict): image = optimize_image_url(embed["thumbnail"].get("url"))
+
+    if not image and embeds:
+        for extra_embed in embeds:
+            if extra_embed.get("images"): image = optimize_image_url(extra_embed["images"][0]); break
+            elif extra_embed.get("image") and isinstance(extra_embed["image"], dict): image = optimize_image_url(extra_embed["image"].get("url")); break
+            elif extra_embed.get("thumbnail") and isinstance(extra_embed["thumbnail"], dict): image = optimize_image_url(extra_embed["thumbnail"].get("url")); break
+
+    if not image and raw.get("attachments"):
+        for att in raw["attachments"]:
+            if any(att.get("filename", "").lower().endswith(ext) for ext in ['.png', '.jpg', '.jpeg', '.webp']): image = att.get("url"); break
+
+    if not image and msg.get("content"):
+        img_match = re.search(r'(https?://[^\s]+(?:\.png|\.jpg|\.jpeg|\.webp))', msg["content"], re.IGNORECASE)
+        if img_match: image = img_match.group(1)
+
+    price, resell, roi, was_price = None, None, None, None
+    details = []
+    product_data_updates = {}
+
+    if embed.get("fields"):
+        for field in embed["fields"]:
+            name = (field.get("name") or "").strip()
+            val = (field.get("value") or "").strip()
+            if not name or not val: continue
+            if "[" in val and "](" in val: continue
+
+            name_lower = name.lower()
+            matches = re.findall(r'[\d,.]+', val)
+            # Use the FIRST match as the primary price (e.g. "39.95 CAD (29.29 USD)" -> 39.95)
+            num = matches[0].replace(',', '') if matches else None
+
+            is_redundant = False
+            if num:
+                if any(k in name_lower for k in ["price", "retail", "cost"]):
+                    if not price:
+                        price = num
+                        if "~~" in val or "(" in val: product_data_updates["price_display"] = val
+                    is_redundant = True
+                elif any(k in name_lower for k in ["resell", "resale", "sell"]):
+                    if not resell: resell = num
+                    is_redundant = True
+                elif "roi" in name_lower or "profit" in name_lower:
+                    if not roi: roi = num
+                    is_redundant = True
+                elif any(k in name_lower for k in ["was", "before", "original"]):
+                    if not was_price: was_price = num
+                    is_redundant = True
+
+            if not is_redundant: details.append({"label": name, "value": val})
+
+    all_links = []
+    # 1. Title URL
+    if embed.get("title_url"): all_links.append({"url": embed["title_url"], "text": "Link"})
+    
+    # 2. Field Markdown Links
+    if embed.get("fields"):
+        for field in embed["fields"]:
+            val = field.get("value", "")
+            matches = re.findall(r'\[([^\]]+)\]\((https?://[^\)]+)\)', val)
+            for text, url in matches: all_links.append({"url": url, "text": text})
+
+    # 3. Dedicated Links Array (from archiver)
+    if embed.get("links"):
+        for link in embed["links"]:
+            l_url = link.get("url")
+            l_text = link.get("text") or "Link"
+            if l_url and l_url.startswith("http") and not any(x["url"] == l_url for x in all_links):
+                all_links.append({"url": l_url, "text": l_text})
+
+    categorized_links = {"buy": [], "ebay": [], "fba": [], "other": []}
+    primary_buy_url = None
+
+    for link in all_links:
+        url, text = link.get('url', ''), (link.get('text') or 'Link').strip()
+        if not url: continue
+        link_obj = {"text": text, "url": url}
+        u_low, t_low = url.lower(), text.lower()
+
+        if any(k in t_low or k in u_low for k in ['buy', 'shop', 'purchase', 'checkout', 'cart', 'link']):
+            categorized_links["buy"].append(link_obj)
+            if not primary_buy_url: primary_buy_url = url
+        elif any(k in t_low or k in u_low for k in ['sold', 'active', 'google', 'ebay']): categorized_links["ebay"].append(link_obj)
+        elif any(k in t_low or k in u_low for k in ['keepa', 'amazon', 'selleramp', 'fba', 'camel']): categorized_links["fba"].append(link_obj)
+        else: categorized_links["other"].append(link_obj)
+
+    components = raw.get("components", [])
+    for comp_row in components:
+        sub_comps = comp_row.get("components", [])
+        for comp in sub_comps:
+            url = comp.get("url")
+            label = comp.get("label") or "Link"
+            if url and url.startswith("http"):
+                link_obj = {"text": label, "url": url}
+                u_low, t_low = url.lower(), label.lower()
+                if any(ext['url'] == url for sub in categorized_links.values() for ext in sub): continue
+                if any(k in t_low or k in u_low for k in ['buy', 'shop', 'purchase', 'checkout', 'cart', 'link']):
+                    categorized_links["buy"].append(link_obj)
+                    if not primary_buy_url: primary_buy_url = url
+                elif any(k in t_low or k in u_low for k in ['sold', 'active', 'google', 'ebay']): categorized_links["ebay"].append(link_obj)
+                elif any(k in t_low or k in u_low for k in ['keepa', 'amazon', 'selleramp', 'fba', 'camel']): categorized_links["fba"].append(link_obj)
+                else: categorized_links["other"].append(link_obj)
+
+    if not primary_buy_url and embed.get("fields"):
+         for field in embed["fields"]:
+             link_match = re.search(r'\[([^\]]+)\]\((https?://[^\)]+)\)', field.get("value", ""))
+             if link_match: primary_buy_url = link_match.group(2); break
+
+    product_data = {
+        "title": title[:100], "description": description[:500],
+        "image": image or "https://via.placeholder.com/400",
+        "price": price, "was_price": was_price, "resell": resell, "roi": roi,
+        "buy_url": primary_buy_url or (all_links[0].get('url') if all_links else None),
+        "links": categorized_links, "details": details
+    }
+    # Dimensions recorded by the archiver for the main embed image
+    media = raw.get("media")
+    if media and image and media.get("source_url") and optimize_image_url(media["source_url"]) == image:
+        product_data["image_meta"] = {k: media.get(k) for k in ("width", "height", "size", "sha256")}
+    product_data.update(product_data_updates)
+    return {"id": str(msg.get("id")), "region": msg_region, "category_name": subcategory, "product_data": product_data, "created_at": msg.get("scraped_at"), "is_locked": False}
+
+
+def build_channel_map(channels: List[Dict], defaults: List[Dict] = DEFAULT_CHANNELS) -> Dict[str, Dict]:
+    """channel id -> {'category', 'name'} for the enabled channels, DEFAULT_CHANNELS filling the gaps"""
+    channel_map = {}
+    for c in channels or []:
+        if c.get('enabled', True): channel_map[c['id']] = {'category': c.get('category', 'USA Stores').strip(), 'name': c.get('name', 'Unknown').strip()}
+    for c in defaults:
+        if c['id'] not in channel_map: channel_map[c['id']] = {'category': c.get('category', 'USA Stores').strip(), 'name': c.get('name', 'Unknown').strip()}
+    return channel_map
+
+
+def has_quality(p_data: Dict) -> bool:
+    """Feed / push qualification: an image, any price or any link"""
+    has_image = p_data.get("image") and "placeholder" not in p_data.get("image")
+    has_links = bool(p_data.get("buy_url") or (p_data.get("links") and any(p_data["links"].values())))
+    try:
+        p_num = float(str(p_data.get("price") or 0).replace(',', ''))
+        r_num = float(str(p_data.get("resell") or 0).replace(',', ''))
+        w_num = float(str(p_data.get("was_price") or 0).replace(',', ''))
+        has_any_price = p_num > 0 or r_num > 0 or w_num > 0
+    except: has_any_price = False
+    return bool(has_image or has_any_price or has_links)
+
+
+def search_text(product: Dict) -> str:
+    """Lowercased title / description / store, the text feed search matches keywords against"""
+    p_data = product.get("product_data", {})
+    return f"{p_data.get('title','')}\n{p_data.get('description','')}\n{product.get('category_name','')}".lower()
+
+
+def _amount(value: Any) -> Optional[float]:
+    amount = parse_price(value)
+    return amount if amount > 0 else None
+
+
+def to_row(msg: Dict, channel_map: Dict[str, Dict]) -> Dict[str, Any]:
+    """products table row for one discord_messages row"""
+    product = extract_product(msg, channel_map)
+    p_data = product["product_data"]
+    return {
+        "id": int(msg["id"]),
+        "channel_id": str(msg.get("channel_id", "")),
+        "scraped_at": msg.get("scraped_at") or None,
+        "region": product["region"],
+        "store": product["category_name"],
+        "title": p_data.get("title"),
+        "price": _amount(p_data.get("price")),
+        "was_price": _amount(p_data.get("was_price")),
+        "resell": _amount(p_data.get("resell")),
+        "roi": _amount(p_data.get("roi")),
+        "signature": content_signature(msg),
+        "image": p_data.get("image"),
+        "buy_url": p_data.get("buy_url"),
+        "links": p_data.get("links"),
+        "product_data": p_data,
+        "is_quality": has_quality(p_data),
+        "search_text": search_text(product),
+        "extract_version": EXTRACT_VERSION
+    }
+
+
+def derive_rows(messages: List[Dict], channel_map: Dict[str, Dict]) -> List[Dict[str, Any]]:
+    """to_row() over a batch; a message extraction fails on is skipped"""
+    rows = []
+    for msg in messages:
+        try:
+            rows.append(to_row(msg, channel_map))
+        except Exception as e:
+            print(f"[PRODUCTS] Could not derive product for message {msg.get('id')}: {e}")
+    return rows
+
+
+# Columns the API reads back (from_row + the feed filters)
+ROW_SELECT = "id,scraped_at,region,store,signature,is_quality,search_text,product_data"
+
+
+def from_row(row: Dict) -> Dict[str, Any]:
+    """API product (the extract_product() shape) for a stored row"""
+    return {
+        "id": str(row["id"]), "region": row["region"], "category_name": row["store"],
+        "product_data": row["product_data"], "created_at": row.get("scraped_at"), "is_locked": False,
+        "content_signature": row.get("signature")
+    }
@@ -113,13 +113,68 @@ AFTER INSERT ON alerts
 FOR EACH ROW
 EXECUTE FUNCTION auto_discover_category();
 
--- 8. INDEXES
+-- 8. CHANNEL LEASES (archiver scale-out, see channel_leases.py)
+-- One row per Discord channel URL plus one 'worker:<id>' presence row per live worker.
+-- expires_at is a Unix timestamp; 0 means released.
+CREATE TABLE IF NOT EXISTS channel_leases (
+    channel TEXT PRIMARY KEY,
+    worker_id TEXT NOT NULL DEFAULT '',
+    expires_at DOUBLE PRECISION NOT NULL DEFAULT 0,
+    hwm TEXT -- Last archived message snowflake, handed to the next holder
+);
+
+-- 9. KV STATE (shared JSON state of the bot / API / archiver, see kv_state.py)
+-- One row per key; every write is a compare-and-swap on version (0 = row absent).
+CREATE TABLE IF NOT EXISTS kv_state (
+    namespace TEXT NOT NULL, -- e.g. 'bot_users', 'active_codes', 'channels'
+    key TEXT NOT NULL,
+    value JSONB NOT NULL,
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (namespace, key)
+);
+
+-- 10. PRODUCTS (derived from discord_messages at ingest, see products.py / backfill_products.py)
+-- One row per archived message; product_data is the API product, the other columns are
+-- what the feed and push worker filter, sort and dedupe on.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE TABLE IF NOT EXISTS products (
+    id BIGINT PRIMARY KEY REFERENCES discord_messages(id) ON DELETE CASCADE,
+    channel_id TEXT NOT NULL,
+    scraped_at TIMESTAMPTZ, -- NULL only for an edit upserted before its message was derived
+    region TEXT NOT NULL, -- 'UK Stores', 'USA Stores', 'Canada Stores'
+    store TEXT NOT NULL,
+    title TEXT,
+    price NUMERIC,
+    was_price NUMERIC,
+    resell NUMERIC,
+    roi NUMERIC,
+    signature TEXT NOT NULL, -- Content signature used to dedupe reposted deals
+    image TEXT,
+    buy_url TEXT,
+    links JSONB, -- {"buy": [...], "ebay": [...], "fba": [...], "other": [...]}
+    product_data JSONB NOT NULL,
+    is_quality BOOLEAN NOT NULL DEFAULT FALSE, -- Has an image, a price or a link
+    search_text TEXT, -- Lowercased title / description / store
+    extract_version SMALLINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- 11. INDEXES
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
 CREATE INDEX IF NOT EXISTS idx_users_subscription ON users(subscription_status, subscription_end);
 CREATE INDEX IF NOT EXISTS idx_telegram_links_user ON user_telegram_links(user_id);
 CREATE INDEX IF NOT EXISTS idx_telegram_links_telegram ON user_telegram_links(telegram_id);
 CREATE INDEX IF NOT EXISTS idx_saved_deals_user ON saved_deals(user_id);
 CREATE INDEX IF NOT EXISTS idx_categories_country ON categories(country_code);
+CREATE INDEX IF NOT EXISTS idx_channel_leases_worker ON channel_leases(worker_id);
+-- Feed keyset pagination: (scraped_at, id) < cursor ORDER BY scraped_at DESC, id DESC
+CREATE INDEX IF NOT EXISTS idx_products_feed ON products(scraped_at DESC, id DESC) WHERE is_quality;
+CREATE INDEX IF NOT EXISTS idx_products_region ON products(region, scraped_at DESC, id DESC) WHERE is_quality;
+CREATE INDEX IF NOT EXISTS idx_discord_messages_feed ON discord_messages(scraped_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_discord_messages_channel_feed ON discord_messages(channel_id, scraped_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_products_signature ON products(signature);
+CREATE INDEX IF NOT EXISTS idx_products_search ON products USING GIN (search_text gin_trgm_ops);
 
 -- 7. INITIAL DATA (Optional)
 INSERT INTO categories (country_code, category_name, display_name) VALUES
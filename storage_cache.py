@@ -0,0 +1,202 @@
+"""
+storage_cache.py - Conditional (ETag / Last-Modified) fetches for Supabase Storage objects
+
+The JSON state files in the monitor-data bucket (channels.json, bot_users.json, ...) are
+re-read every few seconds by the bot, the API and the archiver but change rarely:
+1. The last body of every object is kept with its ETag / Last-Modified, in memory and
+   under data/storage_cache so a restart revalidates instead of re-downloading
+2. Every fetch sends If-None-Match / If-Modified-Since; an unchanged object costs a 304
+3. A new StorageObject is returned only when the body changed, so callers skip re-parsing
+   with an identity check (obj is last_obj); json() parses once per body
+4. A failed request serves the last known body (stale) instead of nothing
+
+get() uses the shared requests session, aget() an httpx.AsyncClient, so sync and async
+callers share one cache per process.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import quote
+
+import supabase_utils
+
+CACHE_DIR = os.path.join("data", "storage_cache")
+
+
+class StorageObject:
+    """One version of an object's body. json() is memoized - treat its result as read-only."""
+
+    def __init__(self, body: bytes, etag: Optional[str], last_modified: Optional[str], fetched_at: float):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self._parsed = None
+        self._has_parsed = False
+
+    def json(self) -> Any:
+        if not self._has_parsed:
+            self._parsed = json.loads(self.body)
+            self._has_parsed = True
+        return self._parsed
+
+
+class StorageObjectCache:
+    """Last body + validators per (bucket, path), revalidated with conditional GETs"""
+
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._entries: Dict[str, StorageObject] = {}
+        self.stats = {"requests": 0, "fresh": 0, "not_modified": 0, "downloaded": 0,
+                      "stale_served": 0, "errors": 0, "bytes_downloaded": 0, "bytes_saved": 0}
+
+    # --- Entries ---
+    def _key(self, bucket: str, path: str) -> str:
+        return f"{bucket}/{path}"
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest())
+
+    def _entry(self, key: str) -> Optional[StorageObject]:
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            return entry
+        base = self._disk_path(key)
+        try:
+            with open(base + ".meta", "r") as f:
+                meta = json.load(f)
+            with open(base + ".body", "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        entry = StorageObject(body, meta.get("etag"), meta.get("last_modified"), 0.0)
+        with self._lock:
+            self._entries.setdefault(key, entry)
+        return entry
+
+    def _store(self, key: str, body: bytes, headers) -> StorageObject:
+        entry = StorageObject(body, headers.get("etag"), headers.get("last-modified"), time.time())
+        with self._lock:
+            self._entries[key] = entry
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            base = self._disk_path(key)
+            with open(base + ".body", "wb") as f:
+                f.write(body)
+            with open(base + ".meta", "w") as f:
+                json.dump({"key": key, "etag": entry.etag, "last_modified": entry.last_modified}, f)
+        except OSError:
+            pass
+        return entry
+
+    def _drop(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+        base = self._disk_path(key)
+        for suffix in (".body", ".meta"):
+            try:
+                os.remove(base + suffix)
+            except OSError:
+                pass
+
+    def invalidate(self, bucket: str, path: str):
+        """Forget an object (e.g. after uploading it) so the next fetch downloads it"""
+        self._drop(self._key(bucket, path))
+
+    # --- Request / response handling shared by get() and aget() ---
+    def _prepare(self, bucket: str, path: str, max_age: float):
+        """Returns (key, cached entry, url, headers); url is None when the entry is fresh enough"""
+        url, api_key = supabase_utils.get_supabase_config()
+        key = self._key(bucket, path)
+        entry = self._entry(key)
+        self.stats["requests"] += 1
+        if entry is not None and max_age and time.time() - entry.fetched_at < max_age:
+            self.stats["fresh"] += 1
+            return key, entry, None, None
+        headers = {'apikey': api_key, 'Authorization': f'Bearer {api_key}'}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        return key, entry, f"{url}/storage/v1/object/authenticated/{bucket}/{quote(path)}", headers
+
+    def _handle(self, key: str, entry: Optional[StorageObject], status: int, body: bytes, headers) -> Optional[StorageObject]:
+        if status == 304 and entry is not None:
+            self.stats["not_modified"] += 1
+            self.stats["bytes_saved"] += len(entry.body)
+            entry.fetched_at = time.time()
+            return entry
+        if status == 200:
+            self.stats["downloaded"] += 1
+            self.stats["bytes_downloaded"] += len(body)
+            if entry is not None and entry.body == body:
+                # Server ignored the validators but nothing changed - keep the parsed copy
+                entry.etag = headers.get("etag") or entry.etag
+                entry.last_modified = headers.get("last-modified") or entry.last_modified
+                entry.fetched_at = time.time()
+                return entry
+            return self._store(key, body, headers)
+        if status == 404 or (status == 400 and b"not_found" in (body or b"")):
+            # Supabase Storage answers a missing object with 404, or 400 + {"error": "not_found"};
+            # any other 400 (bad token, bucket config) is a failure, so the last copy is served
+            self._drop(key)
+            return None
+        return self._stale(entry, f"HTTP {status}")
+
+    def _stale(self, entry: Optional[StorageObject], error: str) -> Optional[StorageObject]:
+        self.stats["errors"] += 1
+        if entry is None:
+            print(f"[STORAGE CACHE] Fetch failed: {error}")
+            return None
+        self.stats["stale_served"] += 1
+        return entry
+
+    # --- Fetch ---
+    def get(self, bucket: str, path: str, max_age: float = 0) -> Optional[StorageObject]:
+        """
+        Fetch an object through the shared requests session. max_age > 0 skips the round
+        trip entirely when the cached copy was validated that recently.
+        """
+        key, entry, url, headers = self._prepare(bucket, path, max_age)
+        if url is None:
+            return entry
+        try:
+            response = supabase_utils.get_http_session().get(url, headers=headers, timeout=30)
+        except Exception as e:
+            return self._stale(entry, str(e))
+        return self._handle(key, entry, response.status_code, response.content, response.headers)
+
+    async def aget(self, bucket: str, path: str, max_age: float = 0, client=None) -> Optional[StorageObject]:
+        """get() for event-loop callers (pass the caller's own httpx.AsyncClient if it has one)"""
+        key, entry, url, headers = self._prepare(bucket, path, max_age)
+        if url is None:
+            return entry
+        if client is None:
+            import supabase_utils_async
+            client = supabase_utils_async.get_async_client()
+        try:
+            response = await client.get(url, headers=headers, timeout=30)
+        except Exception as e:
+            return self._stale(entry, str(e))
+        return self._handle(key, entry, response.status_code, response.content, response.headers)
+
+    def get_stats(self) -> Dict[str, Any]:
+        revalidated = self.stats["not_modified"] + self.stats["downloaded"]
+        served_from_cache = self.stats["fresh"] + self.stats["not_modified"]
+        return {
+            **self.stats,
+            "objects": len(self._entries),
+            "hit_rate_percent": round(served_from_cache / self.stats["requests"] * 100, 2) if self.stats["requests"] else 0,
+            "not_modified_rate_percent": round(self.stats["not_modified"] / revalidated * 100, 2) if revalidated else 0
+        }
+
+
+# Process-wide instance shared by supabase_utils / supabase_utils_async and the API
+storage_cache = StorageObjectCache()
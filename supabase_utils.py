@@ -7,7 +7,12 @@ FIXED: Uses direct HTTP requests to bypass Supabase client library issues
 import os
 import json
 import pickle
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import text_normalize
 from typing import Optional, Dict, Any, List
 from dotenv import load_dotenv
 import re
@@ -34,40 +39,123 @@ def get_supabase_config():
     return url, key
 
 
+# -------------------
+# Shared HTTP session (keep-alive connection pool)
+# -------------------
+HTTP_POOL_HOSTS = int(os.getenv("HTTP_POOL_HOSTS", "8"))            # Hosts with a cached pool
+HTTP_POOL_PER_HOST = int(os.getenv("HTTP_POOL_PER_HOST", "16"))     # Kept-alive connections per host
+HTTP_DEFAULT_TIMEOUT = float(os.getenv("HTTP_DEFAULT_TIMEOUT", "15"))
+
+_http_session = None
+_storage_client = None
+_client_lock = threading.Lock()
+
+
+class _PooledSession(requests.Session):
+    """Session that applies HTTP_DEFAULT_TIMEOUT when a call does not pass one"""
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", HTTP_DEFAULT_TIMEOUT)
+        return super().request(method, url, **kwargs)
+
+
+def get_http_session() -> requests.Session:
+    """
+    Process-wide pooled session for Supabase REST (and other hot-path HTTP).
+    Connections are kept alive per host, so repeated calls skip the TCP/TLS handshake.
+    Retries: connection failures for every method (nothing reached the server), plus
+    502/503/504 for idempotent methods only - a POST is never replayed after it was sent.
+    requests.Session is safe to share across threads for this usage.
+    """
+    global _http_session
+    if _http_session is None:
+        with _client_lock:
+            if _http_session is None:
+                retry = Retry(
+                    total=3, connect=3, read=0, backoff_factor=0.5,
+                    status_forcelist=(502, 503, 504),
+                    allowed_methods=frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}),
+                    raise_on_status=False
+                )
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_POOL_PER_HOST, max_retries=retry)
+                session = _PooledSession()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _http_session = session
+    return _http_session
+
+
 # -------------------
 # CRITICAL: Ultra-Aggressive Text Sanitization
 # -------------------
 def sanitize_text(text: str, max_length: int = 2000) -> str:
     """
-    Ultra-aggressive text cleaning for HTTP safety
+    Ultra-aggressive text cleaning for HTTP safety (see text_normalize.sanitize_text)
     """
-    if not text:
-        return ""
-    
-    text = str(text)
-    
-    # Step 1: Remove ALL problematic characters
-    text = text.replace('\x00', '')  # Null bytes
-    text = text.replace('\r', ' ')   # Carriage returns
-    text = text.replace('\n', ' ')   # Newlines
-    text = text.replace('\t', ' ')   # Tabs
-    
-    # Step 2: Remove ALL control characters (0-31) and DEL (127)
-    text = ''.join(char for char in text if ord(char) >= 32 and ord(char) != 127)
-    
-    # Step 3: Collapse whitespace
-    text = ' '.join(text.split())
-    
-    # Step 5: Limit length
-    if len(text) > max_length:
-        text = text[:max_length]
-    
-    return text.strip()
+    return text_normalize.sanitize_text(text, max_length)
 
 
 # -------------------
 # NEW: Direct HTTP API for Database Operations
 # -------------------
+def clean_discord_message(msg: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Sanitize one message row for the discord_messages table.
+    Returns None if the row has no usable id/channel.
+    """
+    cleaned = {
+        "id": int(msg["id"]),
+        "channel_id": sanitize_text(str(msg.get("channel_id", "")), 50),
+        "content": sanitize_text(msg.get("content", ""), 2000),
+        "scraped_at": str(msg.get("scraped_at", ""))[:50],
+        "raw_data": msg.get("raw_data", {})
+    }
+    if cleaned["id"] and cleaned["channel_id"]:
+        return cleaned
+    return None
+
+
+def _post_rows(table: str, batch: List[Dict[str, Any]], timeout: int, merge: bool) -> int:
+    url, key = get_supabase_config()
+    resolution = 'merge-duplicates' if merge else 'ignore-duplicates'
+    headers = {
+        'apikey': key,
+        'Authorization': f'Bearer {key}',
+        'Content-Type': 'application/json',
+        'Prefer': f'resolution={resolution}, return=minimal'
+    }
+    try:
+        response = get_http_session().post(
+            f"{url}/rest/v1/{table}",
+            headers=headers,
+            data=json.dumps(batch, ensure_ascii=True),
+            timeout=timeout
+        )
+        if response.status_code not in [200, 201, 204]:
+            print(f"   ❌ {table} insert failed: HTTP {response.status_code} {response.text[:200]}")
+        return response.status_code
+    except Exception as e:
+        print(f"   ❌ {table} insert error: {e}")
+        return 0
+
+
+def post_discord_messages(batch: List[Dict[str, Any]], timeout: int = 30, merge: bool = False) -> int:
+    """
+    POST one batch of already-cleaned rows to discord_messages.
+    Duplicates are ignored, or with merge=True upserted (edited messages).
+    Returns the HTTP status code, or 0 on a network error.
+    """
+    return _post_rows("discord_messages", batch, timeout, merge)
+
+
+def post_product_rows(batch: List[Dict[str, Any]], timeout: int = 30, merge: bool = False) -> int:
+    """
+    POST one batch of products rows (products.to_row). Same duplicate handling and
+    return value as post_discord_messages.
+    """
+    return _post_rows("products", batch, timeout, merge)
+
+
 def insert_discord_messages_direct(messages: List[Dict[str, Any]], debug: bool = True) -> bool:
     """
     Insert messages using direct HTTP POST to Supabase REST API.
@@ -76,38 +164,17 @@ def insert_discord_messages_direct(messages: List[Dict[str, Any]], debug: bool =
     if not messages:
         return False
     
-    url, key = get_supabase_config()
-    
     # Ultra-small batch size
     BATCH_SIZE = 5
     total_inserted = 0
     
-    # Prepare headers
-    headers = {
-        'apikey': key,
-        'Authorization': f'Bearer {key}',
-        'Content-Type': 'application/json',
-        'Prefer': 'resolution=ignore-duplicates, return=minimal'
-    }
-    
-    endpoint = f"{url}/rest/v1/discord_messages"
-    
     # Clean ALL messages first
     cleaned_messages = []
     for msg in messages:
         try:
-            cleaned = {
-                "id": int(msg["id"]),
-                "channel_id": sanitize_text(str(msg.get("channel_id", "")), 50),
-                "content": sanitize_text(msg.get("content", ""), 2000),
-                "scraped_at": str(msg.get("scraped_at", ""))[:50],
-                "raw_data": msg.get("raw_data", {})
-            }
-            
-            # Only add if valid
-            if cleaned["id"] and cleaned["channel_id"]:
+            cleaned = clean_discord_message(msg)
+            if cleaned:
                 cleaned_messages.append(cleaned)
-                
         except Exception as e:
             if debug:
                 print(f"   ⚠️ Skipped message: {e}")
@@ -120,31 +187,14 @@ def insert_discord_messages_direct(messages: List[Dict[str, Any]], debug: bool =
     # Send in tiny batches
     for i in range(0, len(cleaned_messages), BATCH_SIZE):
         batch = cleaned_messages[i : i + BATCH_SIZE]
+        status = post_discord_messages(batch)
         
-        try:
-            # Convert to JSON string
-            json_data = json.dumps(batch, ensure_ascii=True)
-            
-            # Make direct HTTP POST
-            response = requests.post(
-                endpoint,
-                headers=headers,
-                data=json_data,
-                timeout=30
-            )
-            
-            if response.status_code in [200, 201, 204]:
-                total_inserted += len(batch)
-                if debug:
-                    print(f"   ✅ Batch {i//BATCH_SIZE + 1} uploaded ({len(batch)} msgs)")
-            else:
-                if debug:
-                    print(f"   ❌ Batch {i//BATCH_SIZE + 1} failed: HTTP {response.status_code}")
-                    print(f"      Response: {response.text[:200]}")
-                
-        except Exception as e:
+        if status in [200, 201, 204]:
+            total_inserted += len(batch)
             if debug:
-                print(f"   ❌ Batch {i//BATCH_SIZE + 1} error: {e}")
+                print(f"   ✅ Batch {i//BATCH_SIZE + 1} uploaded ({len(batch)} msgs)")
+        elif debug:
+            print(f"   ❌ Batch {i//BATCH_SIZE + 1} failed: HTTP {status}")
     
     if debug:
         print(f"✅ Inserted {total_inserted}/{len(messages)} messages")
@@ -156,10 +206,15 @@ def insert_discord_messages_direct(messages: List[Dict[str, Any]], debug: bool =
 # Legacy Supabase Client (for storage operations)
 # -------------------
 def get_supabase_client():
-    """Create Supabase client (only for storage operations)"""
-    from supabase import create_client
-    url, key = get_supabase_config()
-    return create_client(url, key)
+    """Supabase client for storage operations, created once per process (its HTTP pool is reused)"""
+    global _storage_client
+    if _storage_client is None:
+        with _client_lock:
+            if _storage_client is None:
+                from supabase import create_client
+                url, key = get_supabase_config()
+                _storage_client = create_client(url, key)
+    return _storage_client
 
 
 def upload_file(file_path: str, bucket: str = BUCKET_NAME, remote_path: str = None, debug: bool = True) -> bool:
@@ -180,10 +235,36 @@ def upload_file(file_path: str, bucket: str = BUCKET_NAME, remote_path: str = No
         return False
 
 
+def upload_bytes(data: bytes, bucket: str = BUCKET_NAME, remote_path: str = None,
+                 content_type: str = "application/octet-stream", debug: bool = True) -> bool:
+    """Upload in-memory bytes (no temp file) - used for content-addressed media"""
+    supabase = get_supabase_client()
+    try:
+        supabase.storage.from_(bucket).upload(remote_path, data, {"upsert": "true", "content-type": content_type})
+        if debug:
+            print(f"✅ Uploaded {remote_path}")
+        return True
+    except Exception as e:
+        if debug:
+            print(f"❌ Upload failed for {remote_path}: {e}")
+        return False
+
+
+def fetch_storage_object(file_name: str, bucket: str = BUCKET_NAME, max_age: float = 0):
+    """
+    Conditional fetch through the process-wide storage cache (see storage_cache.py).
+    Returns a StorageObject - the same instance while the object is unchanged - or None.
+    """
+    from storage_cache import storage_cache
+    return storage_cache.get(bucket, file_name, max_age)
+
+
 def download_file(save_path: str, file_name: str, bucket: str = BUCKET_NAME) -> Optional[bytes]:
     try:
-        supabase = get_supabase_client()
-        data = supabase.storage.from_(bucket).download(file_name)
+        obj = fetch_storage_object(file_name, bucket)
+        if obj is None:
+            return None
+        data = obj.body
         os.makedirs(os.path.dirname(save_path) or ".", exist_ok=True)
         with open(save_path, "wb") as f:
             f.write(data)
@@ -230,28 +311,12 @@ def test_single_message(message: Dict[str, Any]) -> bool:
 # -------------------
 # CATEGORY SYNC FOR MOBILE APP
 # -------------------
-def sync_categories_to_sql(categories_list: List[Dict], debug: bool = True) -> bool:
+def build_sql_categories(categories_list: List[Dict]) -> List[Dict]:
     """
-    Sync bot channels to the Supabase SQL 'categories' table.
-    Ensures mobile filters match the active channels.
+    Map bot channels to rows of the SQL 'categories' table.
+    Bot 'category' field examples: "US Stores", "UK Stores", "Canada Stores"
+    SQL fields: country_code, category_name, display_name
     """
-    if not categories_list:
-        return False
-        
-    url, key = get_supabase_config()
-    headers = {
-        'apikey': key,
-        'Authorization': f'Bearer {key}',
-        'Content-Type': 'application/json',
-        'Prefer': 'resolution=merge-duplicates, return=minimal'
-    }
-    
-    endpoint = f"{url}/rest/v1/categories"
-    
-    # 1. Map Bot Categories to SQL Structure
-    # Bot 'category' field examples: "US Stores", "UK Stores", "Canada Stores"
-    # SQL fields: country_code, category_name, display_name
-    
     sql_categories = []
     seen = set()
     
@@ -280,13 +345,34 @@ def sync_categories_to_sql(categories_list: List[Dict], debug: bool = True) -> b
             "display_name": f"{country} {sub_name}",
             "active": True
         })
+    return sql_categories
+
+
+def sync_categories_to_sql(categories_list: List[Dict], debug: bool = True) -> bool:
+    """
+    Sync bot channels to the Supabase SQL 'categories' table.
+    Ensures mobile filters match the active channels.
+    """
+    if not categories_list:
+        return False
+        
+    url, key = get_supabase_config()
+    headers = {
+        'apikey': key,
+        'Authorization': f'Bearer {key}',
+        'Content-Type': 'application/json',
+        'Prefer': 'resolution=merge-duplicates, return=minimal'
+    }
+    
+    endpoint = f"{url}/rest/v1/categories"
+    sql_categories = build_sql_categories(categories_list)
         
     if not sql_categories:
         return False
         
     try:
         # Upsert into SQL
-        response = requests.post(
+        response = get_http_session().post(
             endpoint,
             headers=headers,
             json=sql_categories,
@@ -334,7 +420,7 @@ def insert_alert(country_code: str, category_name: str, product_data: Dict, debu
     }
     
     try:
-        response = requests.post(
+        response = get_http_session().post(
             endpoint,
             headers=headers,
             json=payload,
@@ -383,7 +469,7 @@ def store_telegram_link_token(token: str, telegram_id: str, debug: bool = True)
     }
     
     try:
-        response = requests.post(endpoint, headers=headers, json=payload, timeout=10)
+        response = get_http_session().post(endpoint, headers=headers, json=payload, timeout=10)
         if response.status_code in [200, 201, 204]:
             if debug: print(f"✅ Stored link token for {telegram_id}")
             return True
@@ -408,7 +494,7 @@ def delete_user_telegram_link(telegram_id: str, debug: bool = True) -> bool:
     endpoint = f"{url}/rest/v1/user_telegram_links?telegram_id=eq.{telegram_id}"
     
     try:
-        response = requests.delete(endpoint, headers=headers, timeout=10)
+        response = get_http_session().delete(endpoint, headers=headers, timeout=10)
         if response.status_code in [200, 204]:
             if debug: print(f"✅ Unlinked Telegram ID {telegram_id}")
             return True
@@ -437,7 +523,7 @@ def link_app_user_to_telegram(user_id: str, telegram_id: str, telegram_username:
 
     try:
         # 1. Check if already linked
-        check_resp = requests.get(
+        check_resp = get_http_session().get(
             f"{url}/rest/v1/user_telegram_links?telegram_id=eq.{telegram_id}&select=user_id",
             headers=headers,
             timeout=10
@@ -449,7 +535,7 @@ def link_app_user_to_telegram(user_id: str, telegram_id: str, telegram_username:
                 if existing_uid != user_id:
                     # Telegram account linked to someone else - unlink it first (force re-link)
                     if debug: print(f"[LINK] Telegram {telegram_id} was linked to {existing_uid}, re-linking to {user_id}...")
-                    delete_resp = requests.delete(
+                    delete_resp = get_http_session().delete(
                         f"{url}/rest/v1/user_telegram_links?telegram_id=eq.{telegram_id}",
                         headers=headers,
                         timeout=10
@@ -469,7 +555,7 @@ def link_app_user_to_telegram(user_id: str, telegram_id: str, telegram_username:
         }
         
         # Using upsert so it updates if exists/re-adds
-        upsert_resp = requests.post(
+        upsert_resp = get_http_session().post(
             f"{url}/rest/v1/user_telegram_links", 
             headers={**headers, "Prefer": "resolution=merge-duplicates"},
             json=payload, 
@@ -492,7 +578,7 @@ def link_app_user_to_telegram(user_id: str, telegram_id: str, telegram_username:
             # Strategy: Overwrite with latest Telegram premium always, or check? 
             # For now, we trust the bot's call to sync.
             
-            patch_resp = requests.patch(
+            patch_resp = get_http_session().patch(
                 f"{url}/rest/v1/users?id=eq.{user_id}",
                 headers=headers,
                 json=user_update,
@@ -521,7 +607,7 @@ def sync_telegram_premium_to_app(telegram_id: str, expiry_iso: str, debug: bool
     
     try:
         # 1. Find linked user_id
-        check_resp = requests.get(
+        check_resp = get_http_session().get(
             f"{url}/rest/v1/user_telegram_links?telegram_id=eq.{telegram_id}&select=user_id",
             headers=headers,
             timeout=10
@@ -538,7 +624,7 @@ def sync_telegram_premium_to_app(telegram_id: str, expiry_iso: str, debug: bool
                     "subscription_source": "telegram"
                 }
                 
-                patch_resp = requests.patch(
+                patch_resp = get_http_session().patch(
                     f"{url}/rest/v1/users?id=eq.{user_id}",
                     headers=headers,
                     json=user_update,
@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+supabase_utils_async.py
+Async counterpart of supabase_utils for code running inside an event loop
+(telegram_bot handlers/jobs, the archiver loop).
+
+Same function names and return contracts as supabase_utils, awaited instead of blocking:
+- REST calls go through one pooled httpx.AsyncClient per event loop
+- Storage upload/download talk to the Storage REST API directly (no supabase client)
+- Pure helpers (config, sanitizing, row cleaning) are shared with supabase_utils
+"""
+
+import asyncio
+import json
+import os
+import weakref
+from typing import Optional, Dict, Any, List
+from urllib.parse import quote
+
+import httpx
+
+from supabase_utils import (
+    BUCKET_NAME, HTTP_DEFAULT_TIMEOUT, HTTP_POOL_PER_HOST,
+    get_supabase_config, clean_discord_message, build_sql_categories
+)
+
+# -------------------
+# Pooled async client (one per event loop - httpx clients are bound to their loop)
+# -------------------
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_background_tasks = set()
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Keep-alive AsyncClient for the running loop. Connection errors are retried by the transport."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(max_keepalive_connections=HTTP_POOL_PER_HOST, max_connections=HTTP_POOL_PER_HOST * 2),
+            timeout=httpx.Timeout(HTTP_DEFAULT_TIMEOUT),
+            transport=httpx.AsyncHTTPTransport(retries=2)
+        )
+        _clients[loop] = client
+    return client
+
+
+async def aclose():
+    """Close the running loop's client (call on shutdown)"""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client and not client.is_closed:
+        await client.aclose()
+
+
+def spawn(coro) -> asyncio.Task:
+    """Run a coroutine in the background on the running loop, keeping a reference until it finishes"""
+    task = asyncio.get_running_loop().create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+class CoalescedSync:
+    """
+    Runs an async sync job in the background. Triggers that arrive while a run is in
+    flight collapse into one follow-up run, so uploads never overlap or land out of order.
+    Outside an event loop the blocking fallback is called instead.
+    """
+
+    def __init__(self, job, fallback, name: str = "sync"):
+        self.job = job
+        self.fallback = fallback
+        self.name = name
+        self._task = None
+        self._again = False
+
+    def trigger(self):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self.fallback()
+            return
+        if self._task and not self._task.done():
+            self._again = True
+            return
+        self._task = spawn(self._run())
+
+    async def _run(self):
+        while True:
+            self._again = False
+            try:
+                await self.job()
+            except Exception as e:
+                print(f"❌ Background {self.name} failed: {e}")
+            if not self._again:
+                return
+
+
+def _rest_headers(key: str, **extra) -> Dict[str, str]:
+    return {'apikey': key, 'Authorization': f'Bearer {key}', **extra}
+
+
+# -------------------
+# Direct HTTP API for Database Operations
+# -------------------
+async def post_discord_messages(batch: List[Dict[str, Any]], timeout: int = 30, merge: bool = False) -> int:
+    """
+    POST one batch of already-cleaned rows to discord_messages.
+    Duplicates are ignored, or with merge=True upserted (edited messages).
+    Returns the HTTP status code, or 0 on a network error.
+    """
+    url, key = get_supabase_config()
+    resolution = 'merge-duplicates' if merge else 'ignore-duplicates'
+    headers = _rest_headers(key, **{
+        'Content-Type': 'application/json',
+        'Prefer': f'resolution={resolution}, return=minimal'
+    })
+    try:
+        response = await get_async_client().post(
+            f"{url}/rest/v1/discord_messages",
+            headers=headers,
+            content=json.dumps(batch, ensure_ascii=True),
+            timeout=timeout
+        )
+        if response.status_code not in [200, 201, 204]:
+            print(f"   ❌ discord_messages insert failed: HTTP {response.status_code} {response.text[:200]}")
+        return response.status_code
+    except Exception as e:
+        print(f"   ❌ discord_messages insert error: {e}")
+        return 0
+
+
+async def insert_discord_messages_direct(messages: List[Dict[str, Any]], debug: bool = True) -> bool:
+    """Clean and insert messages in batches of 5 (see supabase_utils.insert_discord_messages_direct)"""
+    if not messages:
+        return False
+
+    BATCH_SIZE = 5
+    total_inserted = 0
+
+    cleaned_messages = []
+    for msg in messages:
+        try:
+            cleaned = clean_discord_message(msg)
+            if cleaned:
+                cleaned_messages.append(cleaned)
+        except Exception as e:
+            if debug:
+                print(f"   ⚠️ Skipped message: {e}")
+
+    if not cleaned_messages:
+        if debug:
+            print("   ❌ No valid messages after cleaning")
+        return False
+
+    for i in range(0, len(cleaned_messages), BATCH_SIZE):
+        batch = cleaned_messages[i : i + BATCH_SIZE]
+        status = await post_discord_messages(batch)
+
+        if status in [200, 201, 204]:
+            total_inserted += len(batch)
+            if debug:
+                print(f"   ✅ Batch {i//BATCH_SIZE + 1} uploaded ({len(batch)} msgs)")
+        elif debug:
+            print(f"   ❌ Batch {i//BATCH_SIZE + 1} failed: HTTP {status}")
+
+    if debug:
+        print(f"✅ Inserted {total_inserted}/{len(messages)} messages")
+
+    return total_inserted > 0
+
+
+async def insert_discord_messages(messages: List[Dict[str, Any]], debug: bool = True) -> bool:
+    return await insert_discord_messages_direct(messages, debug)
+
+
+# -------------------
+# Storage (Storage REST API)
+# -------------------
+def _object_url(url: str, bucket: str, remote_path: str) -> str:
+    return f"{url}/storage/v1/object/{bucket}/{quote(remote_path)}"
+
+
+async def upload_bytes(data: bytes, bucket: str = BUCKET_NAME, remote_path: str = None,
+                       content_type: str = "application/octet-stream", debug: bool = True) -> bool:
+    url, key = get_supabase_config()
+    headers = _rest_headers(key, **{'Content-Type': content_type, 'x-upsert': 'true'})
+    try:
+        response = await get_async_client().post(_object_url(url, bucket, remote_path), headers=headers, content=data)
+        if response.status_code not in [200, 201]:
+            if debug:
+                print(f"❌ Upload failed for {remote_path}: HTTP {response.status_code} {response.text[:200]}")
+            return False
+        if debug:
+            print(f"✅ Uploaded {remote_path}")
+        return True
+    except Exception as e:
+        if debug:
+            print(f"❌ Upload failed for {remote_path}: {e}")
+        return False
+
+
+async def upload_file(file_path: str, bucket: str = BUCKET_NAME, remote_path: str = None, debug: bool = True) -> bool:
+    if not os.path.exists(file_path):
+        return False
+    with open(file_path, "rb") as f:
+        data = f.read()
+    return await upload_bytes(data, bucket, remote_path or os.path.basename(file_path), debug=debug)
+
+
+async def fetch_storage_object(file_name: str, bucket: str = BUCKET_NAME, max_age: float = 0):
+    """Conditional fetch through the shared storage cache (see supabase_utils.fetch_storage_object)"""
+    from storage_cache import storage_cache
+    return await storage_cache.aget(bucket, file_name, max_age)
+
+
+async def download_file(save_path: str, file_name: str, bucket: str = BUCKET_NAME) -> Optional[bytes]:
+    try:
+        obj = await fetch_storage_object(file_name, bucket)
+        if obj is None:
+            return None
+        data = obj.body
+        os.makedirs(os.path.dirname(save_path) or ".", exist_ok=True)
+        with open(save_path, "wb") as f:
+            f.write(data)
+        return data
+    except Exception as e:
+        print(f"DL Error {file_name}: {e}")
+        return None
+
+
+# -------------------
+# CATEGORY SYNC FOR MOBILE APP
+# -------------------
+async def sync_categories_to_sql(categories_list: List[Dict], debug: bool = True) -> bool:
+    if not categories_list:
+        return False
+    sql_categories = build_sql_categories(categories_list)
+    if not sql_categories:
+        return False
+
+    url, key = get_supabase_config()
+    headers = _rest_headers(key, **{
+        'Content-Type': 'application/json',
+        'Prefer': 'resolution=merge-duplicates, return=minimal'
+    })
+    try:
+        response = await get_async_client().post(f"{url}/rest/v1/categories", headers=headers, json=sql_categories, timeout=30)
+        if response.status_code in [200, 201, 204]:
+            if debug: print(f"✅ Synced {len(sql_categories)} categories to SQL")
+            return True
+        if debug:
+            print(f"❌ Category sync failed: HTTP {response.status_code}")
+            print(f"   Response: {response.text}")
+        return False
+    except Exception as e:
+        if debug: print(f"❌ Category sync error: {e}")
+        return False
+
+
+# -------------------
+# ALERT STORAGE FOR MOBILE APP
+# -------------------
+async def insert_alert(country_code: str, category_name: str, product_data: Dict, debug: bool = True) -> bool:
+    if not product_data:
+        return False
+
+    url, key = get_supabase_config()
+    headers = _rest_headers(key, **{'Content-Type': 'application/json', 'Prefer': 'return=minimal'})
+    payload = {
+        "country_code": country_code,
+        "category_name": category_name,
+        "product_data": product_data
+    }
+    try:
+        response = await get_async_client().post(f"{url}/rest/v1/alerts", headers=headers, json=payload, timeout=30)
+        if response.status_code in [200, 201, 204]:
+            if debug: print(f"✅ Alert stored: {product_data.get('title', 'Product')[:30]}...")
+            return True
+        if debug:
+            print(f"❌ Alert storage failed: HTTP {response.status_code}")
+            print(f"   Response: {response.text}")
+        return False
+    except Exception as e:
+        if debug: print(f"❌ Alert storage error: {e}")
+        return False
+
+
+# -------------------
+# TELEGRAM ACCOUNT LINKING
+# -------------------
+async def store_telegram_link_token(token: str, telegram_id: str, debug: bool = True) -> bool:
+    from datetime import datetime, timedelta, timezone
+    url, key = get_supabase_config()
+    headers = _rest_headers(key, **{'Content-Type': 'application/json', 'Prefer': 'return=minimal'})
+    expires_at = (datetime.now(timezone.utc) + timedelta(minutes=10)).isoformat().replace('+00:00', 'Z')
+    payload = {"token": token, "telegram_id": str(telegram_id), "expires_at": expires_at}
+    try:
+        response = await get_async_client().post(f"{url}/rest/v1/telegram_link_tokens", headers=headers, json=payload, timeout=10)
+        if response.status_code in [200, 201, 204]:
+            if debug: print(f"✅ Stored link token for {telegram_id}")
+            return True
+        if debug: print(f"❌ Failed to store token: {response.status_code} {response.text}")
+        return False
+    except Exception as e:
+        if debug: print(f"❌ Token storage error: {e}")
+        return False
+
+
+async def delete_user_telegram_link(telegram_id: str, debug: bool = True) -> bool:
+    url, key = get_supabase_config()
+    endpoint = f"{url}/rest/v1/user_telegram_links?telegram_id=eq.{telegram_id}"
+    try:
+        response = await get_async_client().delete(endpoint, headers=_rest_headers(key), timeout=10)
+        if response.status_code in [200, 204]:
+            if debug: print(f"✅ Unlinked Telegram ID {telegram_id}")
+            return True
+        if debug: print(f"❌ Link deletion failed: {response.status_code} {response.text}")
+        return False
+    except Exception as e:
+        if debug: print(f"❌ Link deletion error: {e}")
+        return False
+
+
+async def link_app_user_to_telegram(user_id: str, telegram_id: str, telegram_username: str = None,
+                                    premium_info: Dict = None, debug: bool = True) -> Dict:
+    """Same flow as supabase_utils.link_app_user_to_telegram: re-link, upsert, sync premium"""
+    from datetime import datetime, timezone
+    url, key = get_supabase_config()
+    headers = _rest_headers(key, **{'Content-Type': 'application/json', 'Prefer': 'return=minimal'})
+    now_iso = datetime.now(timezone.utc).replace(microsecond=0).isoformat().replace('+00:00', 'Z')
+    client = get_async_client()
+
+    try:
+        check_resp = await client.get(
+            f"{url}/rest/v1/user_telegram_links?telegram_id=eq.{telegram_id}&select=user_id",
+            headers=headers, timeout=10
+        )
+        if check_resp.status_code == 200:
+            existing = check_resp.json()
+            if existing:
+                existing_uid = existing[0]['user_id']
+                if existing_uid != user_id:
+                    if debug: print(f"[LINK] Telegram {telegram_id} was linked to {existing_uid}, re-linking to {user_id}...")
+                    delete_resp = await client.delete(
+                        f"{url}/rest/v1/user_telegram_links?telegram_id=eq.{telegram_id}",
+                        headers=headers, timeout=10
+                    )
+                    if delete_resp.status_code not in [200, 204]:
+                        if debug: print(f"❌ Failed to unlink old connection: {delete_resp.text}")
+                else:
+                    if debug: print(f"[LINK] Telegram {telegram_id} already linked to {user_id}, updating...")
+
+        payload = {
+            "user_id": user_id,
+            "telegram_id": str(telegram_id),
+            "telegram_username": telegram_username,
+            "linked_at": now_iso
+        }
+        upsert_resp = await client.post(
+            f"{url}/rest/v1/user_telegram_links",
+            headers={**headers, "Prefer": "resolution=merge-duplicates"},
+            json=payload, timeout=10
+        )
+        if upsert_resp.status_code not in [200, 201, 204]:
+            if debug: print(f"❌ Link upsert failed: {upsert_resp.text}")
+            return {"success": False, "message": "Database link failed."}
+
+        if premium_info and premium_info.get("status") == "active":
+            user_update = {
+                "subscription_status": "active",
+                "subscription_end": premium_info.get("end"),
+                "subscription_source": premium_info.get("source", "telegram")
+            }
+            patch_resp = await client.patch(f"{url}/rest/v1/users?id=eq.{user_id}", headers=headers, json=user_update, timeout=10)
+            if debug: print(f"✅ Synced premium for {user_id}: {patch_resp.status_code}")
+
+        if debug: print(f"✅ Linked {user_id} <-> {telegram_id}")
+        return {"success": True, "message": "Successfully linked!"}
+
+    except Exception as e:
+        if debug: print(f"❌ Link Exception: {e}")
+        return {"success": False, "message": str(e)}
+
+
+async def sync_telegram_premium_to_app(telegram_id: str, expiry_iso: str, debug: bool = True) -> bool:
+    url, key = get_supabase_config()
+    headers = _rest_headers(key, **{'Content-Type': 'application/json'})
+    client = get_async_client()
+    try:
+        check_resp = await client.get(
+            f"{url}/rest/v1/user_telegram_links?telegram_id=eq.{telegram_id}&select=user_id",
+            headers=headers, timeout=10
+        )
+        if check_resp.status_code == 200:
+            existing = check_resp.json()
+            if existing:
+                user_id = existing[0]['user_id']
+                user_update = {
+                    "subscription_status": "active",
+                    "subscription_end": expiry_iso,
+                    "subscription_source": "telegram"
+                }
+                patch_resp = await client.patch(f"{url}/rest/v1/users?id=eq.{user_id}", headers=headers, json=user_update, timeout=10)
+                if patch_resp.status_code in [200, 204]:
+                    if debug: print(f"✅ Synced Stripe premium for Telegram {telegram_id} to App User {user_id}")
+                    return True
+                if debug: print(f"❌ Failed to update app user {user_id}: {patch_resp.text}")
+        return False
+    except Exception as e:
+        if debug: print(f"❌ Stripe Sync Error: {e}")
+        return False
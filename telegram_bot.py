@@ -1,6 +1,7 @@
 import os
 import time
 import json
+import copy
 import logging
 import threading
 import traceback
@@ -18,6 +19,9 @@ from telegram.error import BadRequest
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes, ConversationHandler
 from bs4 import BeautifulSoup
 import supabase_utils
+import supabase_utils_async
+import kv_state
+import text_normalize
 from dotenv import load_dotenv
 from io import BytesIO
 from PIL import Image
@@ -607,6 +611,20 @@ class SubscriptionManager:
         # Persistence & Sync
         self.last_sync_time = 0
         self.sync_interval = 60 # Sync every 60s
+        # Per-entry versioned state (kv_state.py): writes carry only the entries that changed and
+        # merge with concurrent writers (the API updates bot users too)
+        self.stores = {
+            "users": kv_state.open_store("bot_users", legacy_path=self.remote_users_path),
+            "codes": kv_state.open_store("active_codes", legacy_path=self.remote_codes_path),
+            "potential_users": kv_state.open_store("potential_users", legacy_path=self.remote_potential_path)
+        }
+        self.local_paths = {
+            "users": self.local_users_path,
+            "codes": self.local_codes_path,
+            "potential_users": self.local_potential_path
+        }
+        self._synced = {name: {} for name in self.stores}  # State last handed to / read from each store
+        self._views = {}  # Store view last loaded - unchanged stores are skipped on reload
         
         # Stripe Config
         self.stripe_price_id_monthly = os.getenv("STRIPE_PRICE_ID_MONTHLY")
@@ -627,55 +645,29 @@ class SubscriptionManager:
         self.last_sync_time = now
 
     def _load_state(self):
-        """Load state from Supabase with local fallback"""
-        users_loaded = False
-        try:
-            data = supabase_utils.download_file(self.local_users_path, self.remote_users_path, SUPABASE_BUCKET)
-            if data: 
-                self.users = json.loads(data)
-                users_loaded = True
-                logger.info(f"✅ Loaded {len(self.users)} users from Supabase")
-        except Exception as e:
-            logger.warning(f"⚠️ Failed to download users from Supabase: {e}")
-
-        if not users_loaded and os.path.exists(self.local_users_path):
+        """Load state from the KV store with local fallback"""
+        for name, store in self.stores.items():
             try:
-                with open(self.local_users_path, 'r') as f:
-                    self.users = json.load(f)
-                logger.info(f"📂 Loaded {len(self.users)} users from local fallback")
+                store.refresh()
+                view = store.snapshot(copy_values=False)
+                if self._views.get(name) is not view:
+                    setattr(self, name, store.snapshot())
+                    self._synced[name] = store.snapshot()
+                    self._views[name] = view
+                    logger.info(f"✅ Loaded {len(view)} {name} from Supabase")
+                continue
             except Exception as e:
-                logger.error(f"❌ Failed to load local users fallback: {e}")
-
-        # Load Codes
-        codes_loaded = False
-        try:
-            data = supabase_utils.download_file(self.local_codes_path, self.remote_codes_path, SUPABASE_BUCKET)
-            if data:
-                self.codes = json.loads(data)
-                codes_loaded = True
-        except Exception as e:
-            logger.warning(f"⚠️ Failed to download codes from Supabase: {e}")
+                logger.warning(f"⚠️ Failed to load {name} from Supabase: {e}")
 
-        if not codes_loaded and os.path.exists(self.local_codes_path):
-            try:
-                with open(self.local_codes_path, 'r') as f:
-                    self.codes = json.load(f)
-            except: pass
-
-        # Load Potential Users
-        potential_loaded = False
-        try:
-            data = supabase_utils.download_file(self.local_potential_path, self.remote_potential_path, SUPABASE_BUCKET)
-            if data:
-                self.potential_users = json.loads(data)
-                potential_loaded = True
-        except: pass
-
-        if not potential_loaded and os.path.exists(self.local_potential_path):
-            try:
-                with open(self.local_potential_path, 'r') as f:
-                    self.potential_users = json.load(f)
-            except: pass
+            local_path = self.local_paths[name]
+            if name not in self._views and os.path.exists(local_path):
+                try:
+                    with open(local_path, 'r') as f:
+                        setattr(self, name, json.load(f))
+                    self._synced[name] = copy.deepcopy(getattr(self, name))
+                    logger.info(f"📂 Loaded {len(getattr(self, name))} {name} from local fallback")
+                except Exception as e:
+                    logger.error(f"❌ Failed to load local {name} fallback: {e}")
 
     def get_user_categories(self, user_id: str) -> List[str]:
         """Get enabled categories for a user (default to all if not set)"""
@@ -757,13 +749,13 @@ class SubscriptionManager:
             return new_state
 
     def _sync_state(self):
+        """Queue the entries that changed since the last sync; the stores flush them in the background"""
         try:
-            with open(self.local_users_path, 'w') as f: json.dump(self.users, f)
-            supabase_utils.upload_file(self.local_users_path, SUPABASE_BUCKET, self.remote_users_path, debug=False)
-            with open(self.local_codes_path, 'w') as f: json.dump(self.codes, f)
-            supabase_utils.upload_file(self.local_codes_path, SUPABASE_BUCKET, self.remote_codes_path, debug=False)
-            with open(self.local_potential_path, 'w') as f: json.dump(self.potential_users, f)
-            supabase_utils.upload_file(self.local_potential_path, SUPABASE_BUCKET, self.remote_potential_path, debug=False)
+            for name, store in self.stores.items():
+                current = getattr(self, name)
+                if store.write_diff(self._synced[name], current):
+                    self._synced[name] = copy.deepcopy(current)
+                    with open(self.local_paths[name], 'w') as f: json.dump(current, f)
         except Exception as e:
             logger.error(f"Sync error: {e}")
 
@@ -1193,7 +1185,7 @@ class MessagePoller:
             }
             
             # Fetch from bot_cursor table (should only have 1 row with id=1)
-            res = requests.get(
+            res = supabase_utils.get_http_session().get(
                 f"{self.supabase_url}/rest/v1/bot_cursor?id=eq.1",
                 headers=headers,
                 timeout=10
@@ -1231,6 +1223,48 @@ class MessagePoller:
         # Save initial state to database
         self._save_cursor(force=True)
 
+    def _cursor_update(self, force: bool = False):
+        """
+        Build the bot_cursor UPDATE request, or None if the state did not change.
+        Returns (state_snapshot, url, headers, payload).
+        """
+        # Create current state snapshot
+        current_state = {
+            "last_scraped_at": self.last_scraped_at,
+            "sent_count": len(self.sent_ids),
+            "sig_count": len(self.recent_signatures)
+        }
+        
+        # Skip save if nothing changed (unless forced)
+        if not force and current_state == self._last_saved_state:
+            logger.debug("⏭️ Skipping cursor save - no changes")
+            return None
+        
+        headers = {
+            "apikey": self.supabase_key, 
+            "Authorization": f"Bearer {self.supabase_key}",
+            "Content-Type": "application/json",
+            "Prefer": "return=minimal"  # Don't return the updated row
+        }
+        
+        # Prepare payload - keep arrays limited to prevent bloat
+        payload = {
+            "last_scraped_at": self.last_scraped_at,
+            "sent_ids": list(self.sent_ids)[-5000:],  # Keep last 5000 IDs
+            "recent_signatures": self.recent_signatures[-20:],  # Keep last 20
+            "time_based_signatures": self.time_based_signatures,
+            # updated_at is auto-updated by trigger
+        }
+        return current_state, f"{self.supabase_url}/rest/v1/bot_cursor?id=eq.1", headers, payload
+
+    def _cursor_saved(self, res, current_state):
+        if res.status_code in [200, 204]:
+            self._last_saved_state = current_state
+            self._save_counter += 1
+            logger.info(f"💾 Cursor saved to DB (save #{self._save_counter})")
+        else:
+            logger.error(f"❌ Failed to save cursor: {res.status_code} - {res.text[:200]}")
+
     def _save_cursor(self, force: bool = False):
         """
         Save cursor to database (single UPDATE operation)
@@ -1239,53 +1273,31 @@ class MessagePoller:
         This reduces unnecessary writes significantly
         """
         try:
-            # Create current state snapshot
-            current_state = {
-                "last_scraped_at": self.last_scraped_at,
-                "sent_count": len(self.sent_ids),
-                "sig_count": len(self.recent_signatures)
-            }
-            
-            # Skip save if nothing changed (unless forced)
-            if not force and current_state == self._last_saved_state:
-                logger.debug("⏭️ Skipping cursor save - no changes")
+            update = self._cursor_update(force)
+            if not update:
                 return
-            
-            headers = {
-                "apikey": self.supabase_key, 
-                "Authorization": f"Bearer {self.supabase_key}",
-                "Content-Type": "application/json",
-                "Prefer": "return=minimal"  # Don't return the updated row
-            }
-            
-            # Prepare payload - keep arrays limited to prevent bloat
-            payload = {
-                "last_scraped_at": self.last_scraped_at,
-                "sent_ids": list(self.sent_ids)[-5000:],  # Keep last 5000 IDs
-                "recent_signatures": self.recent_signatures[-20:],  # Keep last 20
-                "time_based_signatures": self.time_based_signatures,
-                # updated_at is auto-updated by trigger
-            }
+            current_state, url, headers, payload = update
             
             # Single UPDATE operation (NOT INSERT - much more efficient!)
-            res = requests.patch(
-                f"{self.supabase_url}/rest/v1/bot_cursor?id=eq.1",
-                headers=headers,
-                json=payload,
-                timeout=10
-            )
-            
-            if res.status_code in [200, 204]:
-                self._last_saved_state = current_state
-                self._save_counter += 1
-                logger.info(f"💾 Cursor saved to DB (save #{self._save_counter})")
-            else:
-                logger.error(f"❌ Failed to save cursor: {res.status_code} - {res.text[:200]}")
+            res = supabase_utils.get_http_session().patch(url, headers=headers, json=payload, timeout=10)
+            self._cursor_saved(res, current_state)
                 
         except Exception as e:
             logger.error(f"❌ Error saving cursor to DB: {e}")
             # Don't crash - cursor will be saved next time
 
+    async def _save_cursor_async(self, force: bool = False):
+        """_save_cursor without blocking the event loop"""
+        try:
+            update = self._cursor_update(force)
+            if not update:
+                return
+            current_state, url, headers, payload = update
+            res = await supabase_utils_async.get_async_client().patch(url, headers=headers, json=payload, timeout=10)
+            self._cursor_saved(res, current_state)
+        except Exception as e:
+            logger.error(f"❌ Error saving cursor to DB: {e}")
+
     def _get_content_signature(self, msg: Dict) -> str:
         """Generate a signature for content-based deduplication (Retailer + Title + Price)"""
         try:
@@ -1341,6 +1353,81 @@ class MessagePoller:
             logger.error(f"Error generating signature: {e}")
             return str(msg.get("id"))
 
+    def _poll_request(self):
+        """URL, headers and params for the next discord_messages poll"""
+        if not self.last_scraped_at: 
+            self.last_scraped_at = (datetime.utcnow() - timedelta(minutes=45)).isoformat()
+        
+        headers = {
+            "apikey": self.supabase_key, 
+            "Authorization": f"Bearer {self.supabase_key}"
+        }
+        
+        url = f"{self.supabase_url}/rest/v1/discord_messages"
+        params = {
+            "scraped_at": f"gt.{self.last_scraped_at}", 
+            "order": "scraped_at.asc",
+            "limit": 100  # Fetch in batches
+        }
+        return url, headers, params
+
+    def _accept_messages(self, messages: List[Dict]) -> List[Dict]:
+        """Run the 3-layer dedup over a polled batch and advance the cursor timestamp"""
+        now_iso = datetime.utcnow().isoformat()
+        now_dt = datetime.utcnow()
+        
+        # Prune time-based signatures older than 10 minutes
+        pruned_sigs = {}
+        for sig_hash, ts in self.time_based_signatures.items():
+            try:
+                sig_time = parse_iso_datetime(ts)
+                if (now_dt - sig_time) < timedelta(minutes=10):
+                    pruned_sigs[sig_hash] = ts
+            except:
+                pass
+        self.time_based_signatures = pruned_sigs
+
+        new_messages = []
+        latest_scraped_at = self.last_scraped_at
+        
+        for msg in messages:
+            msg_id = msg.get("id")
+            msg_scraped_at = msg.get("scraped_at")
+            
+            # Track latest timestamp
+            if msg_scraped_at and msg_scraped_at > latest_scraped_at:
+                latest_scraped_at = msg_scraped_at
+            
+            # LAYER 1: Discord ID Check (All-time tracking)
+            if not msg_id or str(msg_id) in self.sent_ids:
+                continue
+            
+            sig = self._get_content_signature(msg)
+            
+            # LAYER 2: Content Signature (Sliding Window - last 20)
+            if sig in self.recent_signatures:
+                logger.info(f"⏭️ LAYER 2 BLOCK: Duplicate content window: {msg_id} (Sig: {sig[:8]})")
+                self.sent_ids.add(str(msg_id))
+                continue
+            
+            # LAYER 3: Time-Based Deduplication (10-minute window)
+            if sig in self.time_based_signatures:
+                logger.info(f"⏭️ LAYER 3 BLOCK: Duplicate content within 10m: {msg_id} (Sig: {sig[:8]})")
+                self.sent_ids.add(str(msg_id))
+                continue
+
+            # MESSAGE ACCEPTED - Add to tracking IMMEDIATELY
+            new_messages.append(msg)
+            self.sent_ids.add(str(msg_id))
+            self.recent_signatures.append(sig)
+            self.recent_signatures = self.recent_signatures[-20:]  # Keep last 20
+            self.time_based_signatures[sig] = now_iso
+        
+        # Update cursor timestamp to latest message
+        if latest_scraped_at > self.last_scraped_at:
+            self.last_scraped_at = latest_scraped_at
+        return new_messages
+
     def poll_new_messages(self):
         """
         Poll for new messages from discord_messages table
@@ -1348,22 +1435,8 @@ class MessagePoller:
         OPTIMIZATION: Only saves cursor if new messages were actually found
         """
         try:
-            if not self.last_scraped_at: 
-                self.last_scraped_at = (datetime.utcnow() - timedelta(minutes=45)).isoformat()
-            
-            headers = {
-                "apikey": self.supabase_key, 
-                "Authorization": f"Bearer {self.supabase_key}"
-            }
-            
-            url = f"{self.supabase_url}/rest/v1/discord_messages"
-            params = {
-                "scraped_at": f"gt.{self.last_scraped_at}", 
-                "order": "scraped_at.asc",
-                "limit": 100  # Fetch in batches
-            }
-            
-            res = requests.get(url, headers=headers, params=params, timeout=45)
+            url, headers, params = self._poll_request()
+            res = supabase_utils.get_http_session().get(url, headers=headers, params=params, timeout=45)
             
             if res.status_code != 200:
                 logger.error(f"Poll failed: {res.status_code}")
@@ -1375,67 +1448,41 @@ class MessagePoller:
                 # No new messages - don't save cursor unnecessarily
                 return []
             
-            now_iso = datetime.utcnow().isoformat()
-            now_dt = datetime.utcnow()
+            new_messages = self._accept_messages(messages)
             
-            # Prune time-based signatures older than 10 minutes
-            pruned_sigs = {}
-            for sig_hash, ts in self.time_based_signatures.items():
-                try:
-                    sig_time = parse_iso_datetime(ts)
-                    if (now_dt - sig_time) < timedelta(minutes=10):
-                        pruned_sigs[sig_hash] = ts
-                except:
-                    pass
-            self.time_based_signatures = pruned_sigs
+            # OPTIMIZATION: Only save cursor if we actually found new messages
+            if new_messages:
+                self._save_cursor()
+                logger.info(f"📨 Found {len(new_messages)} new messages, cursor saved")
+            else:
+                logger.debug(f"No new unique messages (checked {len(messages)} total)")
+                
+            return new_messages
+            
+        except Exception as e:
+            logger.error(f"❌ Poll error: {e}")
+            return []
 
-            new_messages = []
-            latest_scraped_at = self.last_scraped_at
+    async def poll_new_messages_async(self):
+        """poll_new_messages for the broadcast job - awaits the GET and cursor save instead of blocking the loop"""
+        try:
+            url, headers, params = self._poll_request()
+            res = await supabase_utils_async.get_async_client().get(url, headers=headers, params=params, timeout=45)
             
-            for msg in messages:
-                msg_id = msg.get("id")
-                msg_scraped_at = msg.get("scraped_at")
-                
-                # Track latest timestamp
-                if msg_scraped_at and msg_scraped_at > latest_scraped_at:
-                    latest_scraped_at = msg_scraped_at
-                
-                # LAYER 1: Discord ID Check (All-time tracking)
-                if not msg_id or str(msg_id) in self.sent_ids:
-                    continue
-                
-                sig = self._get_content_signature(msg)
-                
-                # LAYER 2: Content Signature (Sliding Window - last 20)
-                if sig in self.recent_signatures:
-                    logger.info(f"⏭️ LAYER 2 BLOCK: Duplicate content window: {msg_id} (Sig: {sig[:8]})")
-                    self.sent_ids.add(str(msg_id))
-                    continue
-                
-                # LAYER 3: Time-Based Deduplication (10-minute window)
-                if sig in self.time_based_signatures:
-                    logger.info(f"⏭️ LAYER 3 BLOCK: Duplicate content within 10m: {msg_id} (Sig: {sig[:8]})")
-                    self.sent_ids.add(str(msg_id))
-                    continue
-
-                # MESSAGE ACCEPTED - Add to tracking IMMEDIATELY
-                new_messages.append(msg)
-                self.sent_ids.add(str(msg_id))
-                self.recent_signatures.append(sig)
-                self.recent_signatures = self.recent_signatures[-20:]  # Keep last 20
-                self.time_based_signatures[sig] = now_iso
+            if res.status_code != 200:
+                logger.error(f"Poll failed: {res.status_code}")
+                return []
             
-            # Update cursor timestamp to latest message
-            if latest_scraped_at > self.last_scraped_at:
-                self.last_scraped_at = latest_scraped_at
+            messages = res.json()
+            if not messages:
+                return []
             
-            # OPTIMIZATION: Only save cursor if we actually found new messages
+            new_messages = self._accept_messages(messages)
             if new_messages:
-                self._save_cursor()
+                await self._save_cursor_async()
                 logger.info(f"📨 Found {len(new_messages)} new messages, cursor saved")
             else:
                 logger.debug(f"No new unique messages (checked {len(messages)} total)")
-                
             return new_messages
             
         except Exception as e:
@@ -1463,6 +1510,13 @@ class ChannelManager:
         self.local_path = "data/channels.json"
         self.remote_path = "discord_josh/channels.json"
         self.last_sync = 0
+        # One versioned entry per channel id (kv_state.py); list order is kept as a position field
+        self.store = kv_state.open_store("channels", legacy_path=self.remote_path, legacy_transform=kv_state.list_to_kv)
+        self._synced = {}
+        self._view = None
+        self._categories_sync = supabase_utils_async.CoalescedSync(
+            self._sync_categories_async, self._sync_categories, name="category sync"
+        )
         os.makedirs("data", exist_ok=True)
         self.reload(force=True)
 
@@ -1483,11 +1537,14 @@ class ChannelManager:
             return
             
         try:
-            data = supabase_utils.download_file(self.local_path, self.remote_path, SUPABASE_BUCKET)
-            if data:
-                self.channels = json.loads(data)
-                self.last_sync = now
+            self.store.refresh()
+            view = self.store.snapshot(copy_values=False)
+            if view is not self._view:
+                self.channels = kv_state.kv_to_list(self.store.snapshot())
+                self._synced = copy.deepcopy(kv_state.list_to_kv(self.channels))
+                self._view = view
                 logger.info(f"✅ Reloaded {len(self.channels)} channels from Supabase")
+            self.last_sync = now
         except: pass
         
         if not self.channels and os.path.exists(self.local_path):
@@ -1500,14 +1557,20 @@ class ChannelManager:
     def _sync_state(self):
         try:
             with open(self.local_path, 'w') as f: json.dump(self.channels, f, indent=2)
-            supabase_utils.upload_file(self.local_path, SUPABASE_BUCKET, self.remote_path, debug=False)
-            
-            # Sync to SQL Categories table for the Mobile App
-            supabase_utils.sync_categories_to_sql(self.channels)
-            
+            current = kv_state.list_to_kv(self.channels)
+            self.store.write_diff(self._synced, current)
+            self._synced = copy.deepcopy(current)
+            self._categories_sync.trigger()
         except Exception as e:
             logger.error(f"Channel sync error: {e}")
 
+    def _sync_categories(self):
+        # Sync to SQL Categories table for the Mobile App
+        supabase_utils.sync_categories_to_sql(self.channels)
+
+    async def _sync_categories_async(self):
+        await supabase_utils_async.sync_categories_to_sql(self.channels)
+
     def add_channel(self, url: str, category: str, name: str) -> bool:
         """Add a new channel"""
         with self.lock:
@@ -1582,48 +1645,8 @@ async def notify_admins(context: ContextTypes.DEFAULT_TYPE, text: str):
 
 # --- PROFESSIONAL MESSAGE FORMATTING ---
 
-# Phrases to remove from messages
-PHRASES_TO_REMOVE = [
-    "CCN 2.0 | Profitable Pinger",
-    " Monitors v2.0.0 | CCN x Zephyr Monitors #ad",
-    " Monitors v2.0.0 | CCN x Zephyr Monitors",
-    "CCN 2.0 | Profitable Pinger",
-    "@Unfiltered",
-    "CCN",
-    "@Product Flips",
-    "Experimental software. AI can be inaccurate, DYOR!",
-    "www.crepchiefnotify.com",
-    "CrepChiefNotify"
-]
-
-# Regex patterns to remove (for dynamic content like timestamps)
-REGEX_PATTERNS_TO_REMOVE = [
-    r'Monitors\s+v[\d.]+\s*\|\s*CCN\s+x\s+Zephyr\s+Monitors\s*\[\d{2}:\d{2}:\d{2}\]',
-    r'\s*\|\s*CCN\s+x\s+Zephyr\s+Monitors\s+\[[^\]]+\].*',
-    r'Today\s+at\s+\d{1,2}:\d{2}\s*(?:AM|PM)',
-    r'Experimental\s+software\.\s+AI\s+can\s+be\s+inaccurate,\s+DYOR!',
-]
-
-def clean_text(text: str) -> str:
-    """Remove unwanted phrases from text and clean up markdown links"""
-    if not text:
-        return text
-    
-    # NEW: Strip markdown links [Text](URL) -> Text
-    # We do this FIRST so PHRASES_TO_REMOVE can target the cleaned text
-    text = re.sub(r'\[([^\]]+)\]\((https?://[^\)]+)\)', r'\1', text)
-    
-    # Remove literal phrases
-    for phrase in PHRASES_TO_REMOVE:
-        text = re.sub(re.escape(phrase), "", text, flags=re.IGNORECASE)
-    
-    # Remove patterns with regex
-    for pattern in REGEX_PATTERNS_TO_REMOVE:
-        text = re.sub(pattern, "", text, flags=re.IGNORECASE)
-    
-    # Clean up extra whitespace
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
+# Monitor branding (PHRASES_TO_REMOVE / REGEX_PATTERNS_TO_REMOVE) lives in text_normalize
+clean_text = text_normalize.clean_alert_text
 
 def format_price_value(value: str) -> str:
     """
@@ -2099,7 +2122,15 @@ def format_telegram_message(msg_data: Dict) -> Tuple[str, Optional[str], Optiona
             discord_candidate = optimize_image_url(embed["thumbnail"])
             
     # 2. Empirical Check: Download and Verify Pixels
-    if discord_candidate:
+    # The archiver may already have measured the image it rendered (raw_data.media).
+    # Those dimensions are a lower bound for the optimized URL, so a pass needs no download -
+    # but only if they were measured on the same image the candidate points at.
+    media = raw.get("media") or {}
+    media_matches = bool(media.get("source_url")) and optimize_image_url(media["source_url"]) == discord_candidate
+    if discord_candidate and media_matches and (media.get("width", 0) >= 200 or media.get("height", 0) >= 200):
+        image_url = discord_candidate
+        logger.info(f"   📸 ✅ Archiver-verified image ({media['width']}x{media['height']}). Skipping download.")
+    elif discord_candidate:
         logger.info(f"   🔍 Verifying Discord candidate image: {discord_candidate[:60]}...")
         # Note: download_image_high_quality uses Pillow internally to verify
         downloaded = download_image_high_quality(discord_candidate)
@@ -2356,7 +2387,7 @@ async def test_alerts(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "limit": count
         }
         
-        res = requests.get(url, headers=headers, params=params, timeout=10)
+        res = supabase_utils.get_http_session().get(url, headers=headers, params=params, timeout=10)
         if res.status_code != 200:
             await update.message.reply_text(f"❌ API Error: {res.status_code}")
             return
@@ -2746,7 +2777,7 @@ async def handle_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
     token = str(uuid.uuid4())
     
     # Store in Supabase (10 min expiry)
-    success = await asyncio.to_thread(supabase_utils.store_telegram_link_token, token, user_id)
+    success = await supabase_utils_async.store_telegram_link_token(token, user_id)
     
     if success:
         # Use a redirect URL (Since Telegram buttons don't support hollowscan://)
@@ -2773,7 +2804,7 @@ async def handle_unlink(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.effective_user.id)
     
     # 1. Delete link from Supabase SQL (App side)
-    success = await asyncio.to_thread(supabase_utils.delete_user_telegram_link, user_id)
+    success = await supabase_utils_async.delete_user_telegram_link(user_id)
     
     if success:
         # 2. Revoke Premium from Telegram Bot locally
@@ -2814,8 +2845,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 }
 
             # Call robust linking util
-            result = await asyncio.to_thread(
-                supabase_utils.link_app_user_to_telegram, 
+            result = await supabase_utils_async.link_app_user_to_telegram(
                 app_user_id, 
                 user_id, 
                 f"@{username}" if username else None,
@@ -3397,7 +3427,7 @@ async def _broadcast_job_inner(context: ContextTypes.DEFAULT_TYPE):
     
     # Poll for new messages
     try:
-        new_msgs = poller.poll_new_messages()
+        new_msgs = await poller.poll_new_messages_async()
     except Exception as e:
         err_msg = f"❌ <b>Polling Failed</b>: {type(e).__name__}: {e}"
         logger.error(f"❌ Failed to poll messages: {e}")
@@ -0,0 +1,160 @@
+"""
+text_normalize.py - Shared text normalization for the archiver, the bot and the API
+
+Every scraped message goes through several of these per field, so they are built to do
+as few passes over the string as possible while returning exactly what the original
+per-service helpers returned (bench_text_normalize.py diffs both on a corpus):
+1. Control characters are dropped with one character-class sub; \r \n \t are left to
+   str.split(), which already treats them as separators
+2. All patterns are compiled once at import
+3. The alert phrases are removed with one combined alternation instead of one re.sub
+   per phrase; the rarely matching regex patterns are only run when a combined
+   search finds one of them
+4. Cheap substring guards ('](' / '<' / '@') skip regexes that cannot match
+
+Functions:
+- sanitize_text: HTTP-safe text for Supabase rows (supabase_utils)
+- ascii_text: whitespace-collapsed ASCII text for the archiver (app.py)
+- clean_alert_text: Telegram alert text without monitor branding (telegram_bot)
+- signature_text / display_text: dedup signature and product title text (main_api)
+"""
+
+import re
+
+# --- Control characters ---
+# C0 controls and DEL except \t \n \r, which the whitespace collapse turns into spaces.
+# (str.translate was measured slower than this on non-ASCII text.)
+_CONTROL_RE = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]+')
+
+# --- Alert branding (telegram_bot) ---
+# Phrases to remove from messages
+PHRASES_TO_REMOVE = [
+    "CCN 2.0 | Profitable Pinger",
+    " Monitors v2.0.0 | CCN x Zephyr Monitors #ad",
+    " Monitors v2.0.0 | CCN x Zephyr Monitors",
+    "CCN 2.0 | Profitable Pinger",
+    "@Unfiltered",
+    "CCN",
+    "@Product Flips",
+    "Experimental software. AI can be inaccurate, DYOR!",
+    "www.crepchiefnotify.com",
+    "CrepChiefNotify"
+]
+
+# Regex patterns to remove (for dynamic content like timestamps)
+REGEX_PATTERNS_TO_REMOVE = [
+    r'Monitors\s+v[\d.]+\s*\|\s*CCN\s+x\s+Zephyr\s+Monitors\s*\[\d{2}:\d{2}:\d{2}\]',
+    r'\s*\|\s*CCN\s+x\s+Zephyr\s+Monitors\s+\[[^\]]+\].*',
+    r'Today\s+at\s+\d{1,2}:\d{2}\s*(?:AM|PM)',
+    r'Experimental\s+software\.\s+AI\s+can\s+be\s+inaccurate,\s+DYOR!',
+]
+
+_MARKDOWN_LINK_RE = re.compile(r'\[([^\]]+)\]\((https?://[^\)]+)\)')
+_MENTION_RE = re.compile(r'<@&?\d+>|<#\d+>')
+_HANDLE_RE = re.compile(r'@[A-Za-z0-9_]+\b')
+_LEADING_HANDLE_RE = re.compile(r'^[ \t]*@[A-Za-z0-9_ ]+([|:-]|$)')
+
+
+def _phrases_combinable(phrases) -> bool:
+    """
+    True when one leftmost-first alternation removes exactly what the sequential per-phrase
+    re.sub loop removes: wherever two phrases can overlap, the one listed first must also
+    be the one that starts first.
+    """
+    folded = [p.lower() for p in phrases]
+    for i, first in enumerate(folded):
+        for later in folded[i + 1:]:
+            if later == first:
+                continue
+            if first in later:
+                return False
+            if any(first.startswith(later[k:]) for k in range(1, len(later))):
+                return False
+    return True
+
+
+_PHRASE_RES = [re.compile(re.escape(p), re.IGNORECASE) for p in PHRASES_TO_REMOVE]
+_PHRASES_RE = re.compile("|".join(re.escape(p) for p in PHRASES_TO_REMOVE), re.IGNORECASE)
+_PHRASES_COMBINABLE = _phrases_combinable(PHRASES_TO_REMOVE)
+_PATTERN_RES = [re.compile(p, re.IGNORECASE) for p in REGEX_PATTERNS_TO_REMOVE]
+_PATTERNS_RE = re.compile("|".join(f"(?:{p})" for p in REGEX_PATTERNS_TO_REMOVE), re.IGNORECASE)
+
+
+def strip_markdown_links(text: str) -> str:
+    """[Text](https://...) -> Text"""
+    if '](' not in text:
+        return text
+    return _MARKDOWN_LINK_RE.sub(r'\1', text)
+
+
+def _remove_phrases(text: str) -> str:
+    if _PHRASES_COMBINABLE:
+        stripped, removed = _PHRASES_RE.subn("", text)
+        # A removal can join two fragments into a new phrase; the sequential loop
+        # decides which of those survive, so hand such text to it
+        if not removed or not _PHRASES_RE.search(stripped):
+            return stripped
+    for phrase_re in _PHRASE_RES:
+        text = phrase_re.sub("", text)
+    return text
+
+
+def _remove_patterns(text: str) -> str:
+    if not _PATTERNS_RE.search(text):
+        return text
+    for pattern_re in _PATTERN_RES:
+        text = pattern_re.sub("", text)
+    return text
+
+
+# --- Public helpers ---
+def sanitize_text(text: str, max_length: int = 2000) -> str:
+    """
+    Ultra-aggressive text cleaning for HTTP safety
+    """
+    if not text:
+        return ""
+    text = ' '.join(_CONTROL_RE.sub('', str(text)).split())
+    if len(text) > max_length:
+        text = text[:max_length]
+    return text.strip()
+
+
+def ascii_text(text) -> str:
+    """Whitespace-collapsed text with null bytes and non-ASCII characters dropped"""
+    if not text: return ""
+    text = ' '.join(str(text).replace('\x00', '').split())
+    if text.isascii():
+        return text
+    return text.encode('ascii', 'ignore').decode('ascii')
+
+
+def clean_alert_text(text: str) -> str:
+    """Remove unwanted phrases from text and clean up markdown links"""
+    if not text:
+        return text
+    # Links go first so the phrases can target the link text
+    text = strip_markdown_links(text)
+    text = _remove_patterns(_remove_phrases(text))
+    return ' '.join(text.split())
+
+
+def signature_text(text: str) -> str:
+    """Lowercased text without mentions, @handles and |[] for content signatures"""
+    if not text: return ""
+    if '<' in text:
+        text = _MENTION_RE.sub('', text)
+    if '@' in text:
+        text = _HANDLE_RE.sub('', text)
+    return " ".join(text.replace('|', '').replace('[', '').replace(']', '').lower().split())
+
+
+def display_text(text: str) -> str:
+    """Title text without mentions and leading '@Role |' style prefixes"""
+    if not text: return ""
+    if '<' in text:
+        text = _MENTION_RE.sub('', text)
+    if '@' in text:
+        text = _LEADING_HANDLE_RE.sub('', text)
+        text = _HANDLE_RE.sub('', text)
+    return text.strip().strip('|').strip(':').strip('-').strip()